@@ -0,0 +1,196 @@
+'''Benchmarks of the trace generation and of the PlotlyHelper bookkeeping
+
+Run them with:
+
+    python benchmarks/run_benchmarks.py [--sizes 1000 10000 100000] [--output report.json]
+                                        [--compare previous_report.json]
+
+or with ``tox -e benchmarks``. Each case records its best wall time over --repeat runs, its
+peak traced memory (tracemalloc, measured on a separate run) and the size of the json it
+produces. The report is printed as a table and optionally saved as json so that it can be
+compared with the report of another commit.
+'''
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import morphio
+import plotly.graph_objs as go
+from neurom import load_morphology
+from plotly.utils import PlotlyJSONEncoder
+
+# allow running the script from a source checkout without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from plotly_helper.helper import PlotlyHelper  # noqa: E402
+from plotly_helper.neuron_viewer import (_make_image, _make_trace, _make_trace2d,  # noqa: E402
+                                         _make_tubes)
+from plotly_helper.raster import encode_png  # noqa: E402
+from plotly_helper.region import Sphere  # noqa: E402
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_GROUPS = (100, 1000, 10000)
+# the per section 2D mode creates one plotly object per section, it is only run up to this size
+MAX_PER_SECTION_2D = 10000
+
+
+def synthetic_morphology(nb_sections, points_per_section=10, nb_neurites=4, seed=0):
+    '''Create a random morphology made of binary trees with about nb_sections sections'''
+    morphio.set_maximum_warnings(0)
+    rng = np.random.default_rng(seed)
+    morph = morphio.mut.Morphology()
+    morph.soma.points = [[0., 0., 0.]]
+    morph.soma.diameters = [10.]
+
+    def _point_level(start):
+        steps = rng.normal(size=(points_per_section - 1, 3))
+        points = np.vstack([start, start + steps.cumsum(axis=0)])
+        return morphio.PointLevel(points.tolist(), [1.] * points_per_section)
+
+    types = [morphio.SectionType.axon, morphio.SectionType.basal_dendrite,
+             morphio.SectionType.apical_dendrite]
+    sections_per_neurite = max(1, nb_sections // nb_neurites)
+    for i in range(nb_neurites):
+        direction = rng.normal(size=3)
+        root = morph.append_root_section(_point_level(10 * direction / np.linalg.norm(direction)),
+                                         types[i % len(types)])
+        leaves = [root]
+        count = 1
+        while count + 2 <= sections_per_neurite:
+            parent = leaves.pop(0)
+            for _ in range(2):
+                leaves.append(parent.append_section(_point_level(parent.points[-1])))
+            count += 2
+    return load_morphology(morph)
+
+
+def _json_size(obj):
+    '''The size of the json serialization of a figure or of a list of traces
+
+    Binary outputs, such as png files, are measured as is.
+    '''
+    if isinstance(obj, bytes):
+        return len(obj)
+    return len(json.dumps(obj, cls=PlotlyJSONEncoder))
+
+
+def _measure(func, repeat):
+    '''Return the best wall time, the peak memory and the result size of func'''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'time': best, 'peak_memory': peak, 'json_size': _json_size(result)}
+
+
+def _trace_cases(sizes):
+    '''Yield (name, function) for the trace generation cases'''
+    for size in sizes:
+        neuron = synthetic_morphology(size)
+        yield f'make_trace[{size}]', lambda neuron=neuron: _make_trace(neuron, 'xyz')
+        yield (f'make_trace2d_merged[{size}]',
+               lambda neuron=neuron: _make_trace2d(neuron, 'xy', merge=True))
+        if size <= MAX_PER_SECTION_2D:
+            yield f'make_trace2d[{size}]', lambda neuron=neuron: _make_trace2d(neuron, 'xy')
+        yield f'make_tubes[{size}]', lambda neuron=neuron: _make_tubes(neuron)
+        yield (f'make_png[{size}]',
+               lambda neuron=neuron: encode_png(_make_image(neuron, 'xy')))
+        # a sphere around the soma containing a small part of the arbor
+        yield (f'make_trace_cropped[{size}]',
+               lambda neuron=neuron: _make_trace(neuron, 'xyz', region=Sphere([0, 0, 0], 5)))
+
+
+def _helper_workload(nb_groups, traces_per_group=3):
+    '''Add, query, remove and export many groups with a PlotlyHelper'''
+    trace = go.Scatter(x=[0, 1], y=[0, 1])
+    helper = PlotlyHelper('benchmark')
+    for i in range(nb_groups):
+        helper.add_data({f'group{i}': [trace] * traces_per_group})
+    names = list(helper.visibility_map)
+    for name in names[::max(1, nb_groups // 100)]:
+        helper.add_button(name, 'update', [{'visible': helper.get_visibility_list(name)}])
+    helper.remove_data(names[::2])
+    return helper.get_fig()
+
+
+def _helper_bulk_workload(nb_groups, traces_per_group=3):
+    '''Add many groups of trace dicts at once with PlotlyHelper.add_data_bulk'''
+    trace = {'type': 'scatter', 'x': [0, 1], 'y': [0, 1]}
+    helper = PlotlyHelper('benchmark')
+    helper.add_data_bulk([f'group{i}' for i in range(nb_groups)],
+                         [[trace] * traces_per_group] * nb_groups)
+    return helper.get_fig()
+
+
+def _helper_cases(groups):
+    '''Yield (name, function) for the PlotlyHelper cases'''
+    for nb_groups in groups:
+        yield f'helper[{nb_groups}]', lambda nb_groups=nb_groups: _helper_workload(nb_groups)
+        yield (f'helper_bulk[{nb_groups}]',
+               lambda nb_groups=nb_groups: _helper_bulk_workload(nb_groups))
+
+
+def run(sizes=DEFAULT_SIZES, groups=DEFAULT_GROUPS, repeat=3, out=sys.stdout):
+    '''Run all the cases and return the report'''
+    results = {}
+    for cases in (_trace_cases(sizes), _helper_cases(groups)):
+        for name, func in cases:
+            results[name] = _measure(func, repeat)
+            print(f'{name}: {results[name]["time"]:.3f}s', file=out, flush=True)
+    return {'python': platform.python_version(), 'results': results}
+
+
+def format_report(report, reference=None):
+    '''Return the report as a table, with the ratios to a reference report if given'''
+    header = f'{"case":<28} {"time (s)":>10} {"peak (MB)":>10} {"json (MB)":>10}'
+    if reference:
+        header += f' {"time ratio":>11} {"peak ratio":>11}'
+    lines = [header, '-' * len(header)]
+    for name, result in report['results'].items():
+        line = (f'{name:<28} {result["time"]:>10.3f} {result["peak_memory"] / 1e6:>10.1f} '
+                f'{result["json_size"] / 1e6:>10.2f}')
+        previous = (reference or {}).get('results', {}).get(name)
+        if previous:
+            line += (f' {result["time"] / previous["time"]:>11.2f}'
+                     f' {result["peak_memory"] / max(previous["peak_memory"], 1):>11.2f}')
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    '''The command line entry point'''
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='numbers of sections of the synthetic morphologies')
+    parser.add_argument('--groups', type=int, nargs='+', default=DEFAULT_GROUPS,
+                        help='numbers of groups of the helper workloads')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs per case')
+    parser.add_argument('--output', help='save the report to this json file')
+    parser.add_argument('--compare', help='a previous json report to compare with')
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.groups, args.repeat, out=sys.stderr)
+    reference = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as fd:
+            reference = json.load(fd)
+    print(format_report(report, reference))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fd:
+            json.dump(report, fd, indent=2)
+
+
+if __name__ == '__main__':
+    main()
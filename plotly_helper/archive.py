@@ -0,0 +1,314 @@
+'''A columnar archive of many morphologies read through memory maps
+
+The morphologies are parsed once by write_archive and their arrays are concatenated in a few
+.npy files. MorphologyArchive opens them with np.memmap (through np.load(mmap_mode='r')), so
+reading a morphology costs no parsing and the processes rendering the same archive share its
+pages through the OS cache.
+
+The archived morphologies expose the parts of the NeuroM API used by the viewers (neurites,
+sections with their points, parent and children, soma center and radius), so NeuronBuilder and
+PopulationBuilder render them as they render NeuroM morphologies. A morphology is also addressed
+by the path <archive directory>/<name>, which the batch rendering, the server and NeuronBuilder
+accept as a morphology path.
+
+Layout of an archive directory, with P points, S sections and M morphologies:
+    index.json: the format version and the names of the morphologies
+    points.npy: the (P, 3) float32 coordinates of the section points
+    radii.npy: the (P,) float32 radii of the section points
+    section_offsets.npy: the (S + 1,) offsets of the section points
+    section_parents.npy: the (S,) index of the parent of each section in its morphology or -1
+    neurite_types.npy: the (S,) NeuriteType value of the neurite of each section
+    morphology_offsets.npy: the (M + 1,) offsets of the morphology sections
+    somata.npy: the (M, 4) soma centers and radii
+'''
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+ARCHIVE_VERSION = 1
+INDEX = 'index.json'
+COLUMNS = ('points', 'radii', 'section_offsets', 'section_parents', 'neurite_types',
+           'morphology_offsets', 'somata')
+
+
+def is_archive(path):
+    '''Whether or not path is a morphology archive directory'''
+    return os.path.isfile(os.path.join(path, INDEX))
+
+
+def read_names(directory):
+    '''Return the names of the morphologies of an archive, without opening its arrays
+
+    Raises:
+        ValueError: if the archive was written with another format version
+    '''
+    with open(os.path.join(directory, INDEX), encoding='utf-8') as fd:
+        index = json.load(fd)
+    if index['version'] != ARCHIVE_VERSION:
+        raise ValueError(f'unsupported archive version {index["version"]}, expected '
+                         f'{ARCHIVE_VERSION}')
+    return index['names']
+
+
+def split_member(path):
+    '''Return the (archive directory, name) of an <archive directory>/<name> path or None'''
+    directory, name = os.path.split(os.path.normpath(str(path)))
+    return (directory, name) if name and is_archive(directory) else None
+
+
+@lru_cache(maxsize=16)
+def _cached_archive(directory, mtime):  # pylint: disable=unused-argument
+    '''The MorphologyArchive of an absolute directory, opened once per index modification time'''
+    return MorphologyArchive(directory)
+
+
+def _open_archive(directory):
+    '''Return the MorphologyArchive of a directory, reopened if the archive was written again'''
+    directory = os.path.abspath(directory)
+    return _cached_archive(directory, os.path.getmtime(os.path.join(directory, INDEX)))
+
+
+def load_member(path):
+    '''Return the ArchivedMorphology of an <archive directory>/<name> path
+
+    The archive is opened once per process, so that a worker rendering many of its morphologies
+    maps its arrays once.
+
+    Raises:
+        KeyError: if name is not in the archive
+    '''
+    directory, name = split_member(path)
+    return _open_archive(directory)[name]
+
+
+def member_digest(path):
+    '''Return the sha256 hex digest of the arrays of the morphology of an <archive>/<name> path,
+    which stands for the digest of its file in the cache keys'''
+    directory, name = split_member(path)
+    return _open_archive(directory).digest(name)
+
+
+def _morphology_columns(morphology):
+    '''Return the arrays of the columns of a NeuroM morphology, in the morphio section id order'''
+    morphio_morphology = morphology.to_morphio()
+    if not hasattr(morphio_morphology, 'section_offsets'):
+        morphio_morphology = morphio_morphology.as_immutable()
+    parents = np.array([-1 if section.is_root else section.parent.id
+                        for section in morphio_morphology.sections], dtype=np.int32)
+    neurite_types = np.array(morphio_morphology.section_types, dtype=np.int8)
+    # the parents precede their children in the morphio id order
+    for i, parent in enumerate(parents.tolist()):
+        if parent >= 0:
+            neurite_types[i] = neurite_types[parent]
+    return {
+        'points': np.asarray(morphio_morphology.points, dtype=np.float32),
+        'radii': np.asarray(morphio_morphology.diameters, dtype=np.float32) / 2,
+        'section_offsets': np.asarray(morphio_morphology.section_offsets, dtype=np.int64),
+        'section_parents': parents,
+        'neurite_types': neurite_types,
+        'soma': np.append(morphology.soma.center[:3], morphology.soma.radius),
+    }
+
+
+def write_archive(morphologies, directory):
+    '''Pack morphologies into an archive directory
+
+    Args:
+        morphologies: an iterable of (name, NeuroM morphology) pairs
+        directory (str): the archive directory, created if needed. An existing archive is
+            replaced.
+
+    Returns:
+        the names of the archived morphologies
+
+    Raises:
+        ValueError: if a name is used twice
+    '''
+    names, columns = [], {name: [] for name in COLUMNS}
+    nb_points = nb_sections = 0
+    for name, morphology in morphologies:
+        if name in names:
+            raise ValueError(f'duplicated morphology name {name}')
+        names.append(name)
+        arrays = _morphology_columns(morphology)
+        for column in ('points', 'radii', 'section_parents', 'neurite_types'):
+            columns[column].append(arrays[column])
+        # the offsets are made global, without the closing offset of each morphology
+        columns['section_offsets'].append(arrays['section_offsets'][:-1] + nb_points)
+        columns['morphology_offsets'].append([nb_sections])
+        columns['somata'].append(arrays['soma'][np.newaxis])
+        nb_points += len(arrays['points'])
+        nb_sections += len(arrays['section_parents'])
+    columns['section_offsets'].append([nb_points])
+    columns['morphology_offsets'].append([nb_sections])
+
+    empty = {'points': np.zeros((0, 3), dtype=np.float32), 'somata': np.zeros((0, 4)),
+             'radii': np.zeros(0, dtype=np.float32), 'section_parents': np.zeros(0, np.int32),
+             'neurite_types': np.zeros(0, dtype=np.int8)}
+    os.makedirs(directory, exist_ok=True)
+    for column, chunks in columns.items():
+        array = np.concatenate(chunks) if chunks else empty[column]
+        if column.endswith('offsets'):
+            array = np.asarray(array, dtype=np.int64)
+        np.save(os.path.join(directory, column + '.npy'), array)
+    # the index is written last so that an interrupted conversion is not an archive
+    with open(os.path.join(directory, INDEX), 'w', encoding='utf-8') as fd:
+        json.dump({'version': ARCHIVE_VERSION, 'names': names}, fd)
+    return names
+
+
+class ArchivedSoma:  # pylint: disable=too-few-public-methods
+    '''The soma of an archived morphology'''
+    def __init__(self, center, radius):
+        self.center = center
+        self.radius = radius
+
+
+class ArchivedSection:
+    '''A section of an archived morphology, which quacks like a NeuroM section'''
+    def __init__(self, morphology, section_id):
+        self.morphology = morphology
+        self.id = section_id
+
+    @property
+    def points(self):
+        '''The (N, 4) points and radii of the section, as NeuroM Section.points'''
+        start, stop = self.morphology.section_offsets[self.id:self.id + 2]
+        return np.column_stack([self.morphology.xyz[start:stop],
+                                self.morphology.radii[start:stop]])
+
+    @property
+    def parent(self):
+        '''The parent section or None'''
+        parent = self.morphology.section_parents[self.id]
+        return None if parent < 0 else self.morphology.sections[parent]
+
+    @property
+    def children(self):
+        '''The list of the child sections'''
+        return [self.morphology.sections[child] for child in self.morphology.children[self.id]]
+
+    @property
+    def type(self):
+        '''The NeuriteType of the neurite of the section'''
+        # imported here so that listing an archive does not import neurom
+        from neurom import NeuriteType  # pylint: disable=import-outside-toplevel
+        return NeuriteType(int(self.morphology.neurite_types[self.id]))
+
+    def is_root(self):
+        '''Whether or not the section is the root of a neurite'''
+        return self.morphology.section_parents[self.id] < 0
+
+    def __eq__(self, other):
+        return (isinstance(other, ArchivedSection) and other.morphology is self.morphology and
+                other.id == self.id)
+
+    def __hash__(self):
+        return self.id
+
+    def __repr__(self):
+        return f'ArchivedSection(id={self.id}, morphology={self.morphology.name})'
+
+
+class ArchivedNeurite:  # pylint: disable=too-few-public-methods
+    '''A neurite of an archived morphology, which quacks like a NeuroM neurite'''
+    def __init__(self, root_node):
+        self.root_node = root_node
+        self.type = root_node.type
+
+    @property
+    def neurites(self):
+        '''The neurite itself, so that neurom.iter_sections(neurite) iterates its sections'''
+        return (self,)
+
+
+class ArchivedMorphology:
+    '''A morphology of an archive
+
+    Its arrays are views of the memory maps of the archive: nothing is read before being used.
+    '''
+    def __init__(self, archive, index):
+        self.name = archive.names[index]
+        first, last = archive.morphology_offsets[index:index + 2]
+        offsets = np.asarray(archive.section_offsets[first:last + 1])
+        self.xyz = archive.points[offsets[0]:offsets[-1]]
+        self.radii = archive.radii[offsets[0]:offsets[-1]]
+        self.section_offsets = offsets - offsets[0]
+        self.section_parents = np.asarray(archive.section_parents[first:last])
+        self.neurite_types = np.asarray(archive.neurite_types[first:last])
+        soma = np.asarray(archive.somata[index])
+        self.soma = ArchivedSoma(soma[:3], float(soma[3]))
+
+        self.sections = [ArchivedSection(self, i) for i in range(len(self.section_parents))]
+        self.children = [[] for _ in self.sections]
+        for i, parent in enumerate(self.section_parents.tolist()):
+            if parent >= 0:
+                self.children[parent].append(i)
+        self.neurites = [ArchivedNeurite(section) for section in self.sections
+                         if section.is_root()]
+
+    @property
+    def points(self):
+        '''The (N, 4) points and radii of all the sections, as NeuroM Morphology.points'''
+        return np.column_stack([self.xyz, self.radii])
+
+    def __repr__(self):
+        return f'ArchivedMorphology({self.name})'
+
+
+class MorphologyArchive:
+    '''The reader of an archive written by write_archive
+
+    The morphologies are accessed by name (archive[name]) or iterated in the archive order.
+    '''
+    def __init__(self, directory):
+        '''
+        Args:
+            directory (str): the archive directory
+
+        Raises:
+            ValueError: if the archive was written with another format version
+        '''
+        self.directory = directory
+        self.names = read_names(directory)
+        self._indices = {name: i for i, name in enumerate(self.names)}
+        for column in COLUMNS:
+            setattr(self, column, np.load(os.path.join(directory, column + '.npy'), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._indices
+
+    def __getitem__(self, name):
+        '''Return the ArchivedMorphology of a name
+
+        Raises:
+            KeyError: if name is not in the archive
+        '''
+        return ArchivedMorphology(self, self._indices[name])
+
+    def digest(self, name):
+        '''Return the sha256 hex digest of the arrays of a morphology, read without building it
+
+        Raises:
+            KeyError: if name is not in the archive
+        '''
+        # the columns are set from COLUMNS in __init__
+        # pylint: disable=no-member
+        index = self._indices[name]
+        first, last = self.morphology_offsets[index:index + 2]
+        offsets = np.asarray(self.section_offsets[first:last + 1])
+        digest = hashlib.sha256()
+        for array in (self.points[offsets[0]:offsets[-1]], self.radii[offsets[0]:offsets[-1]],
+                      offsets - offsets[0], self.section_parents[first:last],
+                      self.neurite_types[first:last], self.somata[index]):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+    def __iter__(self):
+        return (ArchivedMorphology(self, i) for i in range(len(self.names)))
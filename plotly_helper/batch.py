@@ -0,0 +1,217 @@
+'''Render many morphologies to files without opening them'''
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import chain
+
+from plotly_helper.archive import INDEX, is_archive, read_names, split_member
+from plotly_helper.helper import write_fig_json
+from plotly_helper.profiling import Profile, profile_stage
+
+MORPHOLOGY_EXTENSIONS = ('.asc', '.h5', '.swc')
+PLANES = ('3d', 'xy', 'yx', 'yz', 'zy', 'xz', 'zx')
+FORMATS = ('html', 'json', 'png')
+# the formats that are rendered from a 2D projection only
+IMAGE_FORMATS = ('png',)
+# the file of an output directory recording the options digest of each output
+OPTIONS_FILE = '.render-options.json'
+# the render options which do not change the outputs
+NEUTRAL_OPTIONS = ('cache',)
+
+
+def iter_inputs(pattern):
+    '''Return the sorted morphology files of a directory or matching a glob pattern
+
+    The morphologies of an archive directory (see archive.write_archive) are returned as
+    <archive directory>/<name> paths, in the archive order.
+    '''
+    if is_archive(pattern):
+        return [os.path.join(pattern, name) for name in read_names(pattern)]
+    if os.path.isdir(pattern):
+        return sorted(os.path.join(pattern, filename) for filename in os.listdir(pattern)
+                      if os.path.splitext(filename)[1].lower() in MORPHOLOGY_EXTENSIONS)
+    return sorted(glob.glob(pattern))
+
+
+def output_path(input_file, output_dir, fmt):
+    '''Return the output file of input_file'''
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(output_dir, f'{stem}.{fmt}')
+
+
+def is_up_to_date(input_file, output_file):
+    '''Whether or not output_file exists and is more recent than input_file
+
+    An archived morphology is as recent as the index of its archive, written last.
+    '''
+    member = split_member(input_file)
+    source = input_file if member is None else os.path.join(member[0], INDEX)
+    return (os.path.exists(output_file) and
+            os.path.getmtime(output_file) >= os.path.getmtime(source))
+
+
+def options_digest(plane, fmt, **kwargs):
+    '''Return the sha256 hex digest of the render options which change the outputs
+
+    The region is described by its key, the options of NEUTRAL_OPTIONS are ignored.
+    '''
+    options = {key: value.key() if key == 'region' and value is not None else value
+               for key, value in kwargs.items() if key not in NEUTRAL_OPTIONS}
+    options.update(plane=plane, fmt=fmt)
+    return hashlib.sha256(json.dumps(options, sort_keys=True, default=repr).encode('utf-8')
+                          ).hexdigest()
+
+
+def _read_options(output_dir):
+    '''Return the {output file name: options digest} records of an output directory'''
+    try:
+        with open(os.path.join(output_dir, OPTIONS_FILE), encoding='utf-8') as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_options(output_dir, records):
+    '''Write the options records of an output directory, replacing them atomically'''
+    with tempfile.NamedTemporaryFile('w', dir=output_dir, suffix='.tmp', delete=False,
+                                     encoding='utf-8') as fd:
+        json.dump(records, fd, sort_keys=True)
+    os.replace(fd.name, os.path.join(output_dir, OPTIONS_FILE))
+
+
+# pylint: disable=too-many-arguments
+def render(input_file, output_file, plane='3d', fmt='html', typed_arrays=None,
+           shared_plotlyjs=None, streaming=False, size=256, **kwargs):
+    '''Render a morphology file to an html or json figure file or to a png thumbnail
+
+    Args:
+        input_file (str): the morphology path or an <archive directory>/<name> path
+        output_file (str): the figure path
+        plane (str): a string representing the 2D plane (example: 'xy') or '3d'
+        fmt (str): 'html', 'json' or 'png'
+        typed_arrays (str): None or the float dtype used to encode the trace arrays as base64
+            typed arrays
+        shared_plotlyjs: None to embed plotly.js in the html file, True to reference a
+            plotly.min.js file written once next to the outputs or the path of a shared plotly.js
+        streaming (bool): write the html file one trace at a time. json files are always
+            streamed.
+        size (int): the width and height of the png thumbnails in pixels
+
+    All other kwargs are passed to NeuronBuilder
+    '''
+    # imported here so that listing the inputs does not import neurom
+    from plotly_helper.neuron_viewer import NeuronBuilder  # pylint: disable=import-outside-toplevel
+    title = os.path.splitext(os.path.basename(input_file))[0]
+    builder = NeuronBuilder(input_file, plane, title, **kwargs)
+    if fmt == 'html':
+        builder.plot(output_file, auto_open=False, typed_arrays=typed_arrays,
+                     shared_plotlyjs=shared_plotlyjs, streaming=streaming)
+    elif fmt == 'png':
+        builder.write_png(output_file, size)
+    else:
+        fig = builder.get_figure()
+        with profile_stage(builder.profile, 'serialization') as counters:
+            with open(output_file, 'w', encoding='utf-8') as fd:
+                write_fig_json(fig, fd, typed_arrays)
+                counters['bytes'] = fd.tell()
+
+
+def _render_job(input_file, output_file, plane, fmt, profile, kwargs):
+    '''Render a file and return its report: (input_file, elapsed time, error or None, stages)
+
+    Exceptions are returned as strings so that failures do not stop the batch. The stages are
+    the profiling.Profile statistics of the rendering if profile is 'time' or 'memory', else
+    None.
+    '''
+    start = time.perf_counter()
+    stats = Profile(trace_memory=profile == 'memory') if profile else None
+    try:
+        render(input_file, output_file, plane, fmt, profile=stats, **kwargs)
+        error = None
+    except Exception as error_:  # pylint: disable=broad-except
+        error = f'{type(error_).__name__}: {error_}'
+    return input_file, time.perf_counter() - start, error, stats and stats.stages
+
+
+def _iter_reports(todo, jobs):
+    '''Render the jobs of render_all and yield their reports in completion order'''
+    if jobs == 1:
+        for args in todo:
+            yield _render_job(*args)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_render_job, *args) for args in todo]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _record_options(reports, output_dir, outputs, records, digest):
+    '''Yield the reports, recording the options digest of the rendered outputs
+
+    The records are written once, when the reports are exhausted or the iteration stops.
+    '''
+    try:
+        for report in reports:
+            input_file, _, error, _ = report
+            if error is None:
+                records[os.path.basename(outputs[input_file])] = digest
+            yield report
+    finally:
+        _write_options(output_dir, records)
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def render_all(input_files, output_dir, plane='3d', fmt='html', jobs=1, force=False, profile=None,
+               **kwargs):
+    '''Render the input files in parallel
+
+    Args:
+        input_files (list): the morphology paths, as returned by iter_inputs
+        output_dir (str): the directory where figures are written
+        plane (str): a string representing the 2D plane (example: 'xy') or '3d'
+        fmt (str): 'html', 'json' or 'png'
+        jobs (int): the number of worker processes (1 renders in the current process)
+        force (bool): render all files even if their outputs are up to date. An output is up
+            to date if it is more recent than its input and was rendered with the same options
+            (see options_digest), which are recorded in the OPTIONS_FILE of output_dir. The
+            outputs written without a record are rendered again.
+        profile (str): None, 'time' to profile the stages of each rendering or 'memory' to
+            also measure their memory peaks (see profiling.Profile)
+
+    All other kwargs are passed to render
+
+    Returns:
+        an iterator of tuples (input_file, elapsed time, error, stages), one per file. The
+        skipped files come first, then the rendered ones in completion order. The elapsed time
+        is None for skipped files and stages is the dict of the profiled stages or None.
+
+    Raises:
+        ValueError: if several input files have the same output file (ex: a.swc and a.h5),
+            before anything is rendered
+    '''
+    output_files = {}
+    for input_file in input_files:
+        output_file = output_path(input_file, output_dir, fmt)
+        if output_file in output_files:
+            raise ValueError(f'{output_files[output_file]} and {input_file} would both be '
+                             f'rendered to {output_file}')
+        output_files[output_file] = input_file
+
+    os.makedirs(output_dir, exist_ok=True)
+    digest = options_digest(plane, fmt, **kwargs)
+    records = _read_options(output_dir)
+    skipped, todo = [], []
+    for output_file, input_file in output_files.items():
+        if (not force and records.get(os.path.basename(output_file)) == digest and
+                is_up_to_date(input_file, output_file)):
+            skipped.append((input_file, None, None, None))
+        else:
+            todo.append((input_file, output_file, plane, fmt, profile, kwargs))
+    outputs = {input_file: output_file for output_file, input_file in output_files.items()}
+    return chain(skipped, _record_options(_iter_reports(todo, jobs), output_dir, outputs,
+                                          records, digest))
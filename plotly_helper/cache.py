@@ -0,0 +1,128 @@
+'''A persistent content-addressed cache of generated figure parts'''
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+CACHE_VERSION = 5
+DEFAULT_MAX_SIZE = 512 * 1024 ** 2
+CACHE_DIR_ENV = 'PLOTLY_HELPER_CACHE_DIR'
+_META = '__meta__'
+
+
+def file_digest(path, chunk_size=1024 ** 2):
+    '''Return the sha256 hex digest of the content of a file'''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _split_arrays(obj, arrays):
+    '''Replace the numpy arrays of a json-like object by references to the arrays list'''
+    if isinstance(obj, dict):
+        return {key: _split_arrays(value, arrays) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_split_arrays(value, arrays) for value in obj]
+    if isinstance(obj, np.ndarray) and obj.dtype == object:
+        return obj.tolist()
+    if isinstance(obj, np.ndarray):
+        arrays.append(obj)
+        return {_META: len(arrays) - 1}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _join_arrays(obj, arrays):
+    '''Inverse of _split_arrays'''
+    if isinstance(obj, dict):
+        if _META in obj:
+            return arrays[f'a{obj[_META]}']
+        return {key: _join_arrays(value, arrays) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_join_arrays(value, arrays) for value in obj]
+    return obj
+
+
+class TraceCache:
+    '''A size bounded, least recently used, on disk cache of json-like objects with numpy arrays
+
+    Each entry is a single uncompressed .npz file holding the arrays in binary form and the rest
+    of the object as json. Reading an entry updates its modification time, which is used to
+    evict the least recently used entries when the cache grows over max_size bytes.
+    '''
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        '''
+        Args:
+            directory (str): the cache directory. Defaults to the PLOTLY_HELPER_CACHE_DIR
+                environment variable or to ~/.cache/plotly_helper
+            max_size (int): the maximum size of the cache in bytes
+        '''
+        self.directory = directory or os.environ.get(
+            CACHE_DIR_ENV, os.path.join(os.path.expanduser('~'), '.cache', 'plotly_helper'))
+        self.max_size = max_size
+
+    @staticmethod
+    def key(*parts):
+        '''Return the cache key of a list of json serializable parts'''
+        return hashlib.sha256(json.dumps([CACHE_VERSION] + list(parts)).encode()).hexdigest()
+
+    def _path(self, key):
+        '''The file of an entry'''
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        '''Return the cached object or None if key is not in the cache'''
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+            meta = json.loads(arrays.pop(_META).tobytes().decode('utf-8'))
+            os.utime(path)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+        return _join_arrays(meta, arrays)
+
+    def put(self, key, obj):
+        '''Store a json-like object whose leaves can be numpy arrays'''
+        arrays = []
+        meta = json.dumps(_split_arrays(obj, arrays)).encode('utf-8')
+        buffer = io.BytesIO()
+        np.savez(buffer, **{f'a{i}': array for i, array in enumerate(arrays)},
+                 **{_META: np.frombuffer(meta, dtype=np.uint8)})
+
+        os.makedirs(self.directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as fd:
+            fd.write(buffer.getbuffer())
+        os.replace(fd.name, self._path(key))
+        self.evict()
+
+    def evict(self):
+        '''Remove the least recently used entries until the cache fits in max_size
+
+        The entries removed meanwhile by another process are skipped.
+        '''
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.npz'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # pragma: no cover
+                pass
+            total -= size
@@ -1,8 +1,49 @@
 '''The morph-tool command line launcher'''
+import os
+import sys
+
 import click
-from neurom import load_morphology
 
-from plotly_helper.neuron_viewer import plot
+from plotly_helper.batch import FORMATS, IMAGE_FORMATS, PLANES, iter_inputs, render_all
+from plotly_helper.cache import CACHE_DIR_ENV, TraceCache
+from plotly_helper.profiling import Profile
+from plotly_helper.region import Box, Sphere
+
+
+def _check_tubes(tubes, plane):
+    '''Tubes are only drawn in 3D'''
+    if tubes and plane != '3d':
+        raise click.UsageError('--tubes can only be used with --plane 3d')
+
+
+def _check_format(fmt, plane):
+    '''Images are 2D projections'''
+    if fmt in IMAGE_FORMATS and plane == '3d':
+        raise click.UsageError(f'--format {fmt} needs a 2D --plane')
+
+
+def _region(box, sphere):
+    '''The cropping region of the --box and --sphere options'''
+    if box and sphere:
+        raise click.UsageError('--box and --sphere can not be used together')
+    try:
+        if box:
+            return Box(box[:3], box[3:])
+        if sphere:
+            return Sphere(sphere[:3], sphere[3])
+    except ValueError as error:
+        raise click.UsageError(str(error)) from error
+    return None
+
+
+def _region_options(command):
+    '''Add the --box and --sphere options to a command'''
+    command = click.option('--sphere', type=float, nargs=4, default=None,
+                           metavar='X Y Z RADIUS',
+                           help='Only draw the parts of the morphology inside this sphere')(command)
+    return click.option('--box', type=float, nargs=6, default=None,
+                        metavar='XMIN YMIN ZMIN XMAX YMAX ZMAX',
+                        help='Only draw the parts of the morphology inside this box')(command)
 
 
 @click.group()
@@ -12,8 +53,171 @@ def cli():
 
 @cli.command()
 @click.argument('input_file')
-@click.option('--plane', type=click.Choice(['3d', 'xy', 'yx', 'yz', 'zy', 'xz', 'zx']),
-              default='3d')
-def view(input_file, plane):
+@click.option('--plane', type=click.Choice(PLANES), default='3d')
+@click.option('--tolerance', type=float, default=None,
+              help='Simplify the sections so that no dropped point is further than tolerance '
+                   'from the drawn lines')
+@click.option('--tubes', is_flag=True,
+              help='Draw the neurites as 3D tubes following the point radii')
+@click.option('--cache-dir', envvar=CACHE_DIR_ENV, default=None,
+              help='Cache the generated traces in this directory')
+@click.option('--profile', 'profile', flag_value='time', default=None,
+              help='Print the time and the counters of each rendering stage')
+@click.option('--profile-memory', 'profile', flag_value='memory',
+              help='Same as --profile with the memory peaks of the stages (slower)')
+@_region_options
+# pylint: disable=too-many-arguments
+def view(input_file, plane, tolerance, tubes, cache_dir, profile, box, sphere):
     '''A simple neuron viewer'''
-    plot(load_morphology(input_file), plane=plane)
+    _check_tubes(tubes, plane)
+    region = _region(box, sphere)
+    # the viewer imports neurom, which is only needed once the arguments are checked
+    from plotly_helper.neuron_viewer import plot  # pylint: disable=import-outside-toplevel
+    cache = TraceCache(cache_dir) if cache_dir else None
+    stats = Profile(trace_memory=profile == 'memory') if profile else None
+    plot(input_file, plane=plane, lod=tolerance, cache=cache, tubes=tubes, profile=stats,
+         region=region)
+    if stats is not None:
+        click.echo(stats.format())
+
+
+@cli.command()
+@click.argument('inputs')
+@click.argument('output_dir')
+@click.option('--plane', type=click.Choice(PLANES), default='3d')
+@click.option('--tolerance', type=float, default=None,
+              help='Simplify the sections so that no dropped point is further than tolerance '
+                   'from the drawn lines')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='html',
+              help='Write html pages, plotly figure json files or png thumbnails')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1,
+              help='Number of worker processes')
+@click.option('--force', is_flag=True, help='Render the files even if their output is up to date')
+@click.option('--typed-arrays', type=click.Choice(['float32', 'float64']), default=None,
+              help='Encode the coordinates as base64 typed arrays of this dtype')
+@click.option('--shared-plotlyjs', is_flag=True,
+              help='Write plotly.js once in OUTPUT_DIR instead of embedding it in each html file')
+@click.option('--streaming', is_flag=True,
+              help='Write the html files one trace at a time to bound the memory peak')
+@click.option('--tubes', is_flag=True,
+              help='Draw the neurites as 3D tubes following the point radii')
+@click.option('--size', type=click.IntRange(min=1), default=256,
+              help='Width and height of the png thumbnails in pixels')
+@click.option('--cache-dir', envvar=CACHE_DIR_ENV, default=None,
+              help='Cache the generated traces in this directory')
+@click.option('--profile', 'profile', flag_value='time', default=None,
+              help='Print the time and the counters of each rendering stage')
+@click.option('--profile-memory', 'profile', flag_value='memory',
+              help='Same as --profile with the memory peaks of the stages (slower)')
+@_region_options
+# pylint: disable=too-many-arguments,too-many-locals
+def render(inputs, output_dir, plane, tolerance, fmt, jobs, force, typed_arrays, shared_plotlyjs,
+           streaming, tubes, size, cache_dir, profile, box, sphere):
+    '''Render all morphologies of a directory, of an archive written by pack (or matching a
+    glob pattern) to OUTPUT_DIR'''
+    _check_tubes(tubes, plane)
+    _check_format(fmt, plane)
+    region = _region(box, sphere)
+    input_files = iter_inputs(inputs)
+    cache = TraceCache(cache_dir) if cache_dir else None
+    failures = 0
+    total = Profile()
+    try:
+        reports = render_all(input_files, output_dir, plane, fmt, jobs, force, profile,
+                             lod=tolerance, typed_arrays=typed_arrays,
+                             shared_plotlyjs=shared_plotlyjs or None, streaming=streaming,
+                             size=size, tubes=tubes, cache=cache, region=region)
+    except ValueError as error:
+        raise click.ClickException(str(error)) from error
+    for input_file, elapsed, error, stages in reports:
+        total.merge(stages or {})
+        if elapsed is None:
+            click.echo(f'SKIP {input_file}')
+        elif error is None:
+            click.echo(f'OK   {input_file} ({elapsed:.2f}s)')
+        else:
+            failures += 1
+            click.echo(f'FAIL {input_file} ({elapsed:.2f}s): {error}')
+    click.echo(f'{len(input_files)} files, {failures} failures')
+    if profile:
+        click.echo(total.format())
+    if failures:
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument('inputs')
+@click.option('--host', default='127.0.0.1', help='The address to listen to')
+@click.option('--port', type=click.IntRange(min=0), default=8000,
+              help='The port to listen to, 0 picks a free one')
+@click.option('--plane', type=click.Choice(PLANES), default='3d',
+              help='The plane shown first, it can be changed in the page')
+@click.option('--tolerance', type=float, default=None,
+              help='Simplify the sections so that no dropped point is further than tolerance '
+                   'from the drawn lines')
+@click.option('--threads', type=click.IntRange(min=1), default=4,
+              help='Number of threads handling the requests')
+@click.option('--memory-cache', type=click.IntRange(min=0), default=512,
+              help='Size in MB of the in-memory cache of rendered figures')
+@click.option('--typed-arrays', type=click.Choice(['float32', 'float64']), default=None,
+              help='Encode the coordinates as base64 typed arrays of this dtype')
+@click.option('--cache-dir', envvar=CACHE_DIR_ENV, default=None,
+              help='Cache the generated traces in this directory')
+@click.option('--open', 'open_browser', is_flag=True, help='Open the index in a web browser')
+@_region_options
+# pylint: disable=too-many-arguments,too-many-locals
+def serve(inputs, host, port, plane, tolerance, threads, memory_cache, typed_arrays, cache_dir,
+          open_browser, box, sphere):
+    '''Browse the morphologies of a directory, of an archive written by pack (or matching a
+    glob pattern) in a web browser'''
+    region = _region(box, sphere)
+    # pylint: disable=import-outside-toplevel
+    from plotly_helper.server import MorphologyServer
+    cache = TraceCache(cache_dir) if cache_dir else None
+    server = MorphologyServer((host, port), inputs, plane=plane, threads=threads,
+                              max_size=memory_cache * 1024 ** 2, typed_arrays=typed_arrays,
+                              lod=tolerance, cache=cache, region=region)
+    url = f'http://{host}:{server.server_address[1]}/'
+    click.echo(f'Serving {len(server.morphologies)} morphologies on {url}')
+    if open_browser:
+        import webbrowser
+        webbrowser.open(url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@cli.command()
+@click.argument('inputs')
+@click.argument('archive')
+def pack(inputs, archive):
+    '''Pack the morphologies of a directory (or matching a glob pattern) into an ARCHIVE
+    directory of memory mapped arrays, read without parsing by the viewers'''
+    # pylint: disable=import-outside-toplevel
+    from neurom import load_morphology
+    from plotly_helper.archive import write_archive
+    input_files = iter_inputs(inputs)
+    failures = 0
+
+    def _morphologies():
+        nonlocal failures
+        for input_file in input_files:
+            try:
+                morphology = load_morphology(input_file)
+            except Exception as error:  # pylint: disable=broad-except
+                failures += 1
+                click.echo(f'FAIL {input_file}: {error}')
+            else:
+                click.echo(f'OK   {input_file}')
+                yield os.path.basename(input_file), morphology
+
+    try:
+        names = write_archive(_morphologies(), archive)
+    except ValueError as error:
+        raise click.ClickException(str(error)) from error
+    click.echo(f'{len(names)} morphologies packed in {archive}, {failures} failures')
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,82 @@
+'''Level of detail reduction of the neurite polylines'''
+import numpy as np
+
+
+def _squared_distances(points, interval_ids, origins, directions):
+    '''Return the squared distances between each point and the chord of its interval
+
+    The chords are the segments [origin, origin + direction] of the intervals, the points are
+    given with the id of their interval.
+    '''
+    squared_lengths = np.einsum('ij,ij->i', directions, directions)
+    inverse_lengths = np.divide(1, squared_lengths, out=np.zeros_like(squared_lengths),
+                                where=squared_lengths > 0)
+    relative = points - origins[interval_ids]
+    point_directions = directions[interval_ids]
+    ratio = np.clip(np.einsum('ij,ij->i', relative, point_directions) *
+                    inverse_lengths[interval_ids], 0, 1)
+    relative -= ratio[:, np.newaxis] * point_directions
+    return np.einsum('ij,ij->i', relative, relative)
+
+
+# pylint: disable=too-many-locals
+def simplify(section_points, tolerance, keep=None):
+    '''Ramer-Douglas-Peucker simplification of many polylines at once
+
+    All the polylines are processed together: each iteration computes, for every interval still
+    to be refined, the squared distances of its interior points to the chord in a single
+    vectorized pass and splits the intervals whose farthest point is further than the tolerance.
+
+    Args:
+        section_points (list): the (N_i, D) point arrays of the polylines
+        tolerance (float): the maximum distance between a dropped point and the simplified line
+        keep (list): optional list (one item per polyline) of point indices that must be kept
+
+    Returns:
+        the list of the sorted indices of the kept points of each polyline. The first and last
+        points of each polyline are always kept.
+    '''
+    sizes = np.array([len(points) for points in section_points], dtype=int)
+    offsets = np.cumsum(sizes) - sizes
+    points = np.concatenate(section_points).astype(float)
+
+    mask = np.zeros(len(points), dtype=bool)
+    mask[offsets] = True
+    mask[offsets + sizes - 1] = True
+    if keep is not None:
+        for offset, indices in zip(offsets, keep):
+            mask[offset + np.asarray(indices, dtype=int)] = True
+
+    polyline_ids = np.repeat(np.arange(len(sizes)), sizes)
+    kept = np.flatnonzero(mask)
+    starts, ends = kept[:-1], kept[1:]
+    is_interval = (polyline_ids[starts] == polyline_ids[ends]) & (ends - starts > 1)
+    starts, ends = starts[is_interval], ends[is_interval]
+
+    while len(starts):  # pylint: disable=len-as-condition
+        # the interior points of each interval are contiguous, in the order of the intervals
+        lengths = ends - starts - 1
+        first_interior = np.cumsum(lengths) - lengths
+        interval_ids = np.repeat(np.arange(len(starts)), lengths)
+        interior = np.arange(lengths.sum()) + np.repeat(starts + 1 - first_interior, lengths)
+        distances = _squared_distances(points[interior], interval_ids, points[starts],
+                                       points[ends] - points[starts])
+
+        max_distances = np.maximum.reduceat(distances, first_interior)
+        is_max = np.flatnonzero(distances == max_distances[interval_ids])
+        # the first farthest point of each interval
+        split_points = interior[is_max[np.diff(interval_ids[is_max], prepend=-1) > 0]]
+
+        split_ids = np.flatnonzero(max_distances > tolerance ** 2)
+        split_points = split_points[split_ids]
+        mask[split_points] = True
+
+        starts = np.concatenate([starts[split_ids], split_points])
+        ends = np.concatenate([split_points, ends[split_ids]])
+        is_interval = ends - starts > 1
+        starts, ends = starts[is_interval], ends[is_interval]
+
+    kept = np.flatnonzero(mask)
+    counts = np.add.reduceat(mask.astype(int), offsets)
+    return [indices - offset
+            for indices, offset in zip(np.split(kept, np.cumsum(counts)[:-1]), offsets)]
@@ -2,16 +2,65 @@
 
 You can find information on python plotly here : https://plot.ly/python/
 """
+import base64
+import json
 import os
+import tempfile
+import uuid
+import webbrowser
+from collections.abc import MutableMapping
+from functools import lru_cache
 
 import numpy as np
 
-from plotly.offline import plot, iplot
+import plotly.io as pio
+from plotly.utils import PlotlyJSONEncoder
 # unknown pylint problem with this import
 # pylint: disable-msg=E0611,E0001
 from plotly.basedatatypes import BaseTraceType
 
 
+def _offline():
+    """ Return the plotly.offline module, which is only imported when needed because it also
+    imports IPython when it is installed """
+    import plotly.offline  # pylint: disable=import-outside-toplevel
+    return plotly.offline
+
+
+class _VisibilityMap(MutableMapping):  # pylint: disable=protected-access
+    """ The mutable {name: range of the indexes of the group objects in data} view of the group
+    index of a PlotlyHelper
+
+    It behaves as the dict the helpers used to expose: the writes update the index used by the
+    visibility lists. A range can be assigned to a new or an existing name, deleting a name
+    forgets its group but keeps its objects in data.
+    """
+
+    def __init__(self, helper):
+        self._helper = helper
+
+    def __getitem__(self, name):
+        start, stop = self._helper._bounds[self._helper._group_ids[name]].tolist()
+        return range(start, stop)
+
+    def __setitem__(self, name, objects):
+        if not isinstance(objects, range) or objects.step != 1:
+            raise ValueError(f'the objects of {name} must be a range of consecutive indexes')
+        self._helper._set_group(name, objects.start, objects.stop)
+
+    def __delitem__(self, name):
+        del self._helper._group_ids[name]
+
+    def __iter__(self):
+        return iter(self._helper._group_ids)
+
+    def __len__(self):
+        return len(self._helper._group_ids)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
 class PlotlyHelper:
     """Class to help creating plotly plots with shapes, buttons and data """
 
@@ -19,7 +68,12 @@ class PlotlyHelper:
         self.title = title
         self.layout = layout if layout else self._get_standard_layout(title)
         self.data = []
-        self.visibility_map = {}
+        # the groups are stored as an index {name: group id} and the rows of an array of the
+        # start/stop offsets of their objects in self.data, grown by doubling its capacity
+        self._group_ids = {}
+        self._bounds = np.zeros((0, 2), dtype=np.int64)
+        self._nb_groups = 0
+        self._visibility_map = _VisibilityMap(self)
         self.updatemenus = []
         self.shapes = []
         self.nb_objects = 0
@@ -69,6 +123,36 @@ class PlotlyHelper:
             else:
                 self.updatemenus.append(self._get_button_skeleton(direction))
 
+    @property
+    def visibility_map(self):
+        """ The mutable mapping {name: range of the indexes of the group objects in data}
+
+        It is a live view of the group index: it always reflects the data changes and writing
+        to it updates the visibility lists.
+        """
+        return self._visibility_map
+
+    @visibility_map.setter
+    def visibility_map(self, groups):
+        self._group_ids, self._nb_groups = {}, 0
+        self._visibility_map.update(groups)
+
+    def _new_group_ids(self, count):
+        """ Return the ids of count new groups, growing the bounds array if needed """
+        if self._nb_groups + count > len(self._bounds):
+            bounds = np.zeros((max(2 * len(self._bounds), self._nb_groups + count, 16), 2),
+                              dtype=np.int64)
+            bounds[:self._nb_groups] = self._bounds[:self._nb_groups]
+            self._bounds = bounds
+        self._nb_groups += count
+        return range(self._nb_groups - count, self._nb_groups)
+
+    def _set_group(self, name, start, stop):
+        """ Set the [start, stop) indexes of the objects of a new or an existing group """
+        if name not in self._group_ids:
+            self._group_ids[name] = self._new_group_ids(1)[0]
+        self._bounds[self._group_ids[name]] = start, stop
+
     def _add_visibility(self, name, objs):
         """ Update the position dictionary used to handle the visibility in plotly
 
@@ -79,9 +163,38 @@ class PlotlyHelper:
         Raises:
             ValueError: An error occurs if name shadows a previous entry name
         """
-        if name in self.visibility_map:
+        if name in self._group_ids:
             raise ValueError(f'{name} already exists')
-        self.visibility_map[name] = range(len(self.data), len(self.data) + len(objs))
+        self._set_group(name, len(self.data), len(self.data) + len(objs))
+
+    def _group_bounds(self, names):
+        """ Return the start and stop arrays of the groups in names
+
+        Raises:
+            KeyError: if a name is not found in the visibility map
+        """
+        if isinstance(names, str):
+            names = [names]
+        try:
+            ids = np.fromiter((self._group_ids[name] for name in names), dtype=int)
+        except KeyError as error:
+            raise KeyError(f'Can not find the object {error}') from error
+        return self._bounds[ids, 0], self._bounds[ids, 1]
+
+    @staticmethod
+    def _ranges_mask(starts, stops, size):
+        """ Return the (len(starts), size) boolean masks of the union of [start, stop) per row
+
+        starts and stops are (N, K) arrays. Each range adds +1 at its start and -1 at its stop
+        in a flat (N, size + 1) counter, whose cumulative sum along the rows is positive in the
+        ranges. The empty [0, 0) ranges padding the rows cancel out.
+        """
+        starts, stops = np.clip(starts, 0, size), np.clip(stops, 0, size)
+        width = size + 1
+        offsets = np.arange(len(starts))[:, np.newaxis] * width
+        markers = (np.bincount((offsets + starts).ravel(), minlength=len(starts) * width) -
+                   np.bincount((offsets + stops).ravel(), minlength=len(starts) * width))
+        return np.cumsum(markers.reshape(len(starts), width)[:, :size], axis=1) > 0
 
     def _place_buttons(self, offset=0.01):
         """ Place the buttons using the update menu from plotly """
@@ -119,13 +232,34 @@ class PlotlyHelper:
              >>> helper.add_data({"graph1" : [obj1], "graph2": [obj2]}).
              >>> helper.get_visibility_list(["graph1", "graph2"])
         """
-        if isinstance(names, str):
-            names = [names]
-        try:
-            true_indexes = set(item for name in names for item in self.visibility_map[name])
-        except KeyError as error:
-            raise KeyError('Can not find the object {}') from error
-        return [i in true_indexes for i in range(self.nb_objects)]
+        starts, stops = self._group_bounds(names)
+        return self._ranges_mask(starts[np.newaxis], stops[np.newaxis],
+                                 self.nb_objects)[0].tolist()
+
+    def get_visibility_lists(self, names_list):
+        """ Return the boolean lists of several get_visibility_list calls at once
+
+        Args:
+            names_list: a list of names or of lists of names, one item per visibility list
+
+        Returns:
+            a list of visibility lists, one per item of names_list
+
+        Raises:
+            KeyError: if a name is not found in the visibility map
+
+        Notes:
+            The bounds of the groups are gathered per item and all the masks are computed at
+            once, without a loop over the ranges: this is the way to go when creating one button
+            per group for many groups.
+        """
+        names_list = [[names] if isinstance(names, str) else list(names) for names in names_list]
+        width = max((len(names) for names in names_list), default=0)
+        starts = np.zeros((len(names_list), width), dtype=int)
+        stops = np.zeros((len(names_list), width), dtype=int)
+        for row, names in enumerate(names_list):
+            starts[row, :len(names)], stops[row, :len(names)] = self._group_bounds(names)
+        return self._ranges_mask(starts, stops, self.nb_objects).tolist()
 
     @staticmethod
     def _group_validator(obj_groups):
@@ -168,13 +302,50 @@ class PlotlyHelper:
             objects altogether.
         """
         self._group_validator(obj_groups)
-        for name, group in obj_groups.items():
-            if not isinstance(group, list):
-                group = [group]
-            self._add_visibility(name, group)
-            for obj in group:
-                self.nb_objects += 1
-                self.data.append(obj)
+        self.add_data_bulk(list(obj_groups), list(obj_groups.values()))
+
+    def add_data_bulk(self, names, groups, validate=False):
+        """ Add many groups of plotly data at once
+
+        Args:
+            names: the list of the group names
+            groups: the list of the groups, with the same length as names. A group is a plotly
+                object, a plain trace dict (ex: {'type': 'scatter', 'x': [...]}) or a list of them
+            validate: check the types of the names and of all the objects as add_data does
+
+        Raises:
+            ValueError: if the lengths differ, if a group is empty or if a name already exists
+            TypeError: if validate is True and a name or an object has a bad type
+
+        Note:
+            Without validation only the group sizes and the names unicity are checked, the objects
+            are validated by plotly when the figure is plotted. data and the visibility index are
+            extended once for all groups.
+        """
+        groups = [group if isinstance(group, list) else [group] for group in groups]
+        if len(names) != len(groups):
+            raise ValueError(f'got {len(names)} names for {len(groups)} groups')
+        sizes = np.fromiter((len(group) for group in groups), dtype=int, count=len(groups))
+        if not sizes.all():
+            raise ValueError(f'{names[int(np.argmin(sizes))]} object is empty')
+        if len(set(names)) != len(names) or not self._group_ids.keys().isdisjoint(names):
+            duplicates = [name for name in names if name in self._group_ids or
+                          names.count(name) > 1]
+            raise ValueError(f'{duplicates[0]} already exists')
+        if validate:
+            for name, group in zip(names, groups):
+                if not isinstance(name, str):
+                    raise TypeError(f'bad name {name} for object')
+                for obj in group:
+                    if not isinstance(obj, (BaseTraceType, dict)):
+                        raise TypeError(f"can't add {obj} to helper")
+
+        stops = len(self.data) + np.cumsum(sizes)
+        group_ids = self._new_group_ids(len(names))
+        self._group_ids.update(zip(names, group_ids))
+        self._bounds[group_ids.start:group_ids.stop] = np.column_stack([stops - sizes, stops])
+        self.data.extend(obj for group in groups for obj in group)
+        self.nb_objects = len(self.data)
 
     def remove_data(self, names):
         """ Remove plotly data to the plot and update its visibility map
@@ -183,31 +354,64 @@ class PlotlyHelper:
             names: a list of name [name1, name2, ...] of object to remove
 
         Raises:
-            ValueError: if one of the name has been referenced before
+            ValueError: if one of the name has not been added before
 
         Note:
-            This function keeps recompute the number of object and visibility_map for all objects
+            All the groups are removed at once: data is compacted a single time and the offsets
+            of the remaining groups are shifted by the number of removed objects before them.
         """
-
-        def _remove_visibility(visibility_map, obj_name):
-            if obj_name not in visibility_map:
-                raise ValueError(f'{obj_name} must exists')
-            to_removed_range = visibility_map.pop(obj_name)
-            for c_name, obj_range in self.visibility_map.items():
-                if obj_range[0] > to_removed_range[-1]:
-                    c_range = list(visibility_map[c_name])
-                    start = c_range[0] - len(to_removed_range)
-                    stop = c_range[-1] - len(to_removed_range) + 1
-                    visibility_map[c_name] = range(start, stop)
-            return to_removed_range
-
         if isinstance(names, str):
             names = [names]
-
         for name in names:
-            removed_range = list(_remove_visibility(self.visibility_map, name))
-            self.nb_objects -= len(removed_range)
-            del self.data[slice(removed_range[0], removed_range[-1] + 1)]
+            if name not in self._group_ids:
+                raise ValueError(f'{name} must exists')
+
+        removed_ids = {self._group_ids[name] for name in names}
+        starts, stops = self._group_bounds(names)
+        removed = self._ranges_mask(starts[np.newaxis], stops[np.newaxis], len(self.data))[0]
+        # shift[i] is the number of removed objects before the index i
+        shift = np.concatenate([[0], np.cumsum(removed)])
+
+        self.data[:] = [obj for obj, is_removed in zip(self.data, removed) if not is_removed]
+        self.nb_objects = len(self.data)
+        kept = [(name, i) for name, i in self._group_ids.items() if i not in removed_ids]
+        kept_ids = np.array([i for _, i in kept], dtype=int)
+        bounds = self._bounds[kept_ids]
+        self._bounds[:len(kept)] = bounds - shift[bounds]
+        self._nb_groups = len(kept)
+        self._group_ids = {name: new_id for new_id, (name, _) in enumerate(kept)}
+
+    def replace_data(self, name, group):
+        """ Replace the plotly data of a group in place
+
+        Args:
+            name: the name of the group to replace
+            group: the new plotly object or list of plotly objects of the group
+
+        Raises:
+            ValueError: if the name has not been added before or if group is empty
+
+        Note:
+            The group keeps its position in data, the offsets of the following groups are
+            shifted if the number of objects changes.
+        """
+        if name not in self._group_ids:
+            raise ValueError(f'{name} must exists')
+        group = group if isinstance(group, list) else [group]
+        if not group:
+            raise ValueError(f'{name} object is empty')
+
+        group_id = self._group_ids[name]
+        start, stop = self._bounds[group_id].tolist()
+        self.data[start:stop] = group
+        self.nb_objects = len(self.data)
+        delta = len(group) - (stop - start)
+        if delta:
+            bounds = self._bounds[:self._nb_groups]
+            after = bounds[:, 0] >= stop
+            after[group_id] = False
+            bounds[after] += delta
+            bounds[group_id, 1] += delta
 
     def add_shapes(self, shapes):
         """ Add shape to the figure
@@ -255,6 +459,7 @@ class PlotlyHelperPlane(PlotlyHelper):
 
     def __init__(self, title, plane):
         self.plane = self._sanitize_plane(plane)
+        self.name = title
         title = self._get_title(title, plane)
         super().__init__(title, self._get_layout_skeleton(title, self.plane))
 
@@ -371,16 +576,343 @@ class PlotlyHelperPlane(PlotlyHelper):
             self.add_button('YZ view', 'relayout', ['scene', PlotlyHelperPlane._get_scene('yz')],
                             'view')
 
+    def set_view_buttons(self, planes):
+        """ Add one button per plane that turns the camera of the scene to face it
 
-def plot_fig(fig, filename, auto_open=True, show_link=False):
-    """ Create the html file """
+        The traces are drawn once in the 3D scene, seen through an orthographic camera: the
+        buttons only relayout the camera and the title, so no coordinates are sent again.
+        Calling it again replaces the buttons.
+
+        Args:
+            planes: the planes of the buttons (ex: ['xy', 'xz', 'yz'])
+
+        Raises:
+            ValueError: if the helper plane is not one of the planes
+        """
+        planes = [self._sanitize_plane(plane) for plane in planes]
+        if self.plane not in planes:
+            raise ValueError(f'the plane {self.plane} must be one of the view planes')
+        self._add_button_group('view', 'right')
+        group = self.updatemenus[self.button_group_to_index['view']]
+        group['buttons'] = []
+        group['active'] = planes.index(self.plane)
+        for plane in planes:
+            camera = dict(self._get_camera(plane), projection={'type': 'orthographic'})
+            self.add_button('3D view' if plane == 'xyz' else f'{plane.upper()} view', 'relayout',
+                            [{'scene.camera': camera,
+                              'title.text': self._get_title(self.name, plane)}], 'view')
+        self.layout['scene']['camera']['projection'] = {'type': 'orthographic'}
+
+
+def _typed_array(array, dtype):
+    """ Return the plotly.js typed array spec (base64 little endian buffer) of a numpy array """
+    array = np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder('<'))
+    spec = {'dtype': array.dtype.str[1:],
+            'bdata': base64.b64encode(array.tobytes()).decode('ascii')}
+    if array.ndim > 1:
+        spec['shape'] = ', '.join(str(size) for size in array.shape)
+    return spec
+
+
+def discrete_colorscale(colors):
+    """ Return the colorscale, cmin and cmax mapping the integer i to colors[i]
+
+    Returns:
+        a dict {'colorscale': ..., 'cmin': ..., 'cmax': ...} to update a marker or line style
+    """
+    nb_colors = len(colors)
+    return {'colorscale': [[bound / nb_colors, color]
+                           for i, color in enumerate(colors) for bound in (i, i + 1)],
+            'cmin': -0.5, 'cmax': nb_colors - 0.5}
+
+
+def _encode_colors(style):
+    """ Replace a list of color strings by color indexes and a discrete colorscale """
+    colors = np.asarray(style['color'], dtype=object)
+    palette, color_ids = np.unique(colors, return_inverse=True)
+    style['color'] = _typed_array(color_ids, np.uint8 if len(palette) < 256 else np.int32)
+    style.update(discrete_colorscale(palette.tolist()))
+
+
+def _encode_value(value, float_dtype):
+    """ Return the typed array spec of numeric arrays and value itself otherwise
+
+    The None items of the numeric lists (the line separators) are encoded as NaN. plotly.js has
+    no 64 bits integer arrays: the integers out of the int32 and uint32 ranges are encoded as
+    float64, exact up to 2**53, and left as plain arrays beyond.
+    """
+    if isinstance(value, (list, tuple)) and value and all(
+            item is None or isinstance(item, (int, float)) and not isinstance(item, bool)
+            for item in value) and any(item is not None for item in value):
+        value = np.array(value, dtype=float if None in value else None)
+    if not isinstance(value, np.ndarray) or value.ndim == 0:
+        return value
+    if np.issubdtype(value.dtype, np.floating):
+        return _typed_array(value, float_dtype)
+    if np.issubdtype(value.dtype, np.integer):
+        return _encode_integers(value)
+    return value
+
+
+def _encode_integers(value):
+    """ Return the typed array spec of the smallest plotly.js dtype holding the integers exactly """
+    if not value.size:
+        return _typed_array(value, np.int32)
+    low, high = int(value.min()), int(value.max())
+    for dtype in (np.int32, np.uint32):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return _typed_array(value, dtype)
+    if -2 ** 53 <= low and high <= 2 ** 53:
+        return _typed_array(value, np.float64)
+    return value
+
+
+def _encode_arrays(obj, float_dtype):
+    """ Recursively encode the numeric arrays and the color lists of a trace dict """
+    encoded = {key: (_encode_arrays(value, float_dtype) if isinstance(value, dict) else
+                     _encode_value(value, float_dtype))
+               for key, value in obj.items()}
+    if isinstance(encoded.get('color'), (list, tuple, np.ndarray)):
+        _encode_colors(encoded)
+    return encoded
+
+
+def encode_typed_arrays(fig, float_dtype='float32'):
+    """ Return a copy of the figure where the numeric trace arrays are base64 typed arrays
+
+    Args:
+        fig: a figure dict as returned by PlotlyHelper.get_fig
+        float_dtype: the dtype used to store the floating point arrays ('float32' or 'float64')
+
+    Notes:
+        plotly.js (>= 2.28) decodes the {'dtype', 'bdata'} specs natively which makes the
+        figures much smaller and faster to parse than decimal strings. NaN values are kept. Lists
+        of color strings are replaced by color indexes and a discrete colorscale.
+    """
+    data = [_encode_arrays(trace.to_plotly_json() if isinstance(trace, BaseTraceType) else trace,
+                           float_dtype)
+            for trace in fig['data']]
+    layout = fig.get('layout')
+    if isinstance(layout, dict) and layout.get('updatemenus'):
+        layout = dict(layout, updatemenus=[_encode_buttons(group, float_dtype)
+                                           for group in layout['updatemenus']])
+        return dict(fig, data=data, layout=layout)
+    return dict(fig, data=data)
+
+
+def _encode_buttons(group, float_dtype):
+    """ Encode the per trace arrays restyled by the buttons of an updatemenu group """
+    buttons = []
+    for button in group.get('buttons', []):
+        if button.get('method') in ('restyle', 'update') and isinstance(button['args'][0], dict):
+            restyle = {key: ([_encode_value(value, float_dtype) for value in values]
+                             if isinstance(values, list) else _encode_value(values, float_dtype))
+                       for key, values in button['args'][0].items()}
+            button = dict(button, args=[restyle] + list(button['args'][1:]))
+        buttons.append(button)
+    return dict(group, buttons=buttons)
+
+
+def get_plotlyjs():
+    """ Return the content of the plotly.js bundle shipped with plotly """
+    return _offline().get_plotlyjs()
+
+
+@lru_cache(maxsize=None)
+def _plotlyjs_content():
+    """ The utf-8 encoded plotly.js bundle, read once """
+    return get_plotlyjs().encode('utf-8')
+
+
+def write_plotlyjs(path):
+    """ Write the plotly.js bundle to path unless it already holds this exact bundle
+
+    Notes:
+        A file of another plotly.js version, or a truncated or edited one, is replaced. The
+        existing file is only read when its size matches. The file is written to a temporary
+        file first and then moved, so that concurrent processes never read a partial bundle. It
+        gets the default mode of a new file (0o666 minus the umask) rather than the private mode
+        of the temporary files, so that it is served along the html files.
+    """
+    content = _plotlyjs_content()
+    if os.path.exists(path) and os.path.getsize(path) == len(content):
+        with open(path, 'rb') as fd:
+            if fd.read() == content:
+                return
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile('wb', dir=directory, suffix='.js', delete=False) as fd:
+        fd.write(content)
+    os.chmod(fd.name, 0o666 & ~_umask())
+    os.replace(fd.name, path)
+
+
+def _umask():
+    """ Return the umask of the process, which can only be read by setting it """
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+def get_include_plotlyjs(filename, shared_plotlyjs=None):
+    """ Return the plotly include_plotlyjs argument for the html file filename
+
+    Args:
+        filename: the output html filename
+        shared_plotlyjs: None to embed plotly.js in the html file, True to share a plotly.min.js
+            file written next to filename or the path of the shared plotly.js file
+
+    Returns:
+        True (embedded) or the path of the shared plotly.js file relative to filename, which is
+        written if needed. No CDN is involved so the html files work offline.
+
+    Raises:
+        ValueError: if the shared plotly.js path does not end with .js, plotly would silently
+            embed the bundle instead of referencing it
+    """
+    if not shared_plotlyjs:
+        return True
+    if shared_plotlyjs is not True and not str(shared_plotlyjs).endswith('.js'):
+        raise ValueError(f'the shared plotly.js file {shared_plotlyjs} must end with .js')
+    directory = os.path.dirname(os.path.abspath(filename))
+    if shared_plotlyjs is True:
+        shared_plotlyjs = os.path.join(directory, 'plotly.min.js')
+    write_plotlyjs(shared_plotlyjs)
+    return os.path.relpath(os.path.abspath(shared_plotlyjs), directory).replace(os.sep, '/')
+
+
+def _to_json(obj):
+    """ Return the json of obj, safe to be embedded in an html script tag """
+    return (json.dumps(obj, cls=PlotlyJSONEncoder)
+            .replace('<', '\\u003c').replace('>', '\\u003e').replace('/', '\\u002f'))
+
+
+def _write_traces(fig, fd, typed_arrays=None):
+    """ Write the json list of the figure traces, serializing a single trace at a time """
+    fd.write('[')
+    for i, trace in enumerate(fig['data']):
+        if isinstance(trace, BaseTraceType):
+            trace = trace.to_plotly_json()
+        if typed_arrays:
+            trace = _encode_arrays(trace, typed_arrays)
+        if i:
+            fd.write(', ')
+        fd.write(_to_json(trace))
+    fd.write(']')
+
+
+def _streamed_layout(fig):
+    """ The figure layout with the default plotly template that plot() would apply """
+    layout = dict(fig.get('layout', {}))
+    if 'template' not in layout and pio.templates.default:
+        layout['template'] = pio.templates[pio.templates.default].to_plotly_json()
+    return layout
+
+
+def write_fig_json(fig, fd, typed_arrays=None):
+    """ Stream the figure as json to a file object
+
+    Args:
+        fig: the figure dict as returned by PlotlyHelper.get_fig
+        fd: a text file object
+        typed_arrays: None or the float dtype used to encode the trace arrays as base64 typed
+            arrays (see encode_typed_arrays)
+
+    Notes:
+        The traces are serialized one at a time so the memory peak is bounded by the largest
+        trace and not by the whole figure. The traces are not validated again. The layout
+        gets the default plotly template, as in the json written by plotly.
+    """
+    fd.write('{"data": ')
+    _write_traces(fig, fd, typed_arrays)
+    fd.write(f', "layout": {_to_json(_streamed_layout(fig))}}}')
+
+
+def write_fig_html(fig, filename, auto_open=False, typed_arrays=None, shared_plotlyjs=None):
+    """ Stream the figure to a standalone html file
+
+    Args:
+        fig: the figure dict as returned by PlotlyHelper.get_fig
+        filename: the output html filename
+        auto_open: whether or not to open the figure in a browser
+        typed_arrays: None or the float dtype used to encode the trace arrays as base64 typed
+            arrays (see encode_typed_arrays)
+        shared_plotlyjs: None to embed plotly.js, True or a path to reference a shared
+            plotly.js file instead (see get_include_plotlyjs)
+
+    Returns:
+        the html filename
+
+    Notes:
+        This writes the same page as plot_fig but the traces are serialized straight to the
+        file, one at a time, so the memory peak is bounded by the largest trace.
+    """
+    if os.path.splitext(filename)[1] != '.html':
+        filename += '.html'
+    include_plotlyjs = get_include_plotlyjs(filename, shared_plotlyjs)
+    layout = _streamed_layout(fig)
+    div_id = str(uuid.uuid4())
+    height = layout.get('height', '100%')
+    height = f'{height}px' if isinstance(height, (int, float)) else height
+
+    with open(filename, 'w', encoding='utf-8') as fd:
+        fd.write('<html>\n<head><meta charset="utf-8" /></head>\n<body>\n<div>'
+                 '<script type="text/javascript">'
+                 'window.PlotlyConfig = {MathJaxConfig: \'local\'};</script>\n')
+        if include_plotlyjs is True:
+            fd.write('<script type="text/javascript">')
+            fd.write(get_plotlyjs())
+            fd.write('</script>\n')
+        else:
+            fd.write(f'<script charset="utf-8" src="{include_plotlyjs}"></script>\n')
+        fd.write(f'<div id="{div_id}" class="plotly-graph-div" '
+                 f'style="height:{height}; width:100%;"></div>\n'
+                 '<script type="text/javascript">\n'
+                 'window.PLOTLYENV=window.PLOTLYENV || {};\n'
+                 f'if (document.getElementById("{div_id}")) {{\n'
+                 f'Plotly.newPlot("{div_id}", ')
+        _write_traces(fig, fd, typed_arrays)
+        fd.write(f', {_to_json(layout)}, {{"responsive": true}})\n}}\n'
+                 '</script></div>\n</body>\n</html>\n')
+
+    if auto_open:  # pragma: no cover
+        webbrowser.open('file://' + os.path.abspath(filename))
+    return filename
+
+
+# pylint: disable=too-many-arguments
+def plot_fig(fig, filename, auto_open=True, show_link=False, typed_arrays=None,
+             shared_plotlyjs=None, streaming=False):
+    """ Create the html file
+
+    Args:
+        fig: the figure dict
+        filename: the output html filename
+        auto_open: whether or not to open the figure in a browser
+        show_link: whether or not to show the link to the plotly website
+        typed_arrays: None or the float dtype used to encode the trace arrays as base64 typed
+            arrays (see encode_typed_arrays)
+        shared_plotlyjs: None to embed plotly.js, True or a path to reference a shared
+            plotly.js file instead (see get_include_plotlyjs)
+        streaming: write the traces one at a time with write_fig_html to bound the memory peak
+    """
+    if streaming:
+        write_fig_html(fig, filename, auto_open, typed_arrays, shared_plotlyjs)
+        return
     if os.path.splitext(filename)[1] != '.html':
         filename += '.html'
-    plot(fig, filename=filename, auto_open=auto_open, show_link=show_link)
+    include_plotlyjs = get_include_plotlyjs(filename, shared_plotlyjs)
+    if typed_arrays:
+        _offline().plot(encode_typed_arrays(fig, typed_arrays), filename=filename,
+                        auto_open=auto_open, show_link=show_link,
+                        include_plotlyjs=include_plotlyjs, validate=False)
+    else:
+        _offline().plot(fig, filename=filename, auto_open=auto_open, show_link=show_link,
+                        include_plotlyjs=include_plotlyjs)
 
 
 def iplot_fig(fig, filename, show_link=False):  # pragma: no cover
     """ Plot the figure inside a jupyter notebook """
     if os.path.splitext(filename)[1] != '.html':
         filename += '.html'
-    iplot(fig, filename=filename, show_link=show_link)
+    _offline().iplot(fig, filename=filename, show_link=show_link)
@@ -0,0 +1,165 @@
+'''Unit meshes used to draw the somata
+
+The meshes only depend on their resolution so they are computed once and cached. They are
+returned as read-only arrays: a soma is then only a scale and a translation of a unit mesh.
+'''
+from functools import lru_cache
+
+import numpy as np
+
+# 20 * 4 ** 6 = 81920 triangles per sphere, far more than a soma ever needs
+MAX_SUBDIVISIONS = 6
+
+
+def _read_only(*arrays):
+    '''Flag the arrays as read-only so that the cached values can not be altered'''
+    for array in arrays:
+        array.setflags(write=False)
+    return arrays
+
+
+@lru_cache(maxsize=None)
+def unit_sphere_grid(resolution):
+    '''Return the x, y and z (resolution, resolution) grids of a latitude/longitude unit sphere
+
+    The grids can be used directly as a plotly Surface.
+    '''
+    theta = np.linspace(0, 2 * np.pi, resolution)
+    phi = np.linspace(0, np.pi, resolution)
+    return _read_only(np.outer(np.cos(theta), np.sin(phi)),
+                      np.outer(np.sin(theta), np.sin(phi)),
+                      np.outer(np.ones(resolution), np.cos(phi)))
+
+
+def _icosahedron():
+    '''Return the vertices and triangles of a unit icosahedron'''
+    golden = (1 + np.sqrt(5)) / 2
+    vertices = np.array([[-1, golden, 0], [1, golden, 0], [-1, -golden, 0], [1, -golden, 0],
+                         [0, -1, golden], [0, 1, golden], [0, -1, -golden], [0, 1, -golden],
+                         [golden, 0, -1], [golden, 0, 1], [-golden, 0, -1], [-golden, 0, 1]])
+    triangles = np.array([[0, 11, 5], [0, 5, 1], [0, 1, 7], [0, 7, 10], [0, 10, 11],
+                          [1, 5, 9], [5, 11, 4], [11, 10, 2], [10, 7, 6], [7, 1, 8],
+                          [3, 9, 4], [3, 4, 2], [3, 2, 6], [3, 6, 8], [3, 8, 9],
+                          [4, 9, 5], [2, 4, 11], [6, 2, 10], [8, 6, 7], [9, 8, 1]])
+    return vertices / np.linalg.norm(vertices, axis=1)[:, np.newaxis], triangles
+
+
+@lru_cache(maxsize=None)
+def icosphere(subdivisions):
+    '''Return the vertices and triangles of a unit icosphere
+
+    Each subdivision splits every triangle in 4 using the normalized edge midpoints, so the
+    sphere has 20 * 4 ** subdivisions triangles. It is a much lighter mesh than the
+    latitude/longitude grid for the same visual quality.
+
+    Raises:
+        ValueError: if subdivisions is not between 0 and MAX_SUBDIVISIONS
+    '''
+    if not 0 <= subdivisions <= MAX_SUBDIVISIONS:
+        raise ValueError(f'the icosphere subdivisions must be between 0 and {MAX_SUBDIVISIONS}, '
+                         f'got {subdivisions}')
+    vertices, triangles = _icosahedron()
+    for _ in range(subdivisions):
+        edges = np.sort(triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+        unique_edges, edge_ids = np.unique(edges, axis=0, return_inverse=True)
+        midpoints = vertices[unique_edges].mean(axis=1)
+        midpoints /= np.linalg.norm(midpoints, axis=1)[:, np.newaxis]
+
+        middle = (edge_ids.ravel() + len(vertices)).reshape(-1, 3)
+        vertices = np.vstack([vertices, midpoints])
+        first, second, third = triangles.T
+        mid01, mid12, mid20 = middle.T
+        triangles = np.concatenate([np.stack([first, mid01, mid20], axis=1),
+                                    np.stack([second, mid12, mid01], axis=1),
+                                    np.stack([third, mid20, mid12], axis=1),
+                                    middle])
+    return _read_only(vertices, triangles)
+
+
+def batch_meshes(vertices, triangles, centers, radii):
+    '''Scale and translate a unit mesh once per (center, radius) and merge all the copies
+
+    Returns:
+        a tuple (vertices, triangles) of the merged mesh
+    '''
+    centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+    radii = np.asarray(radii, dtype=float).reshape(-1)
+    all_vertices = centers[:, np.newaxis] + radii[:, np.newaxis, np.newaxis] * vertices
+    offsets = np.arange(len(centers))[:, np.newaxis, np.newaxis] * len(vertices)
+    return all_vertices.reshape(-1, 3), (triangles + offsets).reshape(-1, 3)
+
+
+def _perpendicular_frames(directions):
+    '''Return two unit vectors u, v per row such that (direction, u, v) is an orthonormal frame'''
+    # the helper axis is x, unless the direction is close to x
+    helper = np.zeros_like(directions)
+    close_to_x = np.abs(directions[:, 0]) > 0.9
+    helper[~close_to_x, 0] = 1
+    helper[close_to_x, 1] = 1
+    u = np.cross(directions, helper)
+    u /= np.linalg.norm(u, axis=1)[:, np.newaxis]
+    return u, np.cross(directions, u)
+
+
+def tube_resolution(sizes, max_triangles, min_size=0., min_sides=3, max_sides=16):
+    '''Choose the number of sides of the tubes and the smallest drawn segment to fit a budget
+
+    Args:
+        sizes (np.array): the size of each segment (ex: the max of its length and diameter)
+        max_triangles (int): the triangle budget of all the tubes
+        min_size (float): the segments smaller than this are never drawn (ex: sub-pixel ones)
+        min_sides (int): the minimum number of sides of a tube
+        max_sides (int): the maximum number of sides of a tube
+
+    Returns:
+        a tuple (nb_sides, min_size). Each drawn segment has 2 * nb_sides triangles. If the
+        budget can not be met with min_sides, min_size is raised to drop the smallest segments.
+        Segments of equal sizes are kept or dropped together, so the budget is only exceeded if
+        the largest segments alone exceed it.
+    '''
+    sizes = np.sort(np.asarray(sizes, dtype=float))
+    nb_segments = len(sizes) - int(np.searchsorted(sizes, min_size))
+    nb_sides = int(np.clip(max_triangles // (2 * max(nb_segments, 1)), min_sides, max_sides))
+    if 2 * nb_sides * nb_segments > max_triangles:
+        nb_kept = max_triangles // (2 * nb_sides)
+        candidates = np.unique(sizes[sizes >= min_size])
+        fits = len(sizes) - np.searchsorted(sizes, candidates) <= nb_kept
+        min_size = candidates[fits].min() if fits.any() else candidates.max()
+    return nb_sides, float(min_size)
+
+
+# pylint: disable=too-many-locals
+def tube_mesh(starts, ends, start_radii, end_radii, nb_sides):
+    '''Return the mesh of the frusta (truncated cones without caps) of many segments at once
+
+    Args:
+        starts (np.array): the (N, 3) start points of the segments
+        ends (np.array): the (N, 3) end points of the segments, which must differ from starts
+        start_radii (np.array): the N radii at the start points
+        end_radii (np.array): the N radii at the end points
+        nb_sides (int): the number of sides of each frustum
+
+    Returns:
+        a tuple (vertices, triangles). The vertices of the segment i are the rows
+        [2 * nb_sides * i, 2 * nb_sides * (i + 1)): the start ring then the end ring.
+    '''
+    starts = np.asarray(starts, dtype=float)
+    ends = np.asarray(ends, dtype=float)
+    directions = ends - starts
+    directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+    u, v = _perpendicular_frames(directions)
+
+    angles = np.linspace(0, 2 * np.pi, nb_sides, endpoint=False)
+    ring = (np.cos(angles)[:, np.newaxis, np.newaxis] * u +
+            np.sin(angles)[:, np.newaxis, np.newaxis] * v).transpose(1, 0, 2)
+    vertices = np.stack([starts[:, np.newaxis] + start_radii[:, np.newaxis, np.newaxis] * ring,
+                         ends[:, np.newaxis] + end_radii[:, np.newaxis, np.newaxis] * ring],
+                        axis=1)
+
+    side = np.arange(nb_sides)
+    following = (side + 1) % nb_sides
+    end_side, end_following = side + nb_sides, following + nb_sides
+    triangles = np.concatenate([np.stack([side, following, end_side], axis=1),
+                                np.stack([following, end_following, end_side], axis=1)])
+    offsets = np.arange(len(starts))[:, np.newaxis, np.newaxis] * 2 * nb_sides
+    return vertices.reshape(-1, 3), (triangles + offsets).reshape(-1, 3)
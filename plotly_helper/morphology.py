@@ -0,0 +1,123 @@
+'''Vectorized per point values and preorder index of the morphology sections'''
+import numpy as np
+
+from neurom import COLS, iter_sections
+
+FEATURES = ('radius', 'path_distance', 'branch_order')
+
+
+def _parent_indices(sections):
+    '''Return the index of the parent of each section in sections or -1 for root sections'''
+    indices = {section.id: i for i, section in enumerate(sections)}
+    return [-1 if section.parent is None else indices[section.parent.id] for section in sections]
+
+
+def _accumulate(parents, values):
+    '''Return for each section the sum of values over its ancestors (itself excluded)
+
+    The parents must precede their children, which is the case of the preorder iteration.
+    '''
+    totals = np.zeros(len(parents))
+    for i, parent in enumerate(parents):
+        if parent >= 0:
+            totals[i] = totals[parent] + values[parent]
+    return totals
+
+
+def point_values(neuron, values):
+    '''Return the value of each point of the sections of a morphology
+
+    Args:
+        neuron: a NeuroM morphology
+        values: the name of a feature in FEATURES or an array with one value per point of the
+            sections of neuron, concatenated in the iter_sections order
+
+    Returns:
+        a tuple (sections, section_values) where section_values is the list of the per point
+        value arrays of the sections
+
+    Raises:
+        ValueError: if values is an unknown feature or an array of the wrong size
+    '''
+    sections = list(iter_sections(neuron))
+    sizes = np.array([len(section.points) for section in sections], dtype=int)
+    offsets = np.cumsum(sizes) - sizes
+
+    if isinstance(values, str):
+        if values not in FEATURES:
+            raise ValueError(f'unknown feature {values}, expected one of {FEATURES}')
+        points = np.concatenate([section.points for section in sections])
+        if values == 'radius':
+            values = points[:, COLS.R]
+        elif values == 'branch_order':
+            values = np.repeat(_accumulate(_parent_indices(sections), np.ones(len(sections))),
+                               sizes)
+        else:
+            lengths = np.linalg.norm(np.diff(points[:, COLS.XYZ].astype(float), axis=0), axis=1)
+            # no length between the last point of a section and the first point of the next one
+            lengths[offsets[1:] - 1] = 0
+            local = np.concatenate([[0], np.cumsum(lengths)])
+            local -= np.repeat(local[offsets], sizes)
+            starts = _accumulate(_parent_indices(sections), local[offsets + sizes - 1])
+            values = local + np.repeat(starts, sizes)
+
+    values = np.asarray(values, dtype=float)
+    if values.shape != (sizes.sum(),):
+        raise ValueError(f'expected {sizes.sum()} values (one per point), got {values.shape}')
+    return sections, np.split(values, offsets[1:])
+
+
+class SectionIndex:
+    '''A preorder index of the sections of a morphology
+
+    The sections are numbered in the iter_sections order, which is a preorder traversal of each
+    neurite, so that the subtree of the section at position i is the contiguous range
+    [i, stops[i]). Selections of sections and subtrees are then boolean masks computed with
+    array operations, without recursion.
+    '''
+    def __init__(self, neuron):
+        self.sections = list(iter_sections(neuron))
+        parents = _parent_indices(self.sections)
+        subtree_sizes = np.ones(len(self.sections), dtype=int)
+        for i in range(len(self.sections) - 1, -1, -1):
+            if parents[i] >= 0:
+                subtree_sizes[parents[i]] += subtree_sizes[i]
+        self.stops = np.arange(len(self.sections)) + subtree_sizes
+
+        ids = np.array([section.id for section in self.sections], dtype=int)
+        self._positions = np.full(max(ids, default=-1) + 1, -1, dtype=int)
+        self._positions[ids] = np.arange(len(ids))
+
+        roots = np.flatnonzero(np.array(parents) < 0)
+        self.neurite_indices = np.repeat(np.arange(len(roots)), np.diff(np.append(roots, len(ids))))
+        self.nb_segments = np.array([len(section.points) - 1 for section in self.sections])
+
+    def positions(self, selection):
+        '''Return the sorted positions of the selected sections
+
+        Args:
+            selection: a predicate called with each section, a boolean mask over the sections
+                or an iterable of section ids or NeuroM sections
+
+        Raises:
+            KeyError: if a section id is not in the morphology
+        '''
+        if callable(selection):
+            return np.array([i for i, section in enumerate(self.sections) if selection(section)],
+                            dtype=int)
+        selection = np.asarray([getattr(item, 'id', item) for item in selection])
+        if selection.dtype == bool:
+            return np.flatnonzero(selection)
+        ids = selection.astype(int)
+        positions = self._positions[np.clip(ids, 0, len(self._positions) - 1)]
+        invalid = (ids < 0) | (ids >= len(self._positions)) | (positions < 0)
+        if invalid.any():
+            raise KeyError(f'unknown section ids {ids[invalid].tolist()}')
+        return np.unique(positions)
+
+    def subtree_mask(self, positions):
+        '''Return the boolean mask of the sections in the subtrees of the given positions'''
+        delta = np.zeros(len(self.sections) + 1, dtype=int)
+        np.add.at(delta, positions, 1)
+        np.add.at(delta, self.stops[positions], -1)
+        return np.cumsum(delta[:-1]) > 0
@@ -2,22 +2,43 @@
 Define the public 'plot' function to be used to draw
 morphology using plotly
 '''
+# pylint: disable=too-many-lines
+import hashlib
 import os
 from collections import defaultdict
-from itertools import chain, repeat
+from itertools import chain
+from pathlib import Path
 
 import numpy as np
 import plotly.graph_objs as go
-from plotly.offline import init_notebook_mode, iplot, plot as plot_
+from plotly.colors import sample_colorscale
 
-from neurom import COLS, iter_neurites, iter_sections, iter_segments
-from neurom.view.matplotlib_impl import TREE_COLOR
+from neurom import COLS, iter_neurites, iter_sections, load_morphology
 
-from plotly_helper.helper import PlotlyHelperPlane
+from plotly_helper.archive import ArchivedMorphology, load_member, member_digest, split_member
+from plotly_helper.cache import file_digest
+from plotly_helper.colors import tree_color
+from plotly_helper.decimation import simplify
+from plotly_helper.helper import (PlotlyHelperPlane, discrete_colorscale, encode_typed_arrays,
+                                  get_include_plotlyjs, write_fig_html)
+from plotly_helper.meshes import (MAX_SUBDIVISIONS, batch_meshes, icosphere, tube_mesh,
+                                  tube_resolution, unit_sphere_grid)
+from plotly_helper.morphology import SectionIndex, point_values
+from plotly_helper.profiling import profile_stage, trace_counts
+from plotly_helper.raster import Raster, encode_png
+from plotly_helper.region import crop
 from plotly_helper.shapes import circle
 
 NEURON_NAME = 'neuron'
 SOMA_NAME = 'soma'
+# the number of colors used to draw scalar values with the single color 2D lines
+NB_COLOR_LEVELS = 32
+# the default triangle budget of the tubes of a morphology
+DEFAULT_MAX_TRIANGLES = 500000
+# the size of the view in pixels used to drop the sub-pixel segments of the tubes
+VIEW_PIXELS = 1000
+# the default simplification tolerance of the rasterized sections, in pixels
+IMAGE_TOLERANCE = 0.25
 
 
 def _neurite_name(neurite, prefix, names):
@@ -26,94 +47,523 @@ def _neurite_name(neurite, prefix, names):
     return f'{prefix} {name} {names[neurite.type]}'
 
 
-# pylint: disable=too-many-locals
-def _make_trace2d(neuron, plane, prefix='', opacity=1., visible=True, style=None, line_width=2):
-    '''Create the trace to be plotted'''
-    names = defaultdict(int)
-    lines = []
-    for neurite in iter_neurites(neuron):
-        names[neurite.type] += 1
+def _segment_coords(section_points):
+    '''Return the NaN separated coordinates of all the segments of a list of sections
 
-        try:
-            neurite_color = style[neurite]['color']
-        except KeyError:
-            neurite_color = TREE_COLOR.get(neurite.root_node.type, 'black')
+    Args:
+        section_points (list): the (N_i, D) point arrays of the sections
 
-        name = _neurite_name(neurite, prefix, names)
+    Returns:
+        a tuple (coords, nb_segments) where coords is a (3 * nb_segments.sum(), D) float array
+        containing for each segment its first point, its last point and a NaN row (used by plotly
+        to split lines) and nb_segments is the number of segments of each section
+    '''
+    sizes = np.array([len(points) for points in section_points], dtype=int)
+    # there are no sections in a neurite completely outside of the cropping region
+    points = np.concatenate(section_points) if section_points else np.empty((0, 3))
+    is_start = np.ones(len(points), dtype=bool)
+    is_start[np.cumsum(sizes) - 1] = False
+    starts = np.flatnonzero(is_start)
 
-        for section in iter_sections(neurite):
-            segs = [(s[0][COLS.XYZ], s[1][COLS.XYZ]) for s in iter_segments(section)]
+    coords = np.full((len(starts), 3, points.shape[1]), np.nan,
+                     dtype=np.result_type(points.dtype, np.float32))
+    coords[:, 0] = points[starts]
+    coords[:, 1] = points[starts + 1]
+    return coords.reshape(-1, points.shape[1]), np.maximum(sizes - 1, 0)
 
-            try:
-                colors = style[section]['color']
-            except KeyError:
-                colors = neurite_color
 
-            coords = {}
-            for i, coord in enumerate('xyz'):
-                coords[coord] = list(chain.from_iterable((p1[i], p2[i], None) for p1, p2 in segs))
+def _segment_color_ids(sections, nb_segments, style, palette):
+    '''Return the palette index of each segment of the sections
 
-            coords = {'x': coords[plane[0]], 'y': coords[plane[1]]}
-            lines.append(go.Scattergl(name=name, visible=visible, opacity=opacity,
-                                      showlegend=False,
-                                      line={'color': colors, 'width': line_width},
-                                      mode='lines',
-                                      **coords))
-    return lines
+    Args:
+        sections (list): the sections, in the same order as nb_segments
+        nb_segments (np.array): the number of segments of each section
+        style (dict): the style dictionary as filled by NeuronBuilder.color_section
+        palette (dict): a color -> index mapping updated in place with the new colors. The
+            index 0 is the neurite default color.
+    '''
+    color_ids = np.zeros(nb_segments.sum(), dtype=np.int32)
+    offsets = np.cumsum(nb_segments) - nb_segments
+    for section, offset, nb_segment in zip(sections, offsets, nb_segments):
+        section_style = style.get(section)
+        if section_style is None:
+            continue
+        start, stop, _ = section_style['range'].indices(nb_segment)
+        color = palette.setdefault(section_style['color'], len(palette))
+        color_ids[offset + start: offset + max(start, stop)] = color
+    return color_ids
+
+
+def _neurite_color(neurite, style):
+    '''The default color of a neurite'''
+    neurite_style = style.get(neurite, {}) if style else {}
+    return neurite_style.get('color', tree_color(neurite.root_node.type))
 
 
 # pylint: disable=too-many-locals
-def _make_trace(neuron, plane, prefix='', opacity=1., visible=True, style=None, line_width=2):
-    '''Create the trace to be plotted'''
+def _crop_sections(sections, style, section_values, region):
+    '''Split the sections into their pieces inside a region (see region.crop)
+
+    The pieces are identified by (section, index of their first segment) keys, which replace the
+    sections in the returned style. The styled ranges are remapped onto the segments of the
+    pieces and the values are interpolated at the region boundary.
+
+    Returns:
+        a tuple (pieces, piece_points, style, piece_values) where piece_points are the
+        (N, XYZR) points of the pieces
+    '''
+    polylines = [section.points[:, :COLS.R + 1] for section in sections]
+    if section_values is not None:
+        polylines = [np.column_stack([points, values])
+                     for points, values in zip(polylines, section_values)]
+    section_ids, first_segments, piece_points = crop(polylines, region)
+
+    pieces, piece_style = [], {}
+    for section_id, first, points in zip(section_ids.tolist(), first_segments.tolist(),
+                                         piece_points):
+        section = sections[section_id]
+        pieces.append((section, first))
+        section_style = style.get(section)
+        if section_style is not None:
+            start, stop, _ = section_style['range'].indices(len(section.points) - 1)
+            start, stop = np.clip([start - first, max(start, stop) - first], 0, len(points) - 1)
+            piece_style[pieces[-1]] = dict(section_style, range=slice(int(start), int(stop)))
+    piece_values = (None if section_values is None else
+                    [points[:, COLS.R + 1] for points in piece_points])
+    return pieces, piece_points, piece_style, piece_values
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def _neurite_sections(neurite, columns, style, tolerance=None, coloring=None, region=None):
+    '''Return the sections of a neurite with their point arrays, their style and their values
+
+    Args:
+        neurite: a NeuroM neurite
+        columns (list): the point columns to keep
+        style (dict): the style dictionary as filled by NeuronBuilder.color_section
+        tolerance (float): if not None, the section polylines are simplified with this tolerance
+            (see decimation.simplify). The boundaries of the styled ranges are kept and the
+            ranges are remapped onto the kept points.
+        coloring (dict): None or the scalar coloring as set by NeuronBuilder.color_by
+        region: None or a region.Box or region.Sphere. The sections are cropped to the region
+            before being simplified and the sections are replaced by the keys of their pieces
+            inside the region (see _crop_sections).
+
+    Returns:
+        a tuple (sections, section_points, style, section_values) where section_values is the
+        list of the per point values of the sections or None if coloring is None
+    '''
+    sections = list(iter_sections(neurite))
+    section_values = (None if coloring is None else
+                      [coloring['values'][section] for section in sections])
+    if region is None:
+        section_points = [section.points[:, columns] for section in sections]
+    else:
+        sections, section_points, style, section_values = _crop_sections(
+            sections, style, section_values, region)
+        section_points = [points[:, columns] for points in section_points]
+    return _simplify_sections(sections, section_points, style, section_values, tolerance)
+
+
+def _simplify_sections(sections, section_points, style, section_values, tolerance=None):
+    '''Simplify the section polylines with a tolerance, keeping the styled range boundaries
+
+    All the sections are simplified by a single decimation.simplify call, whatever their
+    neurites.
+
+    Returns:
+        the (sections, section_points, style, section_values) tuple of _neurite_sections
+    '''
+    if tolerance is None or not sections:
+        return sections, section_points, style, section_values
+
+    bounds = []
+    for section, points in zip(sections, section_points):
+        section_style = style.get(section)
+        if section_style is None:
+            bounds.append([])
+        else:
+            start, stop, _ = section_style['range'].indices(len(points) - 1)
+            bounds.append([start, max(start, stop)])
+
+    kept = simplify(section_points, tolerance, bounds)
+    decimated_style = {}
+    for section, indices, section_bounds in zip(sections, kept, bounds):
+        if section_bounds:
+            start, stop = np.searchsorted(indices, section_bounds)
+            decimated_style[section] = dict(style[section], range=slice(int(start), int(stop)))
+    if section_values is not None:
+        section_values = [values[indices] for values, indices in zip(section_values, kept)]
+    return (sections, [points[indices] for points, indices in zip(section_points, kept)],
+            decimated_style, section_values)
+
+
+def _vertex_values(section_values):
+    '''Return the value of each vertex of the NaN separated segments (see _segment_coords)
+
+    The NaN rows take the value of the previous vertex so that the array can be used as colors.
+    '''
+    values, _ = _segment_coords([values[:, np.newaxis] for values in section_values])
+    values = values[:, 0]
+    values[2::3] = values[1::3]
+    return values
+
+
+def _color_levels(values, coloring):
+    '''Quantize values into NB_COLOR_LEVELS levels of the coloring colorscale
+
+    Returns:
+        a tuple (levels, colors) where levels is the level index of each value and colors the
+        list of the colors of the levels
+    '''
+    cmin, cmax = coloring['cmin'], coloring['cmax']
+    scaled = (np.asarray(values, dtype=float) - cmin) / ((cmax - cmin) or 1.)
+    levels = np.clip(np.nan_to_num(scaled * NB_COLOR_LEVELS), 0, NB_COLOR_LEVELS - 1).astype(int)
+    colors = sample_colorscale(coloring['colorscale'],
+                               (np.arange(NB_COLOR_LEVELS) + 0.5) / NB_COLOR_LEVELS)
+    return levels, colors
+
+
+def _colorbar_trace(coloring):
+    '''An empty Scattergl only used to show the colorbar of the coloring in 2D'''
+    return go.Scattergl(x=[None], y=[None], mode='markers', showlegend=False, hoverinfo='skip',
+                        marker={'color': [coloring['cmin']], 'colorscale': coloring['colorscale'],
+                                'cmin': coloring['cmin'], 'cmax': coloring['cmax'],
+                                'showscale': True,
+                                'colorbar': {'title': coloring.get('title') or ''}})
+
+
+def _neurite_names(neurites, prefix=''):
+    '''The legend names of a list of neurites'''
     names = defaultdict(int)
-    lines = []
-    for neurite in iter_neurites(neuron):
+    result = []
+    for neurite in neurites:
         names[neurite.type] += 1
+        result.append(_neurite_name(neurite, prefix, names))
+    return result
+
+
+# pylint: disable=too-many-arguments
+def _neurite_trace(neurite, name, plane, style, line_width=2, tolerance=None, coloring=None,
+                   region=None, **kwargs):
+    '''Create the Scatter3d of a neurite
+
+    All the segments of the neurite are gathered in a single NaN separated array. The vertex
+    colors are numbers mapped through a colorscale: either the scalar values of the coloring or
+    the palette indexes of the per segment colors with a discrete colorscale.
+
+    All other kwargs are passed to go.Scatter3d
+    '''
+    sections, section_points, section_style, section_values = _neurite_sections(
+        neurite, COLS.XYZ, style, tolerance, coloring, region)
+    coords, nb_segments = _segment_coords(section_points)
+    for i, coord in enumerate('xyz'):
+        if coord not in plane:
+            coords[~np.isnan(coords[:, i]), i] = 0
 
-        coords = {'x': [], 'y': [], 'z': []}
-        colors = []
+    line = {'width': line_width}
+    if coloring is not None:
+        line.update(color=_vertex_values(section_values), colorscale=coloring['colorscale'],
+                    cmin=coloring['cmin'], cmax=coloring['cmax'],
+                    showscale=coloring.get('showscale', False))
+        if coloring.get('showscale'):
+            line['colorbar'] = {'title': coloring.get('title') or ''}
+    else:
+        palette = {_neurite_color(neurite, style): 0}
+        color_ids = _segment_color_ids(sections, nb_segments, section_style, palette)
+        if len(palette) == 1:
+            line['color'] = next(iter(palette))
+        else:
+            line.update(color=np.repeat(color_ids, 3), **discrete_colorscale(list(palette)))
+
+    return go.Scatter3d(name=name, showlegend=False, line=line, mode='lines',
+                        x=coords[:, 0], y=coords[:, 1], z=coords[:, 2], **kwargs)
 
-        try:
-            default_color = style[neurite]['color']
-        except KeyError:
-            default_color = TREE_COLOR.get(neurite.root_node.type, 'black')
 
-        for section in iter_sections(neurite):
-            segs = [(s[0][COLS.XYZ], s[1][COLS.XYZ]) for s in iter_segments(section)]
+# pylint: disable=too-many-arguments
+def _neurite_traces2d(neurite, name, plane, style, line_width=2, tolerance=None, coloring=None,
+                      region=None, **kwargs):
+    '''Create one Scattergl per section of a neurite
 
-            section_style = style.get(
-                section, {'range': slice(0, len(segs)), 'color': default_color})
-            range_ = section_style['range']
-            colors += list(repeat(default_color, 3 * range_.start))
-            colors += list(repeat(section_style['color'], 3 * (range_.stop - range_.start)))
-            colors += list(repeat(default_color, 3 * (len(segs) - range_.stop)))
+    With a coloring, each section is drawn with the color of its mean value.
 
-            for i, coord in enumerate('xyz'):
-                coords[coord] += list(chain.from_iterable((p1[i], p2[i], None) for p1, p2 in segs)
-                                      if coord in plane else
-                                      chain.from_iterable((0, 0, None) for _ in segs))
+    All other kwargs are passed to go.Scattergl
+    '''
+    neurite_color = _neurite_color(neurite, style)
+    lines = []
+    sections, section_points, section_style, section_values = _neurite_sections(
+        neurite, COLS.XYZ, style, tolerance, coloring, region)
+    if coloring is not None:
+        levels, level_colors = _color_levels([values.mean() for values in section_values],
+                                             coloring)
+        section_colors = [level_colors[level] for level in levels]
+    columns = ['xyz'.index(axis) for axis in plane[:2]]
+    for i, (section, points) in enumerate(zip(sections, section_points)):
+        if coloring is not None:
+            colors = section_colors[i]
+        else:
+            colors = section_style.get(section, {}).get('color', neurite_color)
 
-        lines.append(go.Scatter3d(name=_neurite_name(neurite, prefix, names),
-                                  showlegend=False,
-                                  visible=visible, opacity=opacity,
+        # float arrays with NaN separators, which can be encoded as typed arrays
+        coords = _segment_coords([points[:, columns]])[0].reshape(-1, 2)
+        lines.append(go.Scattergl(name=name, showlegend=False,
                                   line={'color': colors, 'width': line_width},
                                   mode='lines',
-                                  **coords))
+                                  x=coords[:, 0], y=coords[:, 1], **kwargs))
+    if coloring is not None and coloring.get('showscale'):
+        lines.append(_colorbar_trace(coloring))
+    return lines
+
+
+def _neurite_segments2d(neurite, plane, style, tolerance=None, coloring=None, region=None):
+    '''Return the segments of a neurite projected on a plane, grouped by color
+
+    Returns:
+        a tuple (coords, color_ids, colors) where coords is the (N, 3, 2) array of the start
+        point, the end point and the NaN separator of each segment (see _segment_coords),
+        color_ids the index in colors of the color of each segment. With a coloring, the colors
+        are the levels of the mean values of the segments (see _color_levels).
+    '''
+    columns = ['xyz'.index(axis) for axis in plane[:2]]
+    return _color_segments2d(neurite, style, coloring, *_neurite_sections(
+        neurite, columns, style, tolerance, coloring, region))
+
+
+# pylint: disable=too-many-arguments
+def _color_segments2d(neurite, style, coloring, sections, section_points, section_style,
+                      section_values):
+    '''Return the _neurite_segments2d tuple of the extracted sections of a neurite'''
+    coords, nb_segments = _segment_coords(section_points)
+    if coloring is not None:
+        values = _vertex_values(section_values).reshape(-1, 3)[:, :2].mean(axis=1)
+        color_ids, colors = _color_levels(values, coloring)
+    else:
+        palette = {_neurite_color(neurite, style): 0}
+        color_ids = _segment_color_ids(sections, nb_segments, section_style, palette)
+        colors = list(palette)
+    return coords.reshape(-1, 3, 2), color_ids, colors
+
+
+# pylint: disable=too-many-arguments
+def _merged_neurite_traces2d(neurite, name, plane, style, line_width=2, tolerance=None,
+                             coloring=None, region=None, **kwargs):
+    '''Create one Scattergl per color of a neurite
+
+    Scattergl lines only support a single color, so the segments of the neurite are grouped by
+    color and a single NaN separated trace is created per group. Unlike the per section traces,
+    the 'range' of the section styles is honored. With a coloring, the segments are grouped by
+    the level of their mean value (see _color_levels).
+
+    All other kwargs are passed to go.Scattergl
+    '''
+    coords, color_ids, colors = _neurite_segments2d(neurite, plane, style, tolerance, coloring,
+                                                    region)
+    lines = []
+    for color_id, color in enumerate(colors):
+        group = coords[color_ids == color_id].reshape(-1, 2)
+        if not len(group):  # pylint: disable=len-as-condition
+            continue
+        lines.append(go.Scattergl(name=name, showlegend=False,
+                                  line={'color': color, 'width': line_width},
+                                  mode='lines',
+                                  x=group[:, 0], y=group[:, 1], **kwargs))
+    if coloring is not None and coloring.get('showscale'):
+        lines.append(_colorbar_trace(coloring))
     return lines
 
 
-def _make_soma(neuron):
-    ''' Create a 3d surface representing the soma '''
-    theta = np.linspace(0, 2 * np.pi, 100)
-    phi = np.linspace(0, np.pi, 100)
+def _segment_sizes(segments):
+    '''Return the lengths and the sizes (max of length and diameter) of (N, 2, XYZR) segments'''
+    lengths = np.linalg.norm(segments[:, 1, COLS.XYZ] - segments[:, 0, COLS.XYZ], axis=1)
+    return lengths, np.maximum(lengths, 2 * segments[:, :, COLS.R].max(axis=1))
+
+
+def _tube_segments(neurite, style, tolerance=None, coloring=None, region=None):
+    '''Return the segments of a neurite meshed by _neurite_tubes
+
+    The sections are extracted as the lines (see _neurite_sections): cropped to the region and
+    simplified with the tolerance. The null length segments, which have no tube, are dropped.
+
+    Returns:
+        a dict with the (N, 2, XYZR) 'segments', their 'sizes' (see _segment_sizes), the
+        'indices' of the segments among all the segments of the sections and the 'sections',
+        'nb_segments', 'style' and 'values' of the sections used to color them
+    '''
+    sections, section_points, section_style, section_values = _neurite_sections(
+        neurite, [COLS.X, COLS.Y, COLS.Z, COLS.R], style, tolerance, coloring, region)
+    coords, nb_segments = _segment_coords(section_points)
+    segments = coords.reshape(-1, 3, COLS.R + 1)[:, :2]
+    lengths, sizes = _segment_sizes(segments)
+    indices = np.flatnonzero(lengths > 0)
+    return {'segments': segments[indices], 'sizes': sizes[indices], 'indices': indices,
+            'sections': sections, 'nb_segments': nb_segments, 'style': section_style,
+            'values': section_values}
+
+
+def _tube_resolution(tube_segments, max_triangles):
+    '''Return the number of sides of the tubes and the smallest drawn segment of a morphology
+
+    Args:
+        tube_segments (list): the _tube_segments of all the neurites, so the budget is computed
+            from the segments which are actually meshed
+        max_triangles (int): the triangle budget of the whole morphology
+
+    The segments smaller than a pixel, for a view of VIEW_PIXELS spanning all the segments,
+    are dropped and the ring resolution is adapted to fit max_triangles (see
+    meshes.tube_resolution).
+    '''
+    segments = np.concatenate([np.empty((0, 2, COLS.R + 1))] +
+                              [neurite_segments['segments'] for neurite_segments in tube_segments])
+    if not len(segments):  # pylint: disable=len-as-condition
+        return tube_resolution(np.zeros(0), max_triangles, 0.)
+    points = segments[:, :, COLS.XYZ].reshape(-1, 3)
+    pixel = np.linalg.norm(points.max(axis=0) - points.min(axis=0)) / VIEW_PIXELS
+    sizes = np.concatenate([neurite_segments['sizes'] for neurite_segments in tube_segments])
+    return tube_resolution(sizes, max_triangles, pixel)
+
+
+# pylint: disable=too-many-arguments
+def _neurite_tubes(neurite, name, style, tube_segments, coloring=None, nb_sides=8, min_size=0.,
+                   **kwargs):
+    '''Create the Mesh3d of the frusta of all the segments of a neurite
+
+    Args:
+        tube_segments (dict): the segments of the neurite returned by _tube_segments
+        nb_sides (int): the number of sides of the frusta
+        min_size (float): the segments whose length and diameter are smaller are not drawn
+
+    The vertex colors are given as intensities: either the scalar values of the coloring or the
+    palette indexes of the segments with a discrete colorscale.
+
+    All other kwargs are passed to go.Mesh3d
+    '''
+    drawn = tube_segments['sizes'] >= min_size
+    segments = tube_segments['segments'][drawn]
+    kept = tube_segments['indices'][drawn]
+    vertices, triangles = tube_mesh(segments[:, 0, COLS.XYZ], segments[:, 1, COLS.XYZ],
+                                    segments[:, 0, COLS.R], segments[:, 1, COLS.R], nb_sides)
+
+    colors = {}
+    if coloring is not None:
+        values = _vertex_values(tube_segments['values']).reshape(-1, 3)[kept, :2]
+        colors.update(intensity=np.repeat(values, nb_sides, axis=1).ravel(),
+                      colorscale=coloring['colorscale'], cmin=coloring['cmin'],
+                      cmax=coloring['cmax'], showscale=coloring.get('showscale', False))
+        if coloring.get('showscale'):
+            colors['colorbar'] = {'title': coloring.get('title') or ''}
+    else:
+        palette = {_neurite_color(neurite, style): 0}
+        color_ids = _segment_color_ids(tube_segments['sections'], tube_segments['nb_segments'],
+                                       tube_segments['style'], palette)
+        if len(palette) == 1:
+            colors['color'] = next(iter(palette))
+        else:
+            colors.update(intensity=np.repeat(color_ids[kept], 2 * nb_sides), showscale=False,
+                          **discrete_colorscale(list(palette)))
+
+    return go.Mesh3d(name=name, showlegend=False,
+                     x=vertices[:, 0], y=vertices[:, 1], z=vertices[:, 2],
+                     i=triangles[:, 0], j=triangles[:, 1], k=triangles[:, 2],
+                     **colors, **kwargs)
+
+
+def _neurite_coloring(coloring, index):
+    '''The coloring of the index-th neurite: only the first one shows the colorbar'''
+    return None if coloring is None else dict(coloring, showscale=index == 0)
+
+
+# pylint: disable=too-many-arguments
+def _make_trace(neuron, plane, prefix='', opacity=1., visible=True, style=None, line_width=2,
+                tolerance=None, coloring=None, region=None):
+    '''Create the trace to be plotted
+
+    One Scatter3d is created per neurite (see _neurite_trace).
+
+    Args:
+        tolerance (float): if not None, the sections are simplified with this tolerance
+        coloring (dict): None or the scalar coloring as set by NeuronBuilder.color_by
+        region: None or the region.Box or region.Sphere the neurites are cropped to
+    '''
+    style = style if style is not None else {}
+    neurites = list(iter_neurites(neuron))
+    return [_neurite_trace(neurite, name, plane, style, line_width, tolerance,
+                           _neurite_coloring(coloring, i), region, opacity=opacity,
+                           visible=visible)
+            for i, (neurite, name) in enumerate(zip(neurites, _neurite_names(neurites, prefix)))]
+
+
+# pylint: disable=too-many-arguments
+def _make_trace2d(neuron, plane, prefix='', opacity=1., visible=True, style=None, line_width=2,
+                  merge=False, tolerance=None, coloring=None, region=None):
+    '''Create the trace to be plotted
+
+    Args:
+        merge (bool): if True, create one Scattergl per neurite and color instead of one per
+            section (see _merged_neurite_traces2d)
+        tolerance (float): if not None, the sections are simplified with this tolerance
+        coloring (dict): None or the scalar coloring as set by NeuronBuilder.color_by
+        region: None or the region.Box or region.Sphere the neurites are cropped to
+    '''
+    style = style if style is not None else {}
+    make_traces = _merged_neurite_traces2d if merge else _neurite_traces2d
+    neurites = list(iter_neurites(neuron))
+    return list(chain.from_iterable(
+        make_traces(neurite, name, plane, style, line_width, tolerance,
+                    _neurite_coloring(coloring, i), region, opacity=opacity, visible=visible)
+        for i, (neurite, name) in enumerate(zip(neurites, _neurite_names(neurites, prefix)))))
+
+
+# pylint: disable=too-many-arguments
+def _make_tubes(neuron, prefix='', opacity=1., visible=True, style=None, tolerance=None,
+                coloring=None, max_triangles=DEFAULT_MAX_TRIANGLES, region=None):
+    '''Create one Mesh3d of tubes following the point radii per neurite
+
+    Args:
+        tolerance (float): if not None, the sections are simplified with this tolerance
+        coloring (dict): None or the scalar coloring as set by NeuronBuilder.color_by
+        max_triangles (int): the triangle budget of the whole morphology
+        region: None or the region.Box or region.Sphere the neurites are cropped to
+    '''
+    style = style if style is not None else {}
+    neurites = list(iter_neurites(neuron))
+    tube_segments = [_tube_segments(neurite, style, tolerance, coloring, region)
+                     for neurite in neurites]
+    nb_sides, min_size = _tube_resolution(tube_segments, max_triangles)
+    return [_neurite_tubes(neurite, name, style, neurite_segments, _neurite_coloring(coloring, i),
+                           nb_sides, min_size, opacity=opacity, visible=visible)
+            for i, (neurite, name, neurite_segments) in enumerate(
+                zip(neurites, _neurite_names(neurites, prefix), tube_segments))]
+
+
+def _make_soma(neuron, resolution=100, mesh='surface', subdivisions=2):
+    ''' Create a 3d surface representing the soma
+
+    Args:
+        neuron: a NeuroM morphology
+        resolution (int): the number of latitudes and longitudes of the 'surface' mesh
+        mesh (str): 'surface' for a latitude/longitude go.Surface or 'icosphere' for a low-poly
+            go.Mesh3d
+        subdivisions (int): the number of subdivisions of the 'icosphere' mesh
+    '''
     soma_r = neuron.soma.radius
-    soma_z = np.outer(np.ones(100), np.cos(phi)) * soma_r + neuron.soma.center[2]
+    center = neuron.soma.center[COLS.XYZ]
+    if mesh == 'icosphere':
+        vertices, triangles = batch_meshes(*icosphere(subdivisions), center, soma_r)
+        return go.Mesh3d(name=SOMA_NAME, color='black',
+                         x=vertices[:, 0], y=vertices[:, 1], z=vertices[:, 2],
+                         i=triangles[:, 0], j=triangles[:, 1], k=triangles[:, 2])
+    if mesh != 'surface':
+        raise ValueError(f'unknown soma mesh {mesh}, must be "surface" or "icosphere"')
+
+    unit_x, unit_y, unit_z = unit_sphere_grid(resolution)
+    soma_z = unit_z * soma_r + center[2]
     return go.Surface(
         name=SOMA_NAME,
-        x=(np.outer(np.cos(theta), np.sin(phi)) * soma_r + neuron.soma.center[0]),
-        y=(np.outer(np.sin(theta), np.sin(phi)) * soma_r + neuron.soma.center[1]),
+        x=unit_x * soma_r + center[0],
+        y=unit_y * soma_r + center[1],
         z=soma_z,
-        cauto=False, surfacecolor=['black'] * len(soma_z), showscale=False,
+        cauto=False, cmin=0, cmax=1, colorscale=[[0, 'black'], [1, 'black']],
+        surfacecolor=np.zeros_like(soma_z), showscale=False,
     )
 
 
@@ -125,15 +575,310 @@ def _make_soma2d(neuron, plane):
                   color='rgba(50, 171, 96, 1)')
 
 
-class NeuronBuilder:
+def _soma_in_region(neuron, region):
+    '''Whether or not the soma is drawn: it is dropped if its center is outside the region'''
+    return region is None or bool(region.contains(neuron.soma.center[COLS.XYZ]))
+
+
+def _section_arrays(neuron):
+    '''Return the (N, 3) points of all the sections and the (S + 1,) offsets of the points of
+    the sections, indexed by the section ids, or None
+
+    They are read at once from an archived or an immutable morphio morphology, which is much
+    faster than going through section.points. None is returned for the other morphologies.
+    '''
+    if isinstance(neuron, ArchivedMorphology):
+        return neuron.xyz, neuron.section_offsets
+    morphology = neuron.to_morphio()
+    if hasattr(morphology, 'section_offsets'):
+        return morphology.points, morphology.section_offsets
+    return None
+
+
+def _all_points(neuron):
+    '''Return the (N, 3) points of all the sections, read at once when possible'''
+    arrays = _section_arrays(neuron)
+    return neuron.points[:, COLS.XYZ] if arrays is None else arrays[0]
+
+
+def _neurites_segments2d(neuron, plane, style, tolerance=None, coloring=None, region=None):
+    '''Return the list of the _neurite_segments2d tuples of all the neurites of a neuron
+
+    Without region, the section points are sliced from the arrays of _section_arrays and the
+    sections of all the neurites are simplified at once, instead of reading and simplifying
+    each section of each neurite in turn.
+    '''
+    neurites = list(iter_neurites(neuron))
+    arrays = None if region is not None else _section_arrays(neuron)
+    if arrays is None:
+        return [_neurite_segments2d(neurite, plane, style, tolerance,
+                                    _neurite_coloring(coloring, i), region)
+                for i, neurite in enumerate(neurites)]
+
+    points, offsets = arrays
+    projected = np.asarray(points)[:, ['xyz'.index(axis) for axis in plane[:2]]]
+    neurite_sections = [list(iter_sections(neurite)) for neurite in neurites]
+    sections = list(chain.from_iterable(neurite_sections))
+    ids = np.fromiter((section.id for section in sections), dtype=int, count=len(sections))
+    section_points = [projected[start:stop]
+                      for start, stop in zip(offsets[ids].tolist(), offsets[ids + 1].tolist())]
+    section_values = (None if coloring is None else
+                      [coloring['values'][section] for section in sections])
+    sections, section_points, section_style, section_values = _simplify_sections(
+        sections, section_points, style, section_values, tolerance)
+
+    segments, stop = [], 0
+    for i, (neurite, count) in enumerate(zip(neurites, map(len, neurite_sections))):
+        start, stop = stop, stop + count
+        segments.append(_color_segments2d(
+            neurite, style, _neurite_coloring(coloring, i), sections[start:stop],
+            section_points[start:stop], section_style,
+            None if section_values is None else section_values[start:stop]))
+    return segments
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def _image_segments(neuron, plane, width=256, height=None, style=None, tolerance=None,
+                    coloring=None, region=None):
+    '''Return the projected and simplified segments of the image drawn by _make_image
+
+    They only depend on the image size through the default tolerance, so they are what is worth
+    caching: drawing them is cheap compared to loading and simplifying the morphology.
+
+    Returns:
+        a dict with the ((xmin, ymin), (xmax, ymax)) 'bounds' of the drawing, the 'lines' list
+        of the {'color', 'starts', 'ends'} segments of each color of each neurite and the 'soma'
+        shape or None
+    '''
+    style = style if style is not None else {}
+    soma = _make_soma2d(neuron, plane) if _soma_in_region(neuron, region) else None
+    columns = ['xyz'.index(axis) for axis in plane[:2]]
+    points = _all_points(neuron)
+    if region is not None:
+        points = np.clip(points, *region.bounds())
+    corners = points[:, columns]
+    if soma is not None:
+        corners = np.concatenate([[[soma['x0'], soma['y0']], [soma['x1'], soma['y1']]], corners])
+    bounds = np.array([corners.min(axis=0), corners.max(axis=0)], dtype=float)
+    if tolerance is None:
+        # at the image resolution, most segments are shorter than a pixel
+        tolerance = IMAGE_TOLERANCE / Raster.fit_scale(width, height or width, bounds)
+
+    lines = []
+    for coords, color_ids, colors in _neurites_segments2d(neuron, plane, style, tolerance,
+                                                          coloring, region):
+        for color_id, color in enumerate(colors):
+            group = coords[color_ids == color_id]
+            if len(group):
+                lines.append({'color': color, 'starts': group[:, 0], 'ends': group[:, 1]})
+    return {'bounds': bounds, 'lines': lines, 'soma': soma}
+
+
+def _draw_image(segments, width=256, height=None, line_width=2, background='white'):
+    '''Rasterize the segments returned by _image_segments'''
+    raster = Raster(width, height or width, segments['bounds'], background)
+    for line in segments['lines']:
+        raster.draw_lines(line['starts'], line['ends'], line['color'], line_width)
+    if segments['soma'] is not None:
+        raster.draw_shape(segments['soma'])
+    return raster.to_uint8()
+
+
+# pylint: disable=too-many-arguments
+def _make_image(neuron, plane, width=256, height=None, style=None, line_width=2, tolerance=None,
+                coloring=None, background='white', region=None):
+    '''Rasterize the projection of a morphology with its soma (see raster.Raster)
+
+    The segments are the same as the ones of the merged 2D traces (see _neurite_segments2d), so
+    the section styles and the coloring are honored. The colorbar of the coloring is not drawn.
+
+    Args:
+        width (int): the image width in pixels
+        height (int): the image height in pixels (defaults to width)
+        tolerance (float): the sections are simplified with this tolerance, which defaults to
+            IMAGE_TOLERANCE pixels
+        background (str): the background plotly color
+        region: None or the region.Box or region.Sphere the neurites are cropped to. The image
+            then spans the part of the morphology inside the bounding box of the region.
+
+    Returns:
+        an (height, width, 3) uint8 array
+    '''
+    segments = _image_segments(neuron, plane, width, height, style, tolerance, coloring, region)
+    return _draw_image(segments, width, height, line_width, background)
+
+
+def plot_(*args, **kwargs):
+    '''plotly.offline.plot, which is only imported when a figure is plotted'''
+    import plotly.offline  # pylint: disable=import-outside-toplevel
+    return plotly.offline.plot(*args, **kwargs)
+
+
+def _html_filename(helper, filename=None):
+    '''The html file written by _plot_helper'''
+    return filename or os.path.join('/tmp', helper.title + '.html')
+
+
+# pylint: disable=keyword-arg-before-vararg
+# pylint: disable=too-many-arguments
+def _plot_helper(helper, fig, inline=False, filename=None, *args, typed_arrays=None,
+                 shared_plotlyjs=None, streaming=False, **kwargs):
+    '''Plot the figure built by a PlotlyHelperPlane
+
+    Args:
+        helper (PlotlyHelperPlane): the helper used to build fig
+        fig (dict): the figure returned by helper.get_fig()
+        inline (bool): whether or not to plot inside an ipython notebook
+        filename (str): the output html filename (defaults to /tmp/<helper title>.html)
+        typed_arrays (str): None or the float dtype used to encode the trace arrays as base64
+            typed arrays (see helper.encode_typed_arrays)
+        shared_plotlyjs: None to embed plotly.js in the html file, True or a path to reference a
+            shared plotly.js file instead (see helper.get_include_plotlyjs)
+        streaming (bool): write the html file one trace at a time (see helper.write_fig_html)
+
+    All other args are passed to plotly plot
+
+    Raises:
+        TypeError: if streaming and other args than auto_open are given
+    '''
+    plot_fun = plot_
+    helper.layout['height'] = 1000
+
+    if inline:  # pragma: no cover
+        # pylint: disable=import-outside-toplevel
+        from plotly.offline import init_notebook_mode, iplot
+        init_notebook_mode(connected=True)
+        plot_fun = iplot
+    filename = _html_filename(helper, filename)
+    if streaming and not inline:
+        auto_open = kwargs.pop('auto_open', True)
+        if args or kwargs:
+            raise TypeError('the streamed html files only support the auto_open argument, got '
+                            f'{list(args) + sorted(kwargs)}')
+        write_fig_html(fig, filename, auto_open, typed_arrays, shared_plotlyjs)
+        return fig
+    if shared_plotlyjs and not inline:
+        kwargs['include_plotlyjs'] = get_include_plotlyjs(filename, shared_plotlyjs)
+    if typed_arrays:
+        plot_fun(encode_typed_arrays(fig, typed_arrays), filename=filename, *args,
+                 validate=False, **kwargs)
+    else:
+        plot_fun(fig, filename=filename, *args, **kwargs)
+
+    return fig
+
+
+def _trace_from_json(trace):
+    '''Create a plotly trace from its json dict, without validating it again'''
+    return getattr(go, trace['type'].capitalize())(trace, _validate=False)
+
+
+class NeuronBuilder:  # pylint: disable=too-many-instance-attributes
     '''A helper class to plot neuron and colorize specific sections'''
-    def __init__(self, neuron, plane, title='neuron', inline=False, line_width=2):
-        self.neuron = neuron
+    # pylint: disable=too-many-arguments
+    def __init__(self, neuron, plane, title='neuron', inline=False, line_width=2,
+                 merge_traces=False, lod=None, cache=None, soma_resolution=100,
+                 soma_mesh='surface', tubes=False, max_triangles=DEFAULT_MAX_TRIANGLES,
+                 profile=None, region=None, views=None, soma_subdivisions=2):
+        '''
+        Args:
+            neuron: a NeuroM morphology, an archive.ArchivedMorphology or a morphology path,
+                which can be an <archive directory>/<name> path (see archive.load_member).
+                Paths are only loaded when needed.
+            plane (str): a string representing the 2D plane (example: 'xy') or '3d'
+            title (str): the figure title
+            inline (bool): must be set to True for interactive ipython notebook plotting
+            line_width (int): the neurite line width
+            merge_traces (bool): in 2D, create one trace per neurite and color instead of one
+                trace per section
+            lod (float): the level of detail. If not None, the sections are simplified so that
+                no dropped point is further than lod from the drawn lines. Section end points
+                and the boundaries of the colored ranges are always kept.
+            cache (cache.TraceCache): if not None and neuron is a path, the figure parts are
+                looked up in (and stored to) this cache. The key is made of the morphology file
+                content, the plane, the line width, the level of detail, the section styles,
+                the scalar coloring and the region.
+            soma_resolution (int): the number of latitudes and longitudes of the 3D 'surface'
+                soma
+            soma_mesh (str): 'surface' or 'icosphere' (a low-poly go.Mesh3d)
+            tubes (bool): in 3D, draw the neurites as go.Mesh3d tubes following the point radii
+                instead of fixed width lines
+            max_triangles (int): the triangle budget of the tubes. The ring resolution is adapted
+                and the sub-pixel segments are dropped to fit it.
+            profile (profiling.Profile): if not None, the stages of the rendering ('load',
+                'cache', 'neurites', 'soma', 'assembly', 'serialization' and 'raster') are
+                recorded in this profile
+            region: None or a region.Box or region.Sphere. The sections are clipped to the
+                region before any trace is created: the segments crossing its boundary are
+                split and the sections completely outside are dropped, as well as the soma if
+                its center is outside.
+            views (list): in 2D, None or the planes (ex: ['xy', 'xz', 'yz']) between which
+                buttons switch the figure. The neurites and the soma are then drawn once in a
+                3D scene, as in 3D, seen through an orthographic camera facing plane: the buttons
+                only move the camera (see PlotlyHelperPlane.set_view_buttons), so the
+                coordinates are not repeated per plane. plane is added to the views if missing.
+            soma_subdivisions (int): the number of subdivisions of the 3D 'icosphere' soma,
+                between 0 and meshes.MAX_SUBDIVISIONS
+
+        Raises:
+            ValueError: if tubes is True or views is set in 3D or if soma_subdivisions is out
+                of range
+        '''
+        if isinstance(neuron, (str, Path)):
+            self.path, self._neuron = neuron, None
+        else:
+            self.path, self._neuron = None, neuron
+        self.cache = cache
         self.inline = inline
         self.line_width = line_width
+        self.merge_traces = merge_traces
+        self.lod = lod
+        self.soma_resolution = soma_resolution
+        self.soma_mesh = soma_mesh
+        if not 0 <= soma_subdivisions <= MAX_SUBDIVISIONS:
+            raise ValueError(f'soma_subdivisions must be between 0 and {MAX_SUBDIVISIONS}, '
+                             f'got {soma_subdivisions}')
+        self.soma_subdivisions = soma_subdivisions
+        self.tubes = tubes
+        self.max_triangles = max_triangles
+        self.profile = profile
+        self.region = region
 
         self.properties = defaultdict(dict)
+        self.coloring = None
         self.helper = PlotlyHelperPlane(title, plane)
+        if tubes and self.helper.plane != 'xyz':
+            raise ValueError('tubes can only be drawn in 3D')
+        self.views = None
+        if views is not None:
+            if self.helper.plane == 'xyz':
+                raise ValueError('views can only be used in 2D')
+            views = [PlotlyHelperPlane._sanitize_plane(view) for view in views]
+            if 'xyz' in views:
+                raise ValueError('views must be 2D planes')
+            self.views = list(dict.fromkeys(
+                views if self.helper.plane in views else [self.helper.plane] + views))
+            self.helper.set_view_buttons(self.views)
+        # the _tube_segments of each neurite and the tube resolution they fit in
+        self._tube_segments = {}
+        self._tube_resolution = None
+        # the traces of each neurite once the figure is built and the indexes of the neurites
+        # whose traces must be regenerated
+        self._neurite_traces = None
+        self._dirty = set()
+        self._section_index = None
+        # the segments of the images by (width, height), until the styles change
+        self._image_segments = {}
+
+    @property
+    def neuron(self):
+        '''The morphology, loaded on first access if a path was given'''
+        if self._neuron is None:
+            with profile_stage(self.profile, 'load') as counters:
+                self._neuron = (load_morphology(self.path) if split_member(self.path) is None
+                                else load_member(self.path))
+                counters['sections'] = len(self._neuron.sections)
+        return self._neuron
 
     def color_section(self, section, color='green', recursive=False, start_point=0, end_point=None):
         '''Colors points of the section between start_point and end_point
@@ -144,27 +889,273 @@ class NeuronBuilder:
             recursive (bool): whether or not to color descendant sections as well
             start_point (int): point to start coloring from
             end_point (int): point to stop coloring at (None colors until the last section point)
+
+        Only the traces of the neurite of section are regenerated by the next get_figure call.
         '''
+        if recursive:
+            self.color_sections([section], color, subtree=True)
+        self._image_segments.clear()
+        self._dirty.add(self._neurite_index(section))
         self.properties[section]['color'] = color
         end_point = end_point if end_point is not None else len(section.points) - 1
         self.properties[section]['range'] = slice(start_point, end_point)
-        if recursive:
-            for child in section.children:
-                self.color_section(child, color, recursive=True)
+
+    def color_sections(self, sections, color='green', subtree=True):
+        '''Colors many whole sections at once
+
+        Args:
+            sections: a predicate called with each section, a boolean mask over the sections in
+                the iter_sections order or an iterable of section ids or NeuroM sections
+            color (str): A color supported by plotly
+            subtree (bool): whether or not to color the descendant sections as well
+
+        Returns:
+            the number of colored sections
+
+        The subtrees are contiguous ranges of the preorder section_index, so they are selected
+        with a single mask operation whatever their number and depth.
+        '''
+        index = self.section_index
+        positions = index.positions(sections)
+        if subtree:
+            positions = np.flatnonzero(index.subtree_mask(positions))
+        self._image_segments.clear()
+        self._dirty.update(np.unique(index.neurite_indices[positions]).tolist())
+        for position, nb_segments in zip(positions.tolist(),
+                                         index.nb_segments[positions].tolist()):
+            properties = self.properties[index.sections[position]]
+            properties.update(color=color, range=slice(0, nb_segments))
+        return len(positions)
+
+    def color_by(self, values, colorscale='Viridis', cmin=None, cmax=None):
+        '''Colors all the points with a scalar value mapped through a colorscale
+
+        Args:
+            values: 'radius', 'path_distance', 'branch_order' or an array with one value per
+                point of the sections, concatenated in the iter_sections order. None removes the
+                coloring.
+            colorscale: a plotly colorscale name or a list of [value, color] pairs
+            cmin (float): the value mapped to the first color (defaults to the minimum value)
+            cmax (float): the value mapped to the last color (defaults to the maximum value)
+
+        In 3D, the values are given to plotly as per vertex line colors. 2D lines only support
+        a single color so the values are quantized in NB_COLOR_LEVELS colors. The scalar coloring
+        takes precedence over the color_section styles.
+        '''
+        self._image_segments.clear()
+        self._dirty.update(range(len(self.neuron.neurites)))
+        if values is None:
+            self.coloring = None
+            return
+        sections, section_values = point_values(self.neuron, values)
+        all_values = np.concatenate(section_values)
+        self.coloring = {
+            'values': dict(zip(sections, section_values)),
+            'digest': hashlib.sha256(all_values.tobytes()).hexdigest(),
+            'title': values if isinstance(values, str) else None,
+            'colorscale': colorscale,
+            'cmin': float(np.nanmin(all_values)) if cmin is None else cmin,
+            'cmax': float(np.nanmax(all_values)) if cmax is None else cmax,
+        }
+
+    @property
+    def section_index(self):
+        '''The preorder index of the sections, computed on first access'''
+        if self._section_index is None:
+            self._section_index = SectionIndex(self.neuron)
+        return self._section_index
+
+    def _neurite_index(self, section):
+        '''The index of the neurite of a section'''
+        index = self.section_index
+        return int(index.neurite_indices[index.positions([section])[0]])
+
+    def _update_tubes(self, neurites, indices):
+        '''Extract the tube segments of the neurites of indices and update the tube resolution
+
+        The resolution fits the budget to the segments of all the neurites, which are extracted
+        if missing. All the neurites are marked dirty when the resolution changes.
+        '''
+        indices = set(indices) | set(range(len(neurites))) - set(self._tube_segments)
+        for i in indices:
+            self._tube_segments[i] = _tube_segments(neurites[i], self.properties, self.lod,
+                                                    self.coloring, self.region)
+        resolution = _tube_resolution(self._tube_segments.values(), self.max_triangles)
+        if resolution != self._tube_resolution:
+            self._tube_resolution = resolution
+            self._dirty.update(range(len(neurites)))
+
+    def _make_neurite_traces(self, neurites, names, index):
+        '''Return the list of the traces of the index-th neurite'''
+        plane = self.helper.plane
+        coloring = _neurite_coloring(self.coloring, index)
+        if self.tubes:
+            return [_neurite_tubes(neurites[index], names[index], self.properties,
+                                   self._tube_segments[index], coloring, *self._tube_resolution)]
+        if plane == 'xyz' or self.views is not None:
+            return [_neurite_trace(neurites[index], names[index], 'xyz', self.properties,
+                                   self.line_width, self.lod, coloring, self.region)]
+        make_traces = _merged_neurite_traces2d if self.merge_traces else _neurite_traces2d
+        return make_traces(neurites[index], names[index], plane, self.properties,
+                           self.line_width, self.lod, coloring, self.region)
+
+    def _make_parts(self):
+        '''Return the traces of each neurite, the other traces by group name and the shapes
+
+        Raises:
+            ValueError: if no segment is inside the region
+        '''
+        neurites = list(iter_neurites(self.neuron))
+        names = _neurite_names(neurites)
+        with profile_stage(self.profile, 'neurites') as counters:
+            if self.tubes:
+                self._update_tubes(neurites, range(len(neurites)))
+            neurite_traces = [self._make_neurite_traces(neurites, names, i)
+                              for i in range(len(neurites))]
+            counters.update(trace_counts(chain.from_iterable(neurite_traces)))
+        if self.region is not None and not counters.get('vertices'):
+            raise ValueError('no segment of the morphology is inside the region')
+        with profile_stage(self.profile, 'soma') as counters:
+            if not _soma_in_region(self.neuron, self.region):
+                return neurite_traces, {}, []
+            if self.helper.plane == 'xyz' or self.views is not None:
+                # self.helper.add_plane_buttons()
+                soma = _make_soma(self.neuron, self.soma_resolution, self.soma_mesh,
+                                  self.soma_subdivisions)
+                counters.update(trace_counts([soma]))
+                return neurite_traces, {SOMA_NAME: [soma]}, []
+            return neurite_traces, {}, [_make_soma2d(self.neuron, self.helper.plane)]
+
+    def _cache_key(self):
+        '''The cache key of the figure parts'''
+        style = sorted([section.id, properties['color'],
+                        properties['range'].start, properties['range'].stop]
+                       for section, properties in self.properties.items())
+        coloring = None if self.coloring is None else [
+            self.coloring[key] for key in ('digest', 'colorscale', 'cmin', 'cmax')]
+        digest = (file_digest(self.path) if split_member(self.path) is None else
+                  member_digest(self.path))
+        return self.cache.key(digest, self.helper.plane, self.line_width,
+                              self.merge_traces, self.lod, self.soma_resolution, self.soma_mesh,
+                              self.soma_subdivisions, self.tubes, self.max_triangles, style,
+                              coloring, None if self.region is None else self.region.key(),
+                              self.views)
+
+    def _get_parts(self):
+        '''Return the figure parts, from the cache if possible'''
+        if self.cache is None or self.path is None:
+            return self._make_parts()
+
+        with profile_stage(self.profile, 'cache') as counters:
+            key = self._cache_key()
+            cached = self.cache.get(key)
+            counters['hits'] = int(cached is not None)
+            if cached is not None:
+                neurite_traces = [[_trace_from_json(trace) for trace in traces]
+                                  for traces in cached['neurites']]
+                data = {name: [_trace_from_json(trace) for trace in traces]
+                        for name, traces in cached['data'].items()}
+                return neurite_traces, data, cached['shapes']
+
+        neurite_traces, data, shapes = self._make_parts()
+        with profile_stage(self.profile, 'cache'):
+            parts = {'neurites': [[trace.to_plotly_json() for trace in traces]
+                                  for traces in neurite_traces],
+                     'data': {name: [trace.to_plotly_json() for trace in traces]
+                              for name, traces in data.items()},
+                     'shapes': shapes}
+            self.cache.put(key, parts)
+        return neurite_traces, data, shapes
 
     def get_figure(self):
-        '''Build the figure and returns it'''
-        is_3d = self.helper.plane == 'xyz'
-        if is_3d:
-            self.helper.add_data({NEURON_NAME: _make_trace(
-                self.neuron, self.helper.plane, style=self.properties, line_width=self.line_width)})
-            self.helper.add_data({SOMA_NAME: _make_soma(self.neuron)})
-            # self.helper.add_plane_buttons()
-        else:
-            self.helper.add_data({NEURON_NAME: _make_trace2d(
-                self.neuron, self.helper.plane, style=self.properties, line_width=self.line_width)})
-            self.helper.add_shapes([_make_soma2d(self.neuron, self.helper.plane)])
-        return self.helper.get_fig()
+        '''Build the figure and returns it
+
+        The figure is built on the first call. The next calls only regenerate the traces of the
+        neurites modified by color_section since the previous call and swap them in place in the
+        helper, so calling it again is cheap and returns the same figure if nothing changed.
+        '''
+        if self._neurite_traces is None:
+            self._neurite_traces, data, shapes = self._get_parts()
+            with profile_stage(self.profile, 'assembly'):
+                self.helper.add_data({
+                    NEURON_NAME: list(chain.from_iterable(self._neurite_traces)), **data})
+                self.helper.add_shapes(shapes)
+        elif self._dirty:
+            neurites = list(iter_neurites(self.neuron))
+            names = _neurite_names(neurites)
+            with profile_stage(self.profile, 'neurites') as counters:
+                if self.tubes:
+                    self._update_tubes(neurites, self._dirty)
+                for i in self._dirty:
+                    self._neurite_traces[i] = self._make_neurite_traces(neurites, names, i)
+                counters.update(trace_counts(chain.from_iterable(
+                    self._neurite_traces[i] for i in self._dirty)))
+            with profile_stage(self.profile, 'assembly'):
+                self.helper.replace_data(NEURON_NAME,
+                                         list(chain.from_iterable(self._neurite_traces)))
+        self._dirty.clear()
+        with profile_stage(self.profile, 'assembly') as counters:
+            fig = self.helper.get_fig()
+            counters.update(trace_counts(fig['data']))
+        return fig
+
+    def _get_image_segments(self, width, height):
+        '''Return the segments of the images of a size (see _image_segments)
+
+        They are kept until the styles change and, as the figure parts, looked up in (and
+        stored to) the cache, so drawing again an image does not load the morphology.
+        '''
+        size = (width, height or width)
+        if size in self._image_segments:
+            return self._image_segments[size]
+
+        segments = key = None
+        if self.cache is not None and self.path is not None:
+            with profile_stage(self.profile, 'cache') as counters:
+                key = self.cache.key('image', self._cache_key(), *size)
+                segments = self.cache.get(key)
+                counters['hits'] = int(segments is not None)
+        if segments is None:
+            neuron = self.neuron
+            with profile_stage(self.profile, 'raster'):
+                segments = _image_segments(neuron, self.helper.plane, *size, self.properties,
+                                           self.lod, self.coloring, self.region)
+            if key is not None:
+                with profile_stage(self.profile, 'cache'):
+                    self.cache.put(key, segments)
+        self._image_segments[size] = segments
+        return segments
+
+    def get_image(self, width=256, height=None, background='white'):
+        '''Rasterize the 2D projection of the morphology without going through plotly
+
+        Args:
+            width (int): the image width in pixels
+            height (int): the image height in pixels (defaults to width)
+            background (str): the background plotly color
+
+        Returns:
+            an (height, width, 3) uint8 array
+
+        Raises:
+            ValueError: in 3D
+        '''
+        if self.helper.plane == 'xyz':
+            raise ValueError('images can only be drawn in 2D')
+        segments = self._get_image_segments(width, height)
+        with profile_stage(self.profile, 'raster') as counters:
+            image = _draw_image(segments, width, height, self.line_width, background)
+            counters['pixels'] = image.shape[0] * image.shape[1]
+        return image
+
+    def write_png(self, filename, width=256, height=None, background='white'):
+        '''Write the image returned by get_image to a PNG file'''
+        image = self.get_image(width, height, background)
+        with profile_stage(self.profile, 'serialization') as counters:
+            data = encode_png(image)
+            with open(filename, 'wb') as fd:
+                fd.write(data)
+            counters['bytes'] = len(data)
 
     # pylint: disable=keyword-arg-before-vararg
     def plot(self, filename=None, *args, **kwargs):
@@ -172,18 +1163,20 @@ class NeuronBuilder:
 
         Args:
             filename (str): the output html filename
+            typed_arrays (str): None or the float dtype ('float32' or 'float64') used to
+                encode the trace arrays as base64 typed arrays
+            shared_plotlyjs: None to embed plotly.js in the html file, True to reference a
+                plotly.min.js file written next to filename or the path of a shared plotly.js
+            streaming (bool): write the html file one trace at a time to bound the memory peak
 
         All other args are passed to plotly plot
         '''
         fig = self.get_figure()
-        plot_fun = iplot if self.inline else plot_
-        self.helper.layout['height'] = 1000
-
-        if self.inline:
-            init_notebook_mode(connected=True)  # pragma: no cover
-        filename = filename or os.path.join('/tmp', self.helper.title + '.html')
-        plot_fun(fig, filename=filename, *args, **kwargs)
-
+        filename = _html_filename(self.helper, filename)
+        with profile_stage(self.profile, 'serialization') as counters:
+            fig = _plot_helper(self.helper, fig, self.inline, filename, *args, **kwargs)
+            if not self.inline and os.path.exists(filename):
+                counters['bytes'] = os.path.getsize(filename)
         return fig
 
 
@@ -2,9 +2,137 @@
 import numpy as np
 import plotly.graph_objs as go
 
+# the number of points above which the scatters are aggregated, the browsers struggle beyond
+DEFAULT_MAX_POINTS = 200000
+AGGREGATIONS = ('subsample', 'density')
+# the mean number of points per cell of the grid used to stratify the subsampling
+POINTS_PER_CELL = 10
 
+
+def _bins(max_cells, dim):
+    """ The number of bins per axis of a grid of at most max_cells cells """
+    return max(1, int(max_cells ** (1 / dim) + 1e-9))
+
+
+def _grid_cells(points, nb_bins):
+    """ Return the bin coordinates of each point in a regular grid over the points bounding box
+
+    Returns:
+        a tuple (cells, lower, size) where cells is the (N, D) array of the bin indexes, lower the
+        grid origin and size the (D,) bin sizes
+    """
+    lower = points.min(axis=0)
+    size = (points.max(axis=0) - lower) / nb_bins
+    size[size == 0] = 1
+    return np.clip(((points - lower) / size).astype(int), 0, nb_bins - 1), lower, size
+
+
+def _histogram(points, nb_bins):
+    """ Return the (nb_bins,) * D array of the point counts per cell, the grid origin and the
+    bin sizes """
+    cells, lower, size = _grid_cells(points, nb_bins)
+    shape = (nb_bins,) * points.shape[1]
+    counts = np.bincount(np.ravel_multi_index(cells.T, shape), minlength=np.prod(shape))
+    return counts.reshape(shape), lower, size
+
+
+def _aggregated(points, max_points, aggregation):
+    """ Whether or not points is over the budget and must be aggregated
+
+    Raises:
+        ValueError: if aggregation is unknown
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f'unknown aggregation {aggregation}, expected one of {AGGREGATIONS}')
+    return max_points is not None and len(points) > max_points
+
+
+def stratified_subsample(points, max_points, seed=0):
+    """ Return the sorted indexes of a stratified random subset of about max_points points
+
+    The bounding box of the points is divided in a grid of about max_points / POINTS_PER_CELL
+    cells and every cell keeps the same fraction of its points, but at least one, so the sparse
+    regions and the outliers are still drawn. Everything is vectorized: the points are shuffled
+    once, sorted by cell and kept if their rank in their cell is under the cell quota.
+
+    Args :
+        points: the (N, D) points
+        max_points: the number of kept points, exceeded by at most the number of cells
+        seed: the seed of the random generator, the subset is deterministic
+
+    Returns :
+        the indexes of the kept points, in increasing order so that lines keep their order
+    """
+    points = np.asarray(points, dtype=float)
+    if len(points) <= max_points:
+        return np.arange(len(points))
+    nb_bins = _bins(max_points / POINTS_PER_CELL, points.shape[1])
+    cells, _, _ = _grid_cells(points, nb_bins)
+    cell_ids = np.ravel_multi_index(cells.T, (nb_bins,) * points.shape[1])
+
+    order = np.random.default_rng(seed).permutation(len(points))
+    order = order[np.argsort(cell_ids[order], kind='stable')]
+    sorted_ids = cell_ids[order]
+    starts = np.flatnonzero(np.append(True, sorted_ids[1:] != sorted_ids[:-1]))
+    counts = np.diff(np.append(starts, len(order)))
+    quotas = np.maximum(1, counts * max_points // len(points))
+    ranks = np.arange(len(order)) - np.repeat(starts, counts)
+    return np.sort(order[ranks < np.repeat(quotas, counts)])
+
+
+# pylint: disable=too-many-locals
+def density(points, name=None, color=None, visible=True, showlegend=True, opacity=1.0,
+            bins=None, marker_size=5):
+    """ Create a density plot of the number of points per cell of a regular grid
+
+    The points are binned with a single vectorized histogram: 2D points give a go.Heatmap whose
+    empty cells are transparent and 3D points a go.Scatter3d with one marker per non empty
+    voxel. The counts are shown by the colors and on hover.
+
+    Args :
+        points: points used to create the density (np.array([[x1,y1,z1], ..., [x2,y2,z2]]))
+        color: None for the Viridis colorscale or a css color name or rgb (string) used for the
+            most dense cells
+        visible: switch for visibility (bool)
+        showlegend: boolean to add object to the legend
+        opacity: set the opacity value (float)
+        bins: the number of bins per axis, by default the largest one keeping the number of
+            cells under DEFAULT_MAX_POINTS
+        marker_size: size of the voxel markers in 3D
+
+    Returns :
+        A heatmap or a scatter plot representing the density of points
+    """
+    points = np.asarray(points, dtype=float)
+    dim = points.shape[1]
+    bins = bins if bins is not None else _bins(DEFAULT_MAX_POINTS, dim)
+    colorscale = 'Viridis' if color is None else [[0, 'rgb(220, 220, 220)'], [1, color]]
+    args = {'visible': visible, 'showlegend': showlegend, 'opacity': opacity}
+    if name:
+        args['name'] = name
+
+    counts, lower, size = _histogram(points, bins)
+    if dim == 2:
+        centers = lower + (np.arange(bins)[:, np.newaxis] + 0.5) * size
+        return go.Heatmap(x=centers[:, 0], y=centers[:, 1],
+                          z=np.where(counts.T > 0, counts.T, np.nan),
+                          colorscale=colorscale, showscale=False,
+                          hovertemplate='%{z} points<extra></extra>', **args)
+
+    voxels = np.argwhere(counts)
+    centers = lower + (voxels + 0.5) * size
+    voxel_counts = counts[tuple(voxels.T)]
+    return go.Scatter3d(x=centers[:, 0], y=centers[:, 1], z=centers[:, 2], mode='markers',
+                        marker={'size': marker_size, 'color': voxel_counts,
+                                'colorscale': colorscale, 'showscale': False},
+                        text=voxel_counts, hovertemplate='%{text} points<extra></extra>',
+                        **args)
+
+
+# pylint: disable=too-many-arguments
 def scatter_line(points, name=None, color=None, width=5, visible=True,
-                 showlegend=True, opacity=1.0, marker_size=3):
+                 showlegend=True, opacity=1.0, marker_size=3, max_points=DEFAULT_MAX_POINTS,
+                 aggregation='subsample'):
     """ Create a line scatter plot from an array of points
 
     Args :
@@ -14,10 +142,24 @@ def scatter_line(points, name=None, color=None, width=5, visible=True,
         showlegend: boolean to add object to the legend
         opacity: set the opacity value (float)
         marker_size: size of marker (set to small value to get lines)
+        max_points: the point budget, None to always draw all the points. Above it, the points
+            are aggregated.
+        aggregation: 'subsample' to draw a stratified subset of about max_points points in
+            their original order (see stratified_subsample) or 'density' to draw the number of
+            points per cell instead (see density)
 
     Returns :
         A scatter plot representing points
+
+    Raises :
+        ValueError: if aggregation is unknown
     """
+    points = np.asarray(points)
+    if _aggregated(points, max_points, aggregation):
+        if aggregation == 'density':
+            return density(points, name, color, visible, showlegend, opacity,
+                           _bins(max_points, points.shape[1]), marker_size)
+        points = points[stratified_subsample(points, max_points)]
     args = {'visible': visible, 'marker': {'size': marker_size, 'color': color},
             'line': {'width': width, 'color': color},
             'x': points[:, 0], 'y': points[:, 1],
@@ -35,7 +177,9 @@ def scatter_line(points, name=None, color=None, width=5, visible=True,
     return obj
 
 
-def scatter(points, name=None, color=None, width=5, visible=True, showlegend=True, opacity=1.0):
+# pylint: disable=too-many-arguments
+def scatter(points, name=None, color=None, width=5, visible=True, showlegend=True, opacity=1.0,
+            max_points=DEFAULT_MAX_POINTS, aggregation='subsample'):
     """ Create a scatter plot from a numpy array of points
 
     Args :
@@ -44,11 +188,21 @@ def scatter(points, name=None, color=None, width=5, visible=True, showlegend=Tru
         visible: switch for visibility (bool)
         showlegend: boolean to add object to the legend
         opacity: set the opacity value (float)
+        max_points: the point budget, None to always draw all the points (see scatter_line)
+        aggregation: 'subsample' or 'density' (see scatter_line)
 
     Returns :
         A scatter plot representing points
+
+    Raises :
+        ValueError: if aggregation is unknown
     """
-    obj = scatter_line(points, name, color, width, visible, showlegend, opacity)
+    points = np.asarray(points)
+    if _aggregated(points, max_points, aggregation) and aggregation == 'density':
+        return density(points, name, color, visible, showlegend, opacity,
+                       _bins(max_points, points.shape[1]), width)
+    obj = scatter_line(points, name, color, width, visible, showlegend, opacity,
+                       max_points=max_points, aggregation=aggregation)
     marker = {
         'line': {'width': width, 'color': color},
         'color': color,
@@ -0,0 +1,191 @@
+'''
+Define the public 'plot_population' function to be used to draw
+many morphologies in a single plotly figure
+'''
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import plotly.graph_objs as go
+
+from neurom import COLS, NeuriteType, iter_neurites, iter_sections, load_morphology
+
+from plotly_helper.archive import ArchivedMorphology, load_member, split_member
+from plotly_helper.colors import tree_color
+from plotly_helper.helper import PlotlyHelperPlane
+from plotly_helper.meshes import batch_meshes, icosphere
+from plotly_helper.neuron_viewer import NEURON_NAME, SOMA_NAME, _plot_helper, _segment_coords
+
+
+def _unit_circle(resolution):
+    '''Return a closed unit circle polygon followed by a NaN row'''
+    angles = np.linspace(0, 2 * np.pi, resolution + 1)
+    return np.vstack([np.stack([np.cos(angles), np.sin(angles)], axis=1), [[np.nan, np.nan]]])
+
+
+def _type_name(neurite_type):
+    '''The neurite type name used for the legend'''
+    return str(neurite_type).replace('NeuriteType.', '').replace('_', ' ')
+
+
+def _archived_coords(morphology, columns):
+    '''Yield the neurite types and the segment coordinates of an archived morphology
+
+    The segments are read from the flat arrays of the archive at once, without going through
+    the sections. The coordinates are the same as the ones of _segment_coords.
+    '''
+    offsets = morphology.section_offsets
+    points = np.asarray(morphology.xyz)[:, columns]
+    is_start = np.ones(len(points), dtype=bool)
+    is_start[offsets[1:] - 1] = False
+    starts = np.flatnonzero(is_start)
+    types = np.repeat(morphology.neurite_types, np.diff(offsets))[starts]
+
+    coords = np.full((len(starts), 3, len(columns)), np.nan,
+                     dtype=np.result_type(points.dtype, np.float32))
+    coords[:, 0] = points[starts]
+    coords[:, 1] = points[starts + 1]
+    coords = coords.reshape(len(starts), -1)
+    # the types are yielded in the order of their first neurite, as iter_neurites does
+    _, firsts = np.unique(types, return_index=True)
+    for neurite_type in types[np.sort(firsts)]:
+        yield (NeuriteType(int(neurite_type)),
+               coords[types == neurite_type].reshape(-1, len(columns)))
+
+
+class PopulationBuilder:
+    '''A helper class to plot a population of neurons in a single figure
+
+    The morphologies are loaded one at a time and their segments are merged into one trace per
+    neurite type, so the number of traces does not depend on the number of cells. All somata are
+    gathered in a single trace. The segments of the morphologies of an archive.MorphologyArchive
+    are read from its memory mapped arrays without loading any file.
+    '''
+    # pylint: disable=too-many-arguments
+    def __init__(self, morphologies, plane, title='population', inline=False, line_width=2,
+                 soma_resolution=8, soma_subdivisions=1):
+        '''
+        Args:
+            morphologies: an iterable of NeuroM morphologies, of morphology paths or of
+                archive.ArchivedMorphology (ex: an archive.MorphologyArchive). It is consumed
+                lazily, once, by get_figure.
+            plane (str): a string representing the 2D plane (example: 'xy') or '3d'
+            title (str): the figure title
+            inline (bool): must be set to True for interactive ipython notebook plotting
+            line_width (int): the neurite line width
+            soma_resolution (int): the number of vertices of the 2D soma circles
+            soma_subdivisions (int): the number of subdivisions of the 3D icosphere somata
+        '''
+        self.morphologies = morphologies
+        self.inline = inline
+        self.line_width = line_width
+        self.soma_resolution = soma_resolution
+        self.soma_subdivisions = soma_subdivisions
+
+        self.helper = PlotlyHelperPlane(title, plane)
+        self.nb_morphologies = 0
+
+    def _iter_morphologies(self):
+        '''Yield the morphologies, loading the paths on the fly'''
+        for morphology in self.morphologies:
+            if isinstance(morphology, (str, Path)):
+                morphology = (load_morphology(morphology) if split_member(morphology) is None
+                              else load_member(morphology))
+            yield morphology
+
+    def _collect(self):
+        '''Stream the morphologies and return the neurite buffers and the somata
+
+        Returns:
+            a tuple (coords, somata) where coords maps each neurite type to its list of segment
+            coordinate chunks and somata is a (N, 4) array of soma centers and radii
+        '''
+        columns = ['xyz'.index(axis) for axis in self.helper.plane]
+        coords = defaultdict(list)
+        somata = []
+        for morphology in self._iter_morphologies():
+            self.nb_morphologies += 1
+            if isinstance(morphology, ArchivedMorphology):
+                for neurite_type, neurite_coords in _archived_coords(morphology, columns):
+                    coords[neurite_type].append(neurite_coords)
+            else:
+                for neurite in iter_neurites(morphology):
+                    section_coords, _ = _segment_coords([section.points[:, columns]
+                                                         for section in iter_sections(neurite)])
+                    coords[neurite.type].append(section_coords)
+            somata.append(np.append(morphology.soma.center[COLS.XYZ], morphology.soma.radius))
+        return coords, np.array(somata, dtype=float).reshape(-1, 4)
+
+    def _make_traces(self, coords):
+        '''Create one trace per neurite type'''
+        is_3d = self.helper.plane == 'xyz'
+        lines = []
+        for neurite_type in list(coords):
+            type_coords = np.concatenate(coords.pop(neurite_type))
+            axes = dict(zip('xyz', type_coords.T))
+            trace = go.Scatter3d if is_3d else go.Scattergl
+            lines.append(trace(name=_type_name(neurite_type), showlegend=True,
+                               line={'color': tree_color(neurite_type),
+                                     'width': self.line_width},
+                               mode='lines',
+                               **axes))
+        return lines
+
+    def _make_somata(self, somata):
+        '''Create a single trace containing all the somata'''
+        centers, radii = somata[:, :3], somata[:, 3]
+        color = tree_color('soma')
+        if self.helper.plane == 'xyz':
+            all_vertices, all_triangles = batch_meshes(*icosphere(self.soma_subdivisions),
+                                                       centers, radii)
+            return go.Mesh3d(name=SOMA_NAME, color=color,
+                             x=all_vertices[:, 0], y=all_vertices[:, 1], z=all_vertices[:, 2],
+                             i=all_triangles[:, 0], j=all_triangles[:, 1], k=all_triangles[:, 2])
+
+        columns = ['xyz'.index(axis) for axis in self.helper.plane]
+        circles = (centers[:, np.newaxis, columns] +
+                   radii[:, np.newaxis, np.newaxis] * _unit_circle(self.soma_resolution))
+        circles = circles.reshape(-1, 2)
+        return go.Scattergl(name=SOMA_NAME, mode='lines', fill='toself', line={'color': color},
+                            x=circles[:, 0], y=circles[:, 1])
+
+    def get_figure(self):
+        '''Build the figure and returns it'''
+        coords, somata = self._collect()
+        self.helper.add_data({NEURON_NAME: self._make_traces(coords)})
+        if len(somata):  # pylint: disable=len-as-condition
+            self.helper.add_data({SOMA_NAME: self._make_somata(somata)})
+        return self.helper.get_fig()
+
+    # pylint: disable=keyword-arg-before-vararg
+    def plot(self, filename=None, *args, **kwargs):
+        '''Plot
+
+        Args:
+            filename (str): the output html filename
+            typed_arrays (str): None or the float dtype ('float32' or 'float64') used to
+                encode the trace arrays as base64 typed arrays
+            shared_plotlyjs: None to embed plotly.js in the html file, True to reference a
+                plotly.min.js file written next to filename or the path of a shared plotly.js
+            streaming (bool): write the html file one trace at a time to bound the memory peak
+
+        All other args are passed to plotly plot
+        '''
+        return _plot_helper(self.helper, self.get_figure(), self.inline, filename,
+                            *args, **kwargs)
+
+
+def plot_population(morphologies, plane, title='population', inline=False, **kwargs):
+    '''Draw a population of morphologies within the given plane
+
+    morphologies: an iterable of NeuroM morphologies, of morphology paths or of archived
+                  morphologies
+
+    plane (str): a string representing the 2D plane (example: 'xy')
+                 or '3d', '3D' for a 3D view
+
+    inline (bool): must be set to True for interactive ipython notebook plotting
+
+    All other kwargs are passed to PopulationBuilder
+    '''
+    return PopulationBuilder(morphologies, plane, title, inline, **kwargs).plot()
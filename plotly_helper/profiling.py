@@ -0,0 +1,120 @@
+'''Per stage timers, counters and memory peaks of the rendering pipeline'''
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+
+class Profile:
+    '''The statistics of the stages of one or many renderings
+
+    Each stage records its number of calls, its total wall time, the counters set by the
+    instrumented code (ex: traces, vertices or bytes) and, if trace_memory is True, the peak of
+    the memory allocated during the stage (measured with tracemalloc, which slows down the
+    rendering). The time and memory of a stage include the ones of the stages nested in it.
+    '''
+    def __init__(self, trace_memory=False, callback=None):
+        '''
+        Args:
+            trace_memory (bool): measure the memory peak of the stages with tracemalloc. The
+                tracing is only active during the outermost stages.
+            callback: None or a function called with the stage name and its record (a dict
+                with the time and the counters of this call only) each time a stage ends
+        '''
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self.stages = {}
+        # the running memory peak and the memory at the start of the active stages
+        self._memory_stack = []
+        self._started_tracing = False
+
+    def _enter_memory(self):
+        '''Start measuring the memory peak of a new stage'''
+        if not self._memory_stack and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        current, peak = tracemalloc.get_traced_memory()
+        if self._memory_stack:
+            # resetting the peak loses the one of the enclosing stage, it is saved first
+            self._memory_stack[-1][0] = max(self._memory_stack[-1][0], peak)
+        tracemalloc.reset_peak()
+        self._memory_stack.append([current, current])
+
+    def _exit_memory(self):
+        '''Return the memory peak of the stage that ends, relative to its start'''
+        peak, start = self._memory_stack.pop()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        if self._memory_stack:
+            self._memory_stack[-1][0] = max(self._memory_stack[-1][0], peak)
+        elif self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return peak - start
+
+    @contextmanager
+    def stage(self, name):
+        '''Time a stage of the rendering
+
+        Yields:
+            a dict in which the instrumented code sets the counters of the stage
+        '''
+        counters = {}
+        if self.trace_memory:
+            self._enter_memory()
+        start = time.perf_counter()
+        try:
+            yield counters
+        finally:
+            record = {'time': time.perf_counter() - start}
+            if self.trace_memory:
+                record['memory_peak'] = self._exit_memory()
+            record.update(counters)
+            self.add(name, record)
+            if self.callback is not None:
+                self.callback(name, record)
+
+    def add(self, name, record, calls=1):
+        '''Add a record to the statistics of a stage
+
+        The times and counters are summed and the memory peaks are maxed.
+        '''
+        stats = self.stages.setdefault(name, {'calls': 0})
+        stats['calls'] += calls
+        for key, value in record.items():
+            if key == 'memory_peak':
+                stats[key] = max(stats.get(key, 0), value)
+            elif key != 'calls':
+                stats[key] = stats.get(key, 0) + value
+
+    def merge(self, stages):
+        '''Add the statistics of another profile, given as its stages dict'''
+        for name, stats in stages.items():
+            self.add(name, stats, stats['calls'])
+
+    def format(self):
+        '''Return the statistics as a table'''
+        header = f'{"stage":<16} {"calls":>6} {"time (s)":>10} {"peak (MB)":>10}  counters'
+        lines = [header, '-' * len(header)]
+        for name, stats in self.stages.items():
+            peak = f'{stats["memory_peak"] / 1e6:.1f}' if 'memory_peak' in stats else '-'
+            counters = ' '.join(f'{key}={value}' for key, value in stats.items()
+                                if key not in ('calls', 'time', 'memory_peak'))
+            lines.append(f'{name:<16} {stats["calls"]:>6} {stats["time"]:>10.3f} {peak:>10}  '
+                         f'{counters}'.rstrip())
+        return '\n'.join(lines)
+
+
+def profile_stage(profile, name):
+    '''Return profile.stage(name) or a context manager yielding a throwaway dict if profile is
+    None, so that the instrumented code does not have to check it'''
+    if profile is None:
+        return nullcontext({})
+    return profile.stage(name)
+
+
+def trace_counts(traces):
+    '''The number of traces and of vertices of a list of plotly traces'''
+    traces = list(traces)
+    return {'traces': len(traces),
+            'vertices': sum(int(np.size(trace.x)) for trace in traces if trace.x is not None)}
@@ -0,0 +1,223 @@
+'''A NumPy rasterizer of anti-aliased 2D lines and discs used to write PNG thumbnails
+
+It is meant for galleries of many small projections, where going through a browser or an image
+export server for each figure is far too slow. The coverage of each pixel is the clipped
+distance between its center and the drawn primitive, computed for all the pixels around all the
+segments at once.
+'''
+import struct
+import zlib
+
+import numpy as np
+
+from plotly_helper.colors import to_rgba
+
+# the maximum number of (sample, pixel) pairs processed at once, bounding the memory of draw_lines
+CHUNK_PIXELS = 1 << 20
+# the width of the outline of the shapes when it is not specified, as in plotly
+DEFAULT_SHAPE_LINE_WIDTH = 2
+
+
+def encode_png(image):
+    '''Return the PNG file content of an (height, width, 3) or (height, width, 4) uint8 image'''
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width, channels = image.shape
+    color_type = {3: 2, 4: 6}[channels]
+
+    def _chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data +
+                struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    # each row starts with its filter type, 0 meaning no filter
+    rows = np.concatenate([np.zeros((height, 1), dtype=np.uint8),
+                           image.reshape(height, width * channels)], axis=1)
+    return (b'\x89PNG\r\n\x1a\n' +
+            _chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)) +
+            _chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)) +
+            _chunk(b'IEND', b''))
+
+
+def write_png(image, filename):
+    '''Write an (height, width, 3) or (height, width, 4) uint8 image to a PNG file'''
+    with open(filename, 'wb') as fd:
+        fd.write(encode_png(image))
+
+
+class Raster:
+    '''An RGB image on which anti-aliased 2D lines and discs are drawn
+
+    The drawing coordinates are mapped to the pixels with a uniform scale so that bounds is
+    centered in the image and fits in it, the y axis pointing up.
+    '''
+    def __init__(self, width, height, bounds, background='white', margin=2):
+        '''
+        Args:
+            width (int): the image width in pixels
+            height (int): the image height in pixels
+            bounds: the ((xmin, ymin), (xmax, ymax)) box of the drawing coordinates to show
+            background (str): a plotly color
+            margin (int): the number of pixels kept empty around bounds
+        '''
+        self.width, self.height = width, height
+        self.image = np.empty((height, width, 3))
+        self.image[:] = to_rgba(background)[:3]
+
+        self.scale = self.fit_scale(width, height, bounds, margin)
+        self._center = np.asarray(bounds, dtype=float).mean(axis=0)
+
+    @staticmethod
+    def fit_scale(width, height, bounds, margin=2):
+        '''Return the number of pixels per drawing unit of a Raster of these arguments'''
+        lower, upper = np.asarray(bounds, dtype=float)
+        extent = np.where(upper > lower, upper - lower, 1.)
+        available = np.maximum([width - 1 - 2 * margin, height - 1 - 2 * margin], 1)
+        return float(np.min(available / extent))
+
+    def to_pixels(self, points):
+        '''Return the (x, y) pixel coordinates of (N, 2) drawing coordinates'''
+        pixels = (np.asarray(points, dtype=float) - self._center) * self.scale
+        return np.stack([pixels[:, 0] + (self.width - 1) / 2,
+                         (self.height - 1) / 2 - pixels[:, 1]], axis=1)
+
+    def _coverage(self, indices, coverage, alphas=None):
+        '''Return the flat coverage of the pixels of flat indices, accumulated into alphas
+
+        A pixel can appear several times, its coverage is then the maximum one so that the
+        overlapping parts of a primitive are not darkened. The indices of the pixels with a null
+        coverage are ignored, they can be out of the image.
+        '''
+        if alphas is None:
+            alphas = np.zeros(self.width * self.height, dtype=coverage.dtype)
+        covered = coverage > 0
+        # ufunc.at is only fast when no cast is needed
+        np.maximum.at(alphas, indices[covered], coverage[covered].astype(alphas.dtype, copy=False))
+        return alphas
+
+    def _blend(self, alphas, color):
+        '''Blend color over the image with the flat coverage alphas of the pixels'''
+        touched = np.flatnonzero(alphas)
+        red, green, blue, alpha = to_rgba(color)
+        alphas = alphas[touched, np.newaxis] * alpha
+        image = self.image.reshape(-1, 3)
+        image[touched] = image[touched] * (1 - alphas) + np.array([red, green, blue]) * alphas
+
+    def _pixels(self, xs, ys):
+        '''Return the flat indices of the pixels of broadcastable xs and ys arrays and the mask
+        of the ones inside the image'''
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        return ys * self.width + xs, inside
+
+    def draw_lines(self, starts, ends, color, width=1.):
+        '''Draw segments of the same color and width
+
+        Args:
+            starts (np.array): the (N, 2) start points of the segments, in drawing coordinates
+            ends (np.array): the (N, 2) end points of the segments, in drawing coordinates
+            color (str): a plotly color
+            width (float): the line width in pixels
+        '''
+        starts, ends = self.to_pixels(starts), self.to_pixels(ends)
+        # a covered pixel is closer than width / 2 + 0.5 to the segment, so closer than
+        # width / 2 + 1 + spacing / 2 (along each axis) to the rounded sample closest to it.
+        # The spacing is the largest one for which this reach is the one of a spacing of 1.
+        reach = int(np.ceil(width / 2 + 1.5)) - 1
+        spacing = 2 * (reach - width / 2)
+        nb_samples = np.ceil(np.linalg.norm(ends - starts, axis=1) / spacing).astype(int) + 1
+        offsets = np.arange(-reach, reach + 1)
+
+        # the coverage of all the chunks is accumulated before blending, so that the pixels
+        # shared by segments of different chunks are blended once
+        alphas = np.zeros(self.width * self.height, dtype=np.float32)
+        nb_chunks = max(1, int(nb_samples.sum() * len(offsets) ** 2 // CHUNK_PIXELS))
+        for chunk in np.array_split(np.arange(len(starts)), nb_chunks):
+            if len(chunk):
+                self._coverage(*self._line_coverage(starts[chunk], ends[chunk],
+                                                    nb_samples[chunk], offsets, width), alphas)
+        self._blend(alphas, color)
+
+    # pylint: disable=too-many-locals
+    def _line_coverage(self, starts, ends, nb_samples, offsets, width):
+        '''Return the flat indices of the pixels around the segments and their coverage
+
+        The pixels are the offsets around each sample along x and y. The computations are done
+        in float32 as the coverage does not need more precision.
+        '''
+        starts, ends = starts.astype(np.float32), ends.astype(np.float32)
+        deltas = ends - starts
+        squared_lengths = np.einsum('ij,ij->i', deltas, deltas)
+        inverse_lengths = np.divide(1, squared_lengths, out=np.zeros_like(squared_lengths),
+                                    where=squared_lengths > 0)
+
+        segment_ids = np.repeat(np.arange(len(starts)), nb_samples)
+        first = np.repeat(np.cumsum(nb_samples) - nb_samples, nb_samples)
+        steps = ((np.arange(len(segment_ids)) - first) /
+                 np.repeat(np.maximum(nb_samples - 1, 1), nb_samples)).astype(np.float32)
+        samples = np.rint(starts[segment_ids] + steps[:, np.newaxis] * deltas[segment_ids])
+
+        # the arrays are broadcast to (samples, x offsets, y offsets), the integer offsets would
+        # promote them to float64
+        relative = samples - starts[segment_ids]
+        float_offsets = offsets.astype(np.float32)
+        relative_x = (relative[:, 0, np.newaxis] + float_offsets)[:, :, np.newaxis]
+        relative_y = (relative[:, 1, np.newaxis] + float_offsets)[:, np.newaxis, :]
+        delta_x = deltas[segment_ids, 0, np.newaxis, np.newaxis]
+        delta_y = deltas[segment_ids, 1, np.newaxis, np.newaxis]
+        projections = np.clip((relative_x * delta_x + relative_y * delta_y) *
+                              inverse_lengths[segment_ids, np.newaxis, np.newaxis], 0, 1)
+        distances = np.hypot(relative_x - projections * delta_x,
+                             relative_y - projections * delta_y)
+        coverage = np.clip(np.float32(width / 2 + 0.5) - distances, 0, 1)
+
+        samples = samples.astype(int)
+        indices, inside = self._pixels((samples[:, 0, np.newaxis] + offsets)[:, :, np.newaxis],
+                                       (samples[:, 1, np.newaxis] + offsets)[:, np.newaxis, :])
+        coverage *= inside
+        return indices.ravel(), coverage.ravel()
+
+    def draw_disc(self, center, radius, color=None, line_color=None, line_width=0):
+        '''Draw a filled and/or outlined disc
+
+        Args:
+            center: the (x, y) center in drawing coordinates
+            radius (float): the radius in drawing coordinates
+            color (str): the fill plotly color or None
+            line_color (str): the outline plotly color or None
+            line_width (float): the outline width in pixels
+        '''
+        center = self.to_pixels([center])[0]
+        radius = radius * self.scale
+        reach = radius + line_width / 2 + 1
+        xs = np.arange(int(np.floor(center[0] - reach)), int(np.ceil(center[0] + reach)) + 1)
+        ys = np.arange(int(np.floor(center[1] - reach)), int(np.ceil(center[1] + reach)) + 1)
+        indices, inside = self._pixels(xs[np.newaxis], ys[:, np.newaxis])
+        indices = indices.ravel()
+        distances = np.hypot(xs[np.newaxis] - center[0], ys[:, np.newaxis] - center[1])
+        if color is not None:
+            self._blend(self._coverage(
+                indices, (np.clip(radius + 0.5 - distances, 0, 1) * inside).ravel()), color)
+        if line_color is not None and line_width > 0:
+            coverage = np.clip(line_width / 2 + 0.5 - np.abs(distances - radius), 0, 1)
+            self._blend(self._coverage(indices, (coverage * inside).ravel()), line_color)
+
+    def draw_shape(self, shape):
+        '''Draw a 'circle' or 'line' plotly shape dict (see shapes.py)
+
+        Raises:
+            ValueError: for the other shape types
+        '''
+        line = shape.get('line', {})
+        line_width = line.get('width', DEFAULT_SHAPE_LINE_WIDTH)
+        if shape['type'] == 'line':
+            self.draw_lines([[shape['x0'], shape['y0']]], [[shape['x1'], shape['y1']]],
+                            line.get('color', 'black'), line_width)
+        elif shape['type'] == 'circle':
+            # plotly circles are ellipses in their box, they are drawn as the inscribed disc
+            center = ((shape['x0'] + shape['x1']) / 2, (shape['y0'] + shape['y1']) / 2)
+            radius = min(abs(shape['x1'] - shape['x0']), abs(shape['y1'] - shape['y0'])) / 2
+            self.draw_disc(center, radius, shape.get('fillcolor'), line.get('color'), line_width)
+        else:
+            raise ValueError(f'unsupported shape type {shape["type"]}')
+
+    def to_uint8(self):
+        '''Return the image as an (height, width, 3) uint8 array'''
+        return np.rint(np.clip(self.image, 0, 1) * 255).astype(np.uint8)
@@ -0,0 +1,165 @@
+'''Spatial regions used to crop the neurite polylines
+
+The regions are convex, so the part of a segment inside a region is a single interval of its
+parameter. The intervals of all the segments are computed at once, and then the polylines are
+split where they leave the region.
+'''
+import numpy as np
+
+
+class Box:
+    '''An axis aligned box'''
+    def __init__(self, lower, upper):
+        '''
+        Args:
+            lower: the (x, y, z) minimum corner
+            upper: the (x, y, z) maximum corner
+
+        Raises:
+            ValueError: if a lower coordinate is greater than the upper one
+        '''
+        self.lower = np.asarray(lower, dtype=float)
+        self.upper = np.asarray(upper, dtype=float)
+        if self.lower.shape != (3,) or self.upper.shape != (3,) or (self.lower > self.upper).any():
+            raise ValueError(f'invalid box {lower}, {upper}')
+
+    def key(self):
+        '''A json serializable description of the region'''
+        return ['box', self.lower.tolist(), self.upper.tolist()]
+
+    def bounds(self):
+        '''The (lower, upper) corners of the bounding box of the region'''
+        return self.lower, self.upper
+
+    def contains(self, points):
+        '''Return whether each of the (N, 3) points is inside the region'''
+        points = np.asarray(points, dtype=float)
+        return ((points >= self.lower) & (points <= self.upper)).all(axis=-1)
+
+    def clip(self, starts, ends):
+        '''Return the parameters (t0, t1) of the part of each segment inside the box
+
+        The part of the segment i inside the box is [starts[i] + t0[i] * (ends[i] - starts[i]),
+        starts[i] + t1[i] * (ends[i] - starts[i])] and it is empty if t0[i] > t1[i]. This is the
+        Liang-Barsky algorithm, applied to all the segments at once.
+        '''
+        starts, ends = np.asarray(starts, dtype=float), np.asarray(ends, dtype=float)
+        deltas = ends - starts
+        parallel = deltas == 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            to_lower = (self.lower - starts) / deltas
+            to_upper = (self.upper - starts) / deltas
+        # the segments parallel to a pair of faces are either always or never between them
+        between = (starts >= self.lower) & (starts <= self.upper)
+        enter = np.where(parallel, np.where(between, -np.inf, np.inf),
+                         np.minimum(to_lower, to_upper))
+        leave = np.where(parallel, np.where(between, np.inf, -np.inf),
+                         np.maximum(to_lower, to_upper))
+        return np.maximum(enter.max(axis=1), 0.), np.minimum(leave.min(axis=1), 1.)
+
+
+class Sphere:
+    '''A ball'''
+    def __init__(self, center, radius):
+        '''
+        Args:
+            center: the (x, y, z) center
+            radius (float): the radius
+
+        Raises:
+            ValueError: if the radius is negative
+        '''
+        self.center = np.asarray(center, dtype=float)
+        self.radius = float(radius)
+        if self.center.shape != (3,) or self.radius < 0:
+            raise ValueError(f'invalid sphere {center}, {radius}')
+
+    def key(self):
+        '''A json serializable description of the region'''
+        return ['sphere', self.center.tolist(), self.radius]
+
+    def bounds(self):
+        '''The (lower, upper) corners of the bounding box of the region'''
+        return self.center - self.radius, self.center + self.radius
+
+    def contains(self, points):
+        '''Return whether each of the (N, 3) points is inside the region'''
+        offsets = np.asarray(points, dtype=float) - self.center
+        return np.einsum('...i,...i->...', offsets, offsets) <= self.radius ** 2
+
+    def clip(self, starts, ends):
+        '''Return the parameters (t0, t1) of the part of each segment inside the sphere
+
+        See Box.clip. The parameters are the roots of |starts + t * deltas - center| = radius.
+        '''
+        starts, ends = np.asarray(starts, dtype=float), np.asarray(ends, dtype=float)
+        deltas = ends - starts
+        offsets = starts - self.center
+        a = np.einsum('ij,ij->i', deltas, deltas)
+        b = np.einsum('ij,ij->i', deltas, offsets)
+        c = np.einsum('ij,ij->i', offsets, offsets) - self.radius ** 2
+        root = np.sqrt(np.maximum(b ** 2 - a * c, 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t0, t1 = (-b - root) / a, (-b + root) / a
+        missed = b ** 2 - a * c < 0
+        # the null segments are inside if their point is
+        point = a == 0
+        t0 = np.where(point, np.where(c <= 0, 0., 1.), np.where(missed, 1., t0))
+        t1 = np.where(point, np.where(c <= 0, 1., 0.), np.where(missed, 0., t1))
+        return np.maximum(t0, 0.), np.minimum(t1, 1.)
+
+
+# pylint: disable=too-many-locals
+def crop(polylines, region):
+    '''Split many polylines at once into the pieces that are inside a region
+
+    The segments are clipped in a single vectorized pass: the ones outside the region are
+    dropped and the ones crossing its boundary are shortened. A polyline is split in several
+    pieces if it leaves the region and comes back, and it is dropped if it is completely outside.
+
+    Args:
+        polylines (list): the (N_i, D) point arrays of the polylines. The first 3 columns are
+            the coordinates and the other ones (ex: the radius) are interpolated linearly at the
+            boundary.
+        region: a Box or a Sphere
+
+    Returns:
+        a tuple (polyline_ids, first_segments, pieces) where pieces is the list of the point
+        arrays of the pieces, polyline_ids the index of the polyline of each piece and
+        first_segments the index, in its polyline, of the first segment of each piece
+    '''
+    sizes = np.array([len(points) for points in polylines], dtype=int)
+    empty = np.zeros(0, dtype=int), np.zeros(0, dtype=int), []
+    if not sizes.sum():
+        return empty
+    points = np.concatenate(polylines).astype(float)
+    polyline_ids = np.repeat(np.arange(len(sizes)), sizes)
+    is_start = np.ones(len(points), dtype=bool)
+    is_start[np.cumsum(sizes) - 1] = False
+    starts = np.flatnonzero(is_start)
+
+    t0, t1 = region.clip(points[starts, :3], points[starts + 1, :3])
+    kept = t0 < t1
+    if not kept.any():
+        return empty
+    starts, t0, t1 = starts[kept], t0[kept, np.newaxis], t1[kept, np.newaxis]
+    deltas = points[starts + 1] - points[starts]
+    firsts = points[starts] + t0 * deltas
+    lasts = points[starts] + t1 * deltas
+
+    # a piece starts at each kept segment that does not continue the previous kept segment
+    is_new = np.ones(len(starts), dtype=bool)
+    is_new[1:] = ((starts[1:] != starts[:-1] + 1) | (t0[1:, 0] > 0) | (t1[:-1, 0] < 1) |
+                  (polyline_ids[starts[1:]] != polyline_ids[starts[:-1]]))
+    # each piece has its first point then the last point of each of its segments
+    nb_pieces = np.cumsum(is_new)
+    result = np.empty((len(starts) + nb_pieces[-1], points.shape[1]))
+    result[np.arange(len(starts)) + nb_pieces] = lasts
+    result[np.flatnonzero(is_new) + nb_pieces[is_new] - 1] = firsts[is_new]
+
+    piece_starts = np.flatnonzero(is_new)
+    offsets = np.cumsum(sizes) - sizes
+    piece_polylines = polyline_ids[starts[piece_starts]]
+    piece_sizes = np.diff(np.append(piece_starts, len(starts))) + 1
+    pieces = np.split(result, np.cumsum(piece_sizes)[:-1])
+    return piece_polylines, starts[piece_starts] - offsets[piece_polylines], pieces
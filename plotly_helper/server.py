@@ -0,0 +1,297 @@
+'''A localhost HTTP server to browse the morphologies of a directory
+
+The index page loads plotly.js once and fetches the figures as json when a morphology is
+selected, so switching between cells only costs a request and a Plotly.react call. The figures
+are built on demand by NeuronBuilder and kept serialized in an in-memory LRU cache.
+'''
+import html
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from plotly_helper.batch import PLANES, iter_inputs
+from plotly_helper.helper import get_plotlyjs, write_fig_json
+
+DEFAULT_MAX_SIZE = 512 * 1024 ** 2
+# the number of figures kept by the page, for going back and forth between cells
+PAGE_CACHE_SIZE = 16
+
+_INDEX = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="plotly.min.js"></script>
+<style>
+body {{margin: 0; font-family: sans-serif;}}
+#bar {{padding: 8px;}}
+#plot {{height: calc(100vh - 50px);}}
+</style>
+</head>
+<body>
+<div id="bar">
+<select id="morphology">{morphologies}</select>
+<select id="plane">{planes}</select>
+<span id="status"></span>
+</div>
+<div id="plot"></div>
+<script>
+const morphology = document.getElementById('morphology');
+const plane = document.getElementById('plane');
+const status = document.getElementById('status');
+const figures = new Map();
+
+function figureUrl(index) {{
+  return 'figure/' + encodeURIComponent(morphology.options[index].value) +
+         '?plane=' + plane.value;
+}}
+
+function fetchFigure(url) {{
+  if (!figures.has(url)) {{
+    figures.set(url, fetch(url).then(response => {{
+      if (!response.ok) {{
+        figures.delete(url);
+        return response.text().then(text => {{ throw new Error(text); }});
+      }}
+      return response.json();
+    }}));
+    if (figures.size > {page_cache_size}) {{
+      figures.delete(figures.keys().next().value);
+    }}
+  }}
+  return figures.get(url);
+}}
+
+async function show() {{
+  const index = morphology.selectedIndex;
+  const start = performance.now();
+  status.textContent = 'loading...';
+  try {{
+    const figure = await fetchFigure(figureUrl(index));
+    const layout = Object.assign({{}}, figure.layout, {{height: null, autosize: true}});
+    await Plotly.react('plot', figure.data, layout, {{responsive: true}});
+    status.textContent = Math.round(performance.now() - start) + ' ms';
+  }} catch (error) {{
+    status.textContent = error.message;
+  }}
+  // the next cell is prefetched so that stepping through the collection does not wait
+  if (index + 1 < morphology.options.length) {{
+    fetchFigure(figureUrl(index + 1)).catch(() => {{}});
+  }}
+}}
+
+morphology.addEventListener('change', show);
+plane.addEventListener('change', show);
+if (morphology.options.length) {{
+  show();
+}}
+</script>
+</body>
+</html>
+'''
+
+
+class FigureCache:
+    '''A thread safe, size bounded, least recently used in-memory cache of serialized figures
+
+    A figure requested by several threads at the same time is only built once.
+    '''
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        '''
+        Args:
+            max_size (int): the maximum total size of the cached values in bytes. The most
+                recent value is always kept, even if it is larger.
+        '''
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # the locks held while a figure is built
+        self._building = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        '''Return the cached value or None, the cache lock must be held'''
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def get(self, key, build):
+        '''Return the cached bytes of key or store and return the ones returned by build()'''
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            key_lock = self._building.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                value = self._lookup(key)
+            if value is not None:
+                return value
+            try:
+                value = build()
+            except BaseException:
+                with self._lock:
+                    self._building.pop(key, None)
+                raise
+
+            # the value is visible as soon as the key lock is forgotten: a request arriving in
+            # between would otherwise build it again
+            with self._lock:
+                self._building.pop(key, None)
+                self._entries[key] = value
+                self.size += len(value)
+                while self.size > self.max_size and len(self._entries) > 1:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return value
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    '''The routes of the MorphologyServer'''
+    def _send(self, status, content_type, body, cache_control='no-cache'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send(status, 'text/plain; charset=utf-8', message.encode('utf-8'))
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        '''Serve the index, plotly.js and the figures'''
+        url = urlparse(self.path)
+        if url.path == '/':
+            self._send(HTTPStatus.OK, 'text/html; charset=utf-8', self.server.index_html)
+        elif url.path == '/plotly.min.js':
+            self._send(HTTPStatus.OK, 'application/javascript; charset=utf-8',
+                       self.server.plotlyjs, cache_control='public, max-age=86400')
+        elif url.path.startswith('/figure/'):
+            name = unquote(url.path[len('/figure/'):])
+            plane = parse_qs(url.query).get('plane', [self.server.plane])[0]
+            try:
+                body = self.server.figure_json(name, plane)
+            except KeyError:
+                self._send_error(HTTPStatus.NOT_FOUND, f'unknown morphology {name}')
+            except ValueError as error:
+                self._send_error(HTTPStatus.BAD_REQUEST, str(error))
+            except Exception as error:  # pylint: disable=broad-except
+                self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR,
+                                 f'{type(error).__name__}: {error}')
+            else:
+                self._send(HTTPStatus.OK, 'application/json', body)
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, f'unknown path {url.path}')
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class MorphologyServer(HTTPServer):
+    '''An HTTP server of the figures of a morphology collection
+
+    The requests are handled by a pool of threads. The routes are:
+        /: the index page
+        /plotly.min.js: the plotly.js bundle, read once and cached by the browsers
+        /figure/<name>?plane=<plane>: the figure json of a morphology
+    '''
+    # pylint: disable=too-many-arguments
+    def __init__(self, address, inputs, plane='3d', threads=4, max_size=DEFAULT_MAX_SIZE,
+                 typed_arrays=None, verbose=False, **kwargs):
+        '''
+        Args:
+            address: the (host, port) to listen to, the port 0 picks a free port
+            inputs (str): a morphology directory, an archive directory (see
+                archive.write_archive) or a glob pattern. The morphologies are identified by
+                their file names or their archived names.
+            plane (str): the plane shown first and used by the requests without plane
+            threads (int): the number of threads handling the requests
+            max_size (int): the maximum size in bytes of the in-memory cache of figures
+            typed_arrays (str): None or the float dtype used to encode the trace arrays as
+                base64 typed arrays
+            verbose (bool): log the requests to stderr
+
+        All other kwargs are passed to NeuronBuilder (ex: lod or cache)
+        '''
+        if plane not in PLANES:
+            raise ValueError(f'unknown plane {plane}, expected one of {PLANES}')
+        super().__init__(address, _RequestHandler)
+        self.morphologies = {os.path.basename(path): path for path in iter_inputs(inputs)}
+        self.plane = plane
+        self.typed_arrays = typed_arrays
+        self.verbose = verbose
+        self.builder_kwargs = kwargs
+        self.figures = FigureCache(max_size)
+        self.index_html = self._index_html(inputs)
+        self._plotlyjs = None
+        self._plotlyjs_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+
+    def _index_html(self, inputs):
+        '''The index page'''
+        morphologies = ''.join(f'<option>{html.escape(name)}</option>'
+                               for name in self.morphologies)
+        planes = ''.join(f'<option{" selected" if plane == self.plane else ""}>{plane}</option>'
+                         for plane in PLANES)
+        return _INDEX.format(title=html.escape(str(inputs)), morphologies=morphologies,
+                             planes=planes, page_cache_size=PAGE_CACHE_SIZE).encode('utf-8')
+
+    @property
+    def plotlyjs(self):
+        '''The plotly.js bundle, read on first access'''
+        with self._plotlyjs_lock:
+            if self._plotlyjs is None:
+                self._plotlyjs = get_plotlyjs().encode('utf-8')
+        return self._plotlyjs
+
+    def figure_json(self, name, plane):
+        '''Return the figure json of a morphology, from the cache if possible
+
+        Raises:
+            KeyError: if name is not a morphology of the collection
+            ValueError: if plane is unknown
+        '''
+        path = self.morphologies[name]
+        if plane not in PLANES:
+            raise ValueError(f'unknown plane {plane}, expected one of {PLANES}')
+        return self.figures.get((name, plane), lambda: self._build_figure(name, path, plane))
+
+    def _build_figure(self, name, path, plane):
+        '''Build the figure of a morphology and serialize it'''
+        # pylint: disable=import-outside-toplevel
+        from plotly_helper.neuron_viewer import NeuronBuilder
+        fig = NeuronBuilder(path, plane, os.path.splitext(name)[0],
+                            **self.builder_kwargs).get_figure()
+        fd = io.StringIO()
+        write_fig_json(fig, fd, self.typed_arrays)
+        return fd.getvalue().encode('utf-8')
+
+    def process_request(self, request, client_address):
+        '''Handle the request in the thread pool'''
+        self._executor.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        '''Same as socketserver.ThreadingMixIn.process_request_thread'''
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # pylint: disable=broad-except
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        '''Close the socket and wait for the requests being handled'''
+        super().server_close()
+        self._executor.shutdown(wait=True)
@@ -10,7 +10,7 @@ setup(
     url="https://github.com/bluebrain/plotly-helper",
     license="LGPLv3",
     install_requires=[
-        'plotly>=3.4.2',
+        'plotly>=5.19',
         'numpy>=1.15.4',
         'neurom>=3.0,<5.0',
         'click>=6.0',
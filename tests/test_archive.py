@@ -0,0 +1,143 @@
+import os
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+from neurom import NeuriteType, iter_neurites, iter_sections, load_morphology
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+
+from plotly_helper.archive import (MorphologyArchive, is_archive, load_member, member_digest,
+                                   split_member, write_archive)
+from plotly_helper.batch import iter_inputs, render_all
+from plotly_helper.cache import TraceCache
+from plotly_helper.cli import cli
+from plotly_helper.neuron_viewer import NeuronBuilder
+from plotly_helper.population_viewer import PopulationBuilder
+
+PATH = os.path.dirname(__file__)
+NEURON_PATH = os.path.join(PATH, 'data', 'neuron.h5')
+
+
+@pytest.fixture
+def archive(tmp_path):
+    neuron = load_morphology(NEURON_PATH)
+    assert write_archive([('a', neuron), ('b', neuron)], str(tmp_path)) == ['a', 'b']
+    return MorphologyArchive(str(tmp_path))
+
+
+def test_archive(archive):
+    assert is_archive(archive.directory)
+    assert len(archive) == 2 and 'a' in archive and 'c' not in archive
+    assert isinstance(archive.points, np.memmap)
+    assert archive.section_offsets[-1] == len(archive.points)
+    with pytest.raises(KeyError):
+        archive['c']
+
+    neuron = load_morphology(NEURON_PATH)
+    archived = archive['b']
+    assert_array_almost_equal(archived.points, neuron.points)
+    assert_array_almost_equal(archived.soma.center, neuron.soma.center)
+    assert archived.soma.radius == pytest.approx(neuron.soma.radius)
+    assert [neurite.type for neurite in archived.neurites] == [
+        neurite.type for neurite in iter_neurites(neuron)]
+
+    sections = list(iter_sections(archived))
+    expected = list(iter_sections(neuron))
+    assert [section.id for section in sections] == [section.id for section in expected]
+    for section, expected_section in zip(sections, expected):
+        assert_array_almost_equal(section.points, expected_section.points)
+    assert sections[2].parent == sections[1] and sections[1].parent is None
+    assert sections[2].parent != sections[0] and sections[1].is_root()
+    assert sections[0].is_root() and sections[0].type == NeuriteType.axon
+    assert [archived_section.id for archived_section in archived.neurites[1].root_node.children] \
+        == [section.id for section in neuron.neurites[1].root_node.children]
+
+
+def test_write_archive_errors(tmp_path):
+    neuron = load_morphology(NEURON_PATH)
+    with pytest.raises(ValueError):
+        write_archive([('a', neuron), ('a', neuron)], str(tmp_path / 'duplicated'))
+
+    write_archive([], str(tmp_path / 'empty'))
+    assert len(MorphologyArchive(str(tmp_path / 'empty'))) == 0
+    assert not is_archive(str(tmp_path))
+
+
+def test_neuron_builder_archive(archive):
+    neuron = load_morphology(NEURON_PATH)
+    for plane, kwargs in [('3d', {}), ('xy', {'merge_traces': True}), ('3d', {'tubes': True})]:
+        expected = NeuronBuilder(neuron, plane, **kwargs).get_figure()['data']
+        data = NeuronBuilder(archive['a'], plane, **kwargs).get_figure()['data']
+        assert len(data) == len(expected)
+        for trace, expected_trace in zip(data, expected):
+            assert_array_almost_equal(np.asarray(trace.x, dtype=float),
+                                      np.asarray(expected_trace.x, dtype=float))
+
+    builder = NeuronBuilder(archive['a'], 'xy')
+    builder.color_section(archive['a'].sections[5], recursive=True)
+    builder.color_by('radius')
+    assert len(builder.get_figure()['data']) == 179
+    assert builder.get_image().shape == (256, 256, 3)
+
+
+def test_population_builder_archive(archive):
+    neuron = load_morphology(NEURON_PATH)
+    expected = PopulationBuilder([neuron, neuron], 'xz').get_figure()['data']
+    data = PopulationBuilder(archive, 'xz').get_figure()['data']
+    assert [trace.name for trace in data] == [trace.name for trace in expected]
+    for trace, expected_trace in zip(data, expected):
+        assert_array_almost_equal(np.asarray(trace.x, dtype=float),
+                                  np.asarray(expected_trace.x, dtype=float))
+
+
+def test_cli_pack(tmp_path):
+    (tmp_path / 'inputs').mkdir()
+    (tmp_path / 'inputs' / 'broken.swc').write_text('not a morphology')
+    os.symlink(NEURON_PATH, tmp_path / 'inputs' / 'neuron.h5')
+    runner = CliRunner()
+    result = runner.invoke(cli, ['pack', str(tmp_path / 'inputs'), str(tmp_path / 'archive')])
+    assert result.exit_code == 1
+    assert result.output.splitlines()[-1] == \
+        f'1 morphologies packed in {tmp_path / "archive"}, 1 failures'
+    assert MorphologyArchive(str(tmp_path / 'archive')).names == ['neuron.h5']
+
+
+def test_archive_members(archive, tmp_path):
+    inputs = iter_inputs(archive.directory)
+    assert inputs == [os.path.join(archive.directory, 'a'), os.path.join(archive.directory, 'b')]
+    assert split_member(inputs[1]) == (archive.directory, 'b')
+    assert split_member(NEURON_PATH) is None
+    assert_array_equal(load_member(inputs[0]).points, archive['a'].points)
+    assert member_digest(inputs[0]) == member_digest(inputs[1]) == archive.digest('a')
+    with pytest.raises(KeyError):
+        load_member(os.path.join(archive.directory, 'c'))
+
+    reports = list(render_all(inputs, str(tmp_path / 'out'), 'xy', 'png'))
+    assert [(input_file, error) for input_file, _, error, _ in reports] == [
+        (inputs[0], None), (inputs[1], None)]
+    assert sorted(os.listdir(tmp_path / 'out')) == ['.render-options.json', 'a.png', 'b.png']
+    # the outputs are up to date until the archive is written again
+    assert [elapsed for _, elapsed, _, _ in render_all(inputs, str(tmp_path / 'out'), 'xy',
+                                                       'png')] == [None, None]
+    write_archive([('a', load_morphology(NEURON_PATH))], archive.directory)
+    mtime = os.path.getmtime(tmp_path / 'out' / 'a.png') + 10
+    os.utime(os.path.join(archive.directory, 'index.json'), (mtime, mtime))
+    assert [elapsed is None for _, elapsed, _, _ in render_all(
+        iter_inputs(archive.directory), str(tmp_path / 'out'), 'xy', 'png')] == [False]
+
+    cache = TraceCache(str(tmp_path / 'cache'))
+    expected = NeuronBuilder(NEURON_PATH, 'xy').get_figure()['data']
+    NeuronBuilder(inputs[0], 'xy', cache=cache).get_figure()
+    data = NeuronBuilder(inputs[0], 'xy', cache=cache).get_figure()['data']
+    assert len(data) == len(expected)
+    assert_array_almost_equal(np.asarray(data[0].x, dtype=float),
+                              np.asarray(expected[0].x, dtype=float))
+
+
+def test_cli_render_archive(archive, tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(cli, ['render', archive.directory, str(tmp_path / 'out'),
+                                 '--format', 'json', '--plane', 'xy', '-j', '2'])
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines()[-1] == '2 files, 0 failures'
+    assert sorted(os.listdir(tmp_path / 'out')) == ['.render-options.json', 'a.json', 'b.json']
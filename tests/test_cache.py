@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+from contextlib import nullcontext
+from unittest.mock import patch
+
+import numpy as np
+import numpy.testing as npt
+
+from plotly_helper.cache import CACHE_VERSION, TraceCache, file_digest
+from plotly_helper.neuron_viewer import NeuronBuilder
+
+PATH = os.path.dirname(__file__)
+
+
+def test_file_digest():
+    digest = file_digest(os.path.join(PATH, 'data', 'neuron.h5'))
+    assert digest == file_digest(os.path.join(PATH, 'data', 'neuron.h5'), chunk_size=1000)
+    assert len(digest) == 64
+
+
+def test_trace_cache(tmp_path):
+    cache = TraceCache(str(tmp_path / 'cache'))
+    key = cache.key('digest', 'xyz', 2, None, [[1, 'red', 0, 3]])
+    assert key != cache.key('digest', 'xyz', 3, None, [[1, 'red', 0, 3]])
+    assert cache.get(key) is None
+
+    obj = {'data': [{'x': np.array([1., np.nan, 2.], dtype=np.float32), 'name': 'a',
+                     'line': {'color': ['red', 'blue'], 'width': np.int64(2)},
+                     'i': np.arange(3)}],
+           'shapes': [{'x0': np.float32(1.5)}]}
+    cache.put(key, obj)
+    cached = cache.get(key)
+    npt.assert_array_equal(cached['data'][0].pop('x'), obj['data'][0]['x'])
+    npt.assert_array_equal(cached['data'][0].pop('i'), [0, 1, 2])
+    assert cached == {'data': [{'name': 'a', 'line': {'color': ['red', 'blue'], 'width': 2}}],
+                      'shapes': [{'x0': 1.5}]}
+
+    # corrupted entries are misses
+    with open(tmp_path / 'cache' / f'{key}.npz', 'wb') as fd:
+        fd.write(b'garbage')
+    assert cache.get(key) is None
+
+
+def test_trace_cache_eviction(tmp_path):
+    cache = TraceCache(str(tmp_path), max_size=4000)
+    for i in range(3):
+        cache.put(str(i), {'x': np.zeros(100)})
+        os.utime(tmp_path / f'{i}.npz', (i, i))
+    # reading an entry makes it the most recently used one
+    assert cache.get('0') is not None
+    cache.put('3', {'x': np.zeros(100)})
+    assert sorted(os.listdir(tmp_path)) == ['0.npz', '2.npz', '3.npz']
+
+
+def test_trace_cache_concurrent_eviction(tmp_path):
+    cache = TraceCache(str(tmp_path))
+    for i in range(3):
+        cache.put(str(i), {'x': np.zeros(100)})
+        os.utime(tmp_path / f'{i}.npz', (i, i))
+    cache.max_size = os.path.getsize(tmp_path / '2.npz')
+    with os.scandir(tmp_path) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    # another process evicts an entry between the listing and its stat
+    os.remove(tmp_path / '1.npz')
+    with patch('plotly_helper.cache.os.scandir', return_value=nullcontext(iter(entries))):
+        cache.evict()
+    assert sorted(os.listdir(tmp_path)) == ['2.npz']
+
+
+def test_trace_cache_default_directory(monkeypatch):
+    monkeypatch.setenv('PLOTLY_HELPER_CACHE_DIR', '/some/dir')
+    assert TraceCache().directory == '/some/dir'
+
+
+# the fingerprint of the structure of the cached payloads for each CACHE_VERSION
+PAYLOAD_FINGERPRINTS = {
+    5: '3edba98794aa8b862ca5c00f5575fdfd6d9bf93f76a43ecea857379c3d3c7217',
+}
+
+
+class _RecordingCache(TraceCache):
+    '''A TraceCache keeping the stored objects'''
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.stored = []
+
+    def put(self, key, obj):
+        self.stored.append(obj)
+        super().put(key, obj)
+
+
+def _structure(obj):
+    '''The types, dtypes and nesting of a cached object, without its values'''
+    if isinstance(obj, dict):
+        return {key: _structure(value) for key, value in sorted(obj.items())}
+    if isinstance(obj, (list, tuple)):
+        return sorted({json.dumps(_structure(value), sort_keys=True) for value in obj})
+    if isinstance(obj, np.ndarray):
+        return f'array:{obj.dtype}:{obj.ndim}'
+    return type(obj).__name__
+
+
+def test_cache_version(tmp_path):
+    '''Fails when the cached payload changes: CACHE_VERSION must then be bumped so that the
+    entries written by the previous versions are not read'''
+    path = os.path.join(PATH, 'data', 'neuron.h5')
+    cache = _RecordingCache(str(tmp_path))
+    NeuronBuilder(path, '3d', cache=cache).get_figure()
+    builder = NeuronBuilder(path, '3d', cache=cache)
+    builder.color_section(builder.neuron.sections[3], color='orange', recursive=True)
+    builder.get_figure()
+    builder = NeuronBuilder(path, '3d', cache=cache, soma_mesh='icosphere', tubes=True)
+    builder.color_by('radius')
+    builder.get_figure()
+    NeuronBuilder(path, 'xy', cache=cache).get_figure()
+    NeuronBuilder(path, 'xy', cache=cache, merge_traces=True).get_figure()
+    NeuronBuilder(path, 'xy', cache=cache).get_image(32)
+
+    fingerprint = hashlib.sha256(json.dumps([_structure(obj) for obj in cache.stored],
+                                            sort_keys=True).encode()).hexdigest()
+    assert PAYLOAD_FINGERPRINTS.get(CACHE_VERSION) == fingerprint, (
+        'the cached payload changed: bump CACHE_VERSION and record the new fingerprint')
@@ -1,4 +1,6 @@
+import json
 import os
+import shutil
 
 from click.testing import CliRunner
 
@@ -14,3 +16,118 @@ def test_cli(_):
     runner = CliRunner()
     result = runner.invoke(cli, ['view', os.path.join(PATH, 'data', 'neuron.h5')])
     assert result.exit_code == 0
+
+    result = runner.invoke(cli, ['view', os.path.join(PATH, 'data', 'neuron.h5'),
+                                 '--plane', 'xy', '--tolerance', '0.5'])
+    assert result.exit_code == 0
+
+    result = runner.invoke(cli, ['view', os.path.join(PATH, 'data', 'neuron.h5'), '--tubes'])
+    assert result.exit_code == 0
+
+    result = runner.invoke(cli, ['view', os.path.join(PATH, 'data', 'neuron.h5'), '--tubes',
+                                 '--plane', 'xy'])
+    assert result.exit_code == 2
+
+    result = runner.invoke(cli, ['view', os.path.join(PATH, 'data', 'neuron.h5'), '--profile'])
+    assert result.exit_code == 0
+    assert [line.split()[0] for line in result.output.splitlines()[2:]] == [
+        'load', 'neurites', 'soma', 'assembly', 'serialization']
+
+
+# patching plotly.offline.plot to avoid the call
+@patch('plotly_helper.neuron_viewer.plot_')
+def test_cli_cache(_, tmp_path):
+    runner = CliRunner()
+    for _ in range(2):
+        result = runner.invoke(cli, ['view', os.path.join(PATH, 'data', 'neuron.h5'),
+                                     '--cache-dir', str(tmp_path)])
+        assert result.exit_code == 0
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_cli_render(tmp_path):
+    input_dir = tmp_path / 'morphologies'
+    input_dir.mkdir()
+    shutil.copy(os.path.join(PATH, 'data', 'neuron.h5'), input_dir / 'neuron.h5')
+    (input_dir / 'broken.swc').write_text('not a morphology')
+    output_dir = tmp_path / 'output'
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['render', str(input_dir), str(output_dir), '--format', 'json'])
+    assert result.exit_code == 1
+    assert f'OK   {input_dir / "neuron.h5"}' in result.output
+    assert f'FAIL {input_dir / "broken.swc"}' in result.output
+    with open(output_dir / 'neuron.json', encoding='utf-8') as fd:
+        assert len(json.load(fd)['data']) == 5
+
+    result = runner.invoke(cli, ['render', str(input_dir / '*.h5'), str(output_dir),
+                                 '--format', 'json', '--jobs', '2'])
+    assert result.exit_code == 0
+    assert f'SKIP {input_dir / "neuron.h5"}' in result.output
+
+    # the outputs rendered with other options are stale
+    for options in (['--plane', 'xy'], ['--typed-arrays', 'float32'],
+                    ['--box', '-50', '-50', '-50', '50', '50', '50'], []):
+        result = runner.invoke(cli, ['render', str(input_dir / '*.h5'), str(output_dir),
+                                     '--format', 'json', *options])
+        assert result.exit_code == 0
+        assert f'OK   {input_dir / "neuron.h5"}' in result.output, options
+    result = runner.invoke(cli, ['render', str(input_dir / '*.h5'), str(output_dir),
+                                 '--format', 'json', '--cache-dir', str(tmp_path / 'cache')])
+    assert f'SKIP {input_dir / "neuron.h5"}' in result.output
+
+    # neuron.h5 and neuron.swc would both be rendered to neuron.json
+    (input_dir / 'neuron.swc').write_text('not a morphology')
+    result = runner.invoke(cli, ['render', str(input_dir), str(output_dir), '--format', 'json',
+                                 '--force'])
+    assert result.exit_code == 1
+    assert 'would both be rendered to' in result.output
+    assert 'OK' not in result.output
+    (input_dir / 'neuron.swc').unlink()
+
+    result = runner.invoke(cli, ['render', str(input_dir / '*.h5'), str(output_dir),
+                                 '--jobs', '2', '--plane', 'xy', '--tolerance', '1',
+                                 '--typed-arrays', 'float32', '--shared-plotlyjs'])
+    assert result.exit_code == 0
+    assert (output_dir / 'neuron.html').exists()
+    assert (output_dir / 'plotly.min.js').exists()
+
+
+def test_cli_render_png(tmp_path):
+    runner = CliRunner()
+    input_file = os.path.join(PATH, 'data', 'neuron.h5')
+    result = runner.invoke(cli, ['render', input_file, str(tmp_path), '--format', 'png',
+                                 '--plane', 'yz', '--size', '64'])
+    assert result.exit_code == 0
+    assert (tmp_path / 'neuron.png').read_bytes()[:8] == b'\x89PNG\r\n\x1a\n'
+
+    result = runner.invoke(cli, ['render', input_file, str(tmp_path), '--format', 'png',
+                                 '--plane', 'yz', '--force', '--profile-memory'])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert 'peak (MB)' in lines[2]
+    assert lines[-1].split()[0] == 'serialization'
+    assert lines[-1].endswith(f'bytes={(tmp_path / "neuron.png").stat().st_size}')
+
+    result = runner.invoke(cli, ['render', input_file, str(tmp_path), '--format', 'png'])
+    assert result.exit_code == 2
+
+
+def test_cli_render_region(tmp_path):
+    runner = CliRunner()
+    input_file = os.path.join(PATH, 'data', 'neuron.h5')
+    result = runner.invoke(cli, ['render', input_file, str(tmp_path), '--format', 'json',
+                                 '--box', '-50', '-50', '-50', '50', '50', '50'])
+    assert result.exit_code == 0
+    with open(tmp_path / 'neuron.json', encoding='utf-8') as fd:
+        xs = [x for trace in json.load(fd)['data'][:4] for x in trace['x'] if x is not None]
+    assert min(xs) >= -50 and max(xs) <= 50
+
+    result = runner.invoke(cli, ['render', input_file, str(tmp_path), '--force',
+                                 '--sphere', '0', '0', '0', '50', '--box', '0', '0', '0', '1',
+                                 '1', '1'])
+    assert result.exit_code == 2
+
+    result = runner.invoke(cli, ['render', input_file, str(tmp_path), '--force',
+                                 '--sphere', '0', '0', '0', '-1'])
+    assert result.exit_code == 2
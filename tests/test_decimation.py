@@ -0,0 +1,37 @@
+import numpy as np
+import numpy.testing as npt
+
+from plotly_helper.decimation import simplify
+
+
+def test_simplify():
+    t = np.linspace(0, 10, 101)
+    straight = np.stack([t, np.zeros_like(t)], axis=1)
+    corner = np.stack([t, np.abs(t - 5)], axis=1)
+    single = np.array([[0., 0.], [1., 1.]])
+
+    kept = simplify([straight, corner, single], 0.1)
+    npt.assert_array_equal(kept[0], [0, 100])
+    npt.assert_array_equal(kept[1], [0, 50, 100])
+    npt.assert_array_equal(kept[2], [0, 1])
+
+    kept = simplify([straight, corner, single], 0.1, keep=[[20, 40], [], [1]])
+    npt.assert_array_equal(kept[0], [0, 20, 40, 100])
+    npt.assert_array_equal(kept[1], [0, 50, 100])
+    npt.assert_array_equal(kept[2], [0, 1])
+
+
+def test_simplify_tolerance():
+    t = np.linspace(0, 2 * np.pi, 500)
+    circle = np.stack([np.cos(t), np.sin(t), t], axis=1)
+    for tolerance in (0.001, 0.01, 0.1):
+        kept = simplify([circle], tolerance)[0]
+        assert kept[0] == 0 and kept[-1] == len(circle) - 1
+        # all dropped points are within tolerance of the simplified polyline
+        for start, end in zip(kept[:-1], kept[1:]):
+            direction = circle[end] - circle[start]
+            for point in circle[start + 1: end]:
+                ratio = np.clip(np.dot(point - circle[start], direction) /
+                                np.dot(direction, direction), 0, 1)
+                assert np.linalg.norm(point - circle[start] - ratio * direction) <= tolerance
+    assert len(simplify([circle], 0.1)[0]) < len(simplify([circle], 0.001)[0]) < len(circle)
@@ -1,13 +1,20 @@
+import base64
+import io
+import json
 import os
 import tempfile
 from contextlib import contextmanager
 import shutil
 import numpy as np
+import numpy.testing as npt
 import pytest
 import plotly.graph_objs as go
+import plotly.io as pio
 
 from plotly_helper.helper import PlotlyHelper, PlotlyHelperPlane
-from plotly_helper.helper import plot_fig
+from plotly_helper.helper import (encode_typed_arrays, get_plotlyjs, plot_fig, write_fig_json,
+                                  write_plotlyjs)
+from plotly.utils import PlotlyJSONEncoder
 
 @contextmanager
 def setup_tempdir(prefix):
@@ -108,6 +115,33 @@ def test_add_data():
     assert helper.visibility_map['name2'] == range(1, 3)
 
 
+def test_add_data_bulk():
+    helper = PlotlyHelper('name')
+    data = get_scatter()
+    helper.add_data({'name1': data})
+    trace = {'type': 'scatter3d', 'x': [0, 1], 'y': [0, 1], 'z': [0, 1]}
+    helper.add_data_bulk(['name2', 'name3'], [[data, trace], trace])
+    assert helper.nb_objects == 4
+    assert helper.data == [data, data, trace, trace]
+    assert helper.visibility_map == {'name1': range(0, 1), 'name2': range(1, 3),
+                                     'name3': range(3, 4)}
+    assert helper.get_visibility_list('name3') == [False, False, False, True]
+
+    with pytest.raises(ValueError):
+        helper.add_data_bulk(['name4', 'name1'], [data, data])
+    with pytest.raises(ValueError):
+        helper.add_data_bulk(['name4', 'name4'], [data, data])
+    with pytest.raises(ValueError):
+        helper.add_data_bulk(['name4'], [[]])
+    with pytest.raises(ValueError):
+        helper.add_data_bulk(['name4'], [data, data])
+    with pytest.raises(TypeError):
+        helper.add_data_bulk(['name4'], ['dummy'], validate=True)
+    with pytest.raises(TypeError):
+        helper.add_data_bulk([4], [data], validate=True)
+    assert helper.nb_objects == 4
+
+
 def test_get_visibility_list():
     helper = PlotlyHelper('name')
     data = get_scatter()
@@ -142,6 +176,94 @@ def test_remove_data():
     assert helper.visibility_map['name1'] == range(2, 3)
 
 
+def test_get_visibility_lists():
+    helper = PlotlyHelper('name')
+    data = get_scatter()
+    helper.add_data({'name1': data, 'name2': [data, data], 'name3': data})
+    assert helper.get_visibility_lists(['name1', ['name1', 'name3'], 'name2', []]) == [
+        [True, False, False, False],
+        [True, False, False, True],
+        [False, True, True, False],
+        [False, False, False, False]]
+    with pytest.raises(KeyError):
+        helper.get_visibility_lists([['name1', 'name4']])
+
+    # many groups grow the bounds by doubling, overlapping and out of data ranges are allowed
+    helper = PlotlyHelper('name')
+    names = [f'group{i}' for i in range(100)]
+    helper.add_data_bulk(names, [[data] * (1 + i % 3) for i in range(100)])
+    helper.visibility_map['overlap'] = range(1, 4)
+    helper.visibility_map['outside'] = range(helper.nb_objects - 1, helper.nb_objects + 5)
+    assert helper._nb_groups == 102 and len(helper._bounds) == 200
+    names_list = [names[:3], names[::7], ['overlap', 'group1'], ['outside'], names[-1]]
+    expected = []
+    for item in names_list:
+        indexes = {i for name in ([item] if isinstance(item, str) else item)
+                   for i in helper.visibility_map[name]}
+        expected.append([i in indexes for i in range(helper.nb_objects)])
+    assert helper.get_visibility_lists(names_list) == expected
+
+
+def test_remove_data_batch():
+    helper = PlotlyHelper('name')
+    data = [get_scatter() for _ in range(6)]
+    helper.add_data({'name1': data[0], 'name2': data[1:3], 'name3': data[3], 'name4': data[4:]})
+    helper.remove_data(['name3', 'name1'])
+    assert helper.nb_objects == 4
+    assert helper.data == [data[1], data[2], data[4], data[5]]
+    assert helper.visibility_map == {'name2': range(0, 2), 'name4': range(2, 4)}
+    assert helper.get_visibility_list('name4') == [False, False, True, True]
+    with pytest.raises(ValueError):
+        helper.remove_data(['name2', 'name1'])
+    assert helper.nb_objects == 4
+
+
+def test_visibility_map_writes():
+    helper = PlotlyHelper('name')
+    data = [get_scatter() for _ in range(4)]
+    helper.add_data({'name1': data[0], 'name2': data[1:]})
+    visibility_map = helper.visibility_map
+    assert helper.visibility_map is visibility_map
+
+    visibility_map['name2'] = range(2, 4)
+    visibility_map['name3'] = range(1, 2)
+    assert helper.get_visibility_list('name2') == [False, False, True, True]
+    assert helper.get_visibility_list(['name1', 'name3']) == [True, True, False, False]
+    del visibility_map['name1']
+    assert list(helper.visibility_map) == ['name2', 'name3']
+    with pytest.raises(KeyError):
+        helper.get_visibility_list('name1')
+    with pytest.raises(ValueError):
+        visibility_map['name4'] = [0, 2]
+
+    helper.visibility_map = {'all': range(0, 4)}
+    assert helper.visibility_map == {'all': range(0, 4)}
+    assert helper.get_visibility_lists(['all']) == [[True] * 4]
+
+    # the view follows the data changes
+    helper.add_data({'name5': data[0]})
+    assert visibility_map['name5'] == range(4, 5)
+
+
+def test_replace_data():
+    helper = PlotlyHelper('name')
+    data = [get_scatter() for _ in range(6)]
+    helper.add_data({'name1': data[0], 'name2': data[1:3], 'name3': data[3]})
+    helper.replace_data('name2', data[4])
+    assert helper.data == [data[0], data[4], data[3]]
+    assert helper.visibility_map == {'name1': range(0, 1), 'name2': range(1, 2),
+                                     'name3': range(2, 3)}
+    helper.replace_data('name1', data[:3])
+    assert helper.nb_objects == 5
+    assert helper.visibility_map == {'name1': range(0, 3), 'name2': range(3, 4),
+                                     'name3': range(4, 5)}
+    assert helper.get_visibility_list('name3') == [False, False, False, False, True]
+    with pytest.raises(ValueError):
+        helper.replace_data('name4', data[0])
+    with pytest.raises(ValueError):
+        helper.replace_data('name1', [])
+
+
 def test_remove_data_2():
     with pytest.raises(ValueError):
         helper = PlotlyHelper('name')
@@ -268,6 +390,25 @@ def test_add_plane_buttons_2():
                 assert item == cameras[i]
 
 
+def test_set_view_buttons():
+    helper = PlotlyHelperPlane('test', 'xz')
+    helper.add_data({'name1': go.Scatter3d(x=[0, 1], y=[2, 3], z=[4, 5])})
+    helper.set_view_buttons(['xy', 'xz', 'yz'])
+    helper.set_view_buttons(['xy', 'xz'])
+    fig = helper.get_fig()
+    assert len(fig['layout']['updatemenus']) == 1
+    menu = fig['layout']['updatemenus'][0]
+    assert menu['active'] == 1
+    assert [button['label'] for button in menu['buttons']] == ['XY view', 'XZ view']
+    camera = dict(PlotlyHelperPlane._get_camera('xy'), projection={'type': 'orthographic'})
+    assert menu['buttons'][0]['method'] == 'relayout'
+    assert menu['buttons'][0]['args'] == [{'scene.camera': camera, 'title.text': 'test-xy'}]
+    assert fig['layout']['scene']['camera']['projection'] == {'type': 'orthographic'}
+
+    with pytest.raises(ValueError):
+        helper.set_view_buttons(['xy'])
+
+
 def test_plot():
     with setup_tempdir('plots') as plot_dir:
         output_file = os.path.join(plot_dir, 'test')
@@ -279,3 +420,158 @@ def test_plot():
         output_file_2 = os.path.join(plot_dir, 'test2.html')
         plot_fig(helper.get_fig(), output_file_2, auto_open=False)
         assert os.path.exists(output_file + '.html')
+
+
+def test_encode_typed_arrays():
+    helper = PlotlyHelper('name')
+    points = np.array([[0, 0, 0], [1, np.nan, 1], [2, 2, 2.5]])
+    helper.add_data({'name1': go.Scatter3d(x=points[:, 0], y=points[:, 1], z=points[:, 2],
+                                           line={'color': ['red', 'blue', 'red'], 'width': 2},
+                                           name='name1')})
+    helper.add_data({'name2': go.Mesh3d(i=[0], j=[1], k=[2], x=[0., 1., 2.], y=[0, 1, 1],
+                                        z=[0, 0, 1], color='black')})
+    fig = helper.get_fig()
+    encoded = encode_typed_arrays(fig)
+    assert encoded['layout'] is fig['layout']
+
+    trace = encoded['data'][0]
+    assert trace['name'] == 'name1'
+    assert trace['x']['dtype'] == 'f4'
+    npt.assert_array_equal(np.frombuffer(base64.b64decode(trace['y']['bdata']), '<f4'),
+                           [0, np.nan, 2])
+    npt.assert_array_equal(np.frombuffer(base64.b64decode(trace['z']['bdata']), '<f4'),
+                           [0, 1, 2.5])
+    assert trace['line']['width'] == 2
+    assert trace['line']['colorscale'] == [[0, 'blue'], [0.5, 'blue'], [0.5, 'red'], [1, 'red']]
+    assert (trace['line']['cmin'], trace['line']['cmax']) == (-0.5, 1.5)
+    npt.assert_array_equal(np.frombuffer(base64.b64decode(trace['line']['color']['bdata']), 'u1'),
+                           [1, 0, 1])
+
+    helper = PlotlyHelper('name')
+    helper.add_data({'name3': go.Scattergl(x=[0, 1, None, 1, 2, None], y=[0, 1, None, 2, 2, None])})
+    trace = encode_typed_arrays(helper.get_fig())['data'][0]
+    npt.assert_array_equal(np.frombuffer(base64.b64decode(trace['x']['bdata']), '<f4'),
+                           [0, 1, np.nan, 1, 2, np.nan])
+
+    helper.add_button('shift', 'restyle', [{'x': [[1, 2, 3, 4, 5, 6]]}, [0]])
+    button = encode_typed_arrays(helper.get_fig())['layout']['updatemenus'][0]['buttons'][0]
+    assert button['args'][0]['x'][0]['dtype'] == 'i4' and button['args'][1] == [0]
+
+    trace = encode_typed_arrays(fig, 'float64')['data'][1]
+    assert trace['x']['dtype'] == 'f8'
+    assert trace['y']['dtype'] == 'i4'
+    assert trace['i']['dtype'] == 'i4'
+    assert trace['color'] == 'black'
+
+    epoch_ms = [1700000000000, 1700000000001]
+    trace = encode_typed_arrays({'data': [go.Scatter(x=epoch_ms, y=[2 ** 31, 2 ** 32 - 1],
+                                                     customdata=[2 ** 40, -1],
+                                                     ids=np.array([2 ** 62, 0]))]})['data'][0]
+    assert trace['x']['dtype'] == 'f8'
+    npt.assert_array_equal(np.frombuffer(base64.b64decode(trace['x']['bdata']), '<f8'), epoch_ms)
+    assert trace['y']['dtype'] == 'u4'
+    npt.assert_array_equal(np.frombuffer(base64.b64decode(trace['y']['bdata']), '<u4'),
+                           [2 ** 31, 2 ** 32 - 1])
+    npt.assert_array_equal(np.frombuffer(base64.b64decode(trace['customdata']['bdata']), '<f8'),
+                           [2 ** 40, -1])
+    npt.assert_array_equal(trace['ids'], [2 ** 62, 0])
+
+    surface = encode_typed_arrays({'data': [go.Surface(z=np.ones((2, 3)))]})['data'][0]
+    assert surface['z']['shape'] == '2, 3'
+
+    with setup_tempdir('plots') as plot_dir:
+        output_file = os.path.join(plot_dir, 'test.html')
+        plot_fig(helper.get_fig(), output_file, auto_open=False, typed_arrays='float32')
+        with open(output_file, encoding='utf-8') as fd:
+            assert '"bdata"' in fd.read()
+
+
+def test_plot_shared_plotlyjs():
+    with setup_tempdir('plots') as plot_dir:
+        helper = PlotlyHelper('name')
+        helper.add_data({'name1': get_scatter()})
+        for name in ('test1.html', 'test2.html'):
+            plot_fig(helper.get_fig(), os.path.join(plot_dir, name), auto_open=False,
+                     shared_plotlyjs=True)
+            with open(os.path.join(plot_dir, name), encoding='utf-8') as fd:
+                content = fd.read()
+            assert 'src="plotly.min.js"' in content
+            assert len(content) < 100000
+        assert sorted(os.listdir(plot_dir)) == ['plotly.min.js', 'test1.html', 'test2.html']
+
+        shared = os.path.join(plot_dir, 'assets', 'plotly.js')
+        os.mkdir(os.path.join(plot_dir, 'sub'))
+        plot_fig(helper.get_fig(), os.path.join(plot_dir, 'sub', 'test3'), auto_open=False,
+                 shared_plotlyjs=shared)
+        with open(os.path.join(plot_dir, 'sub', 'test3.html'), encoding='utf-8') as fd:
+            assert 'src="../assets/plotly.js"' in fd.read()
+        assert os.path.getsize(shared) == os.path.getsize(os.path.join(plot_dir, 'plotly.min.js'))
+
+        with pytest.raises(ValueError, match='must end with .js'):
+            plot_fig(helper.get_fig(), os.path.join(plot_dir, 'test4'), auto_open=False,
+                     shared_plotlyjs=os.path.join(plot_dir, 'assets', 'plotly'))
+        assert not os.path.exists(os.path.join(plot_dir, 'assets', 'plotly'))
+        assert not os.path.exists(os.path.join(plot_dir, 'test4.html'))
+
+
+def test_write_plotlyjs(tmp_path):
+    path = tmp_path / 'plotly.min.js'
+    bundle = get_plotlyjs()
+    # a bundle of another plotly.js version and a truncated one of the same size are replaced
+    for stale in ('/* plotly.js v1.0.0 */', bundle[:-1] + ';'):
+        path.write_text(stale, encoding='utf-8')
+        write_plotlyjs(str(path))
+        assert path.read_text(encoding='utf-8') == bundle
+
+    umask = os.umask(0o027)
+    try:
+        path.unlink()
+        write_plotlyjs(str(path))
+    finally:
+        os.umask(umask)
+    assert path.stat().st_mode & 0o777 == 0o640
+
+    mtime = path.stat().st_mtime_ns
+    os.utime(path, ns=(mtime - 10 ** 9, mtime - 10 ** 9))
+    write_plotlyjs(str(path))
+    assert path.stat().st_mtime_ns == mtime - 10 ** 9
+
+
+def test_write_fig_json():
+    helper = PlotlyHelper('name')
+    helper.add_data_bulk(['name1', 'name2'],
+                         [get_scatter(), {'type': 'scatter', 'x': [0, np.nan], 'y': [0, 1]}])
+    fig = helper.get_fig()
+    # a layout which is already in the form plotly validates it to
+    fig = {'data': fig['data'], 'layout': {'autosize': True, 'title': {'text': 'name'}}}
+    fd = io.StringIO()
+    write_fig_json(fig, fd)
+    assert json.loads(fd.getvalue()) == json.loads(pio.to_json(go.Figure(fig)))
+
+    fd = io.StringIO()
+    write_fig_json(fig, fd, typed_arrays='float32')
+    written = json.loads(fd.getvalue())
+    assert written['layout'] == json.loads(pio.to_json(go.Figure(fig)))['layout']
+    assert (written['data'] ==
+            json.loads(json.dumps(encode_typed_arrays(fig, 'float32'), cls=PlotlyJSONEncoder))['data'])
+
+
+def test_plot_streaming():
+    with setup_tempdir('plots') as plot_dir:
+        helper = PlotlyHelper('name')
+        helper.add_data({'name1': get_scatter()})
+        helper.add_data({'name2': get_scatter().update(name='</script>')})
+        plot_fig(helper.get_fig(), os.path.join(plot_dir, 'test'), auto_open=False,
+                 shared_plotlyjs=True, streaming=True)
+        with open(os.path.join(plot_dir, 'test.html'), encoding='utf-8') as fd:
+            content = fd.read()
+        assert 'src="plotly.min.js"' in content
+        assert content.count('Plotly.newPlot(') == 1
+        assert content.count('</script>') == 3
+        assert '"type": "scatter3d"' in content
+        assert '"template": {' in content
+
+        plot_fig(helper.get_fig(), os.path.join(plot_dir, 'test2.html'), auto_open=False,
+                 streaming=True)
+        with open(os.path.join(plot_dir, 'test2.html'), encoding='utf-8') as fd:
+            assert len(fd.read()) > 1000000
@@ -0,0 +1,37 @@
+import json
+import subprocess
+import sys
+
+from neurom import NeuriteType
+from neurom.view.matplotlib_impl import TREE_COLOR
+
+from plotly_helper.colors import tree_color
+
+HEAVY_MODULES = ('matplotlib', 'plotly.offline', 'IPython')
+
+
+def _imported(module, candidates):
+    '''Import module in a fresh interpreter and return the candidates it imported'''
+    code = (f'import json, sys, {module}\n'
+            f'print(json.dumps([name for name in {list(candidates)} if name in sys.modules]))')
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True,
+                            text=True).stdout
+    return json.loads(output)
+
+
+def test_viewers_do_not_import_heavy_modules():
+    for module in ('plotly_helper.neuron_viewer', 'plotly_helper.population_viewer',
+                   'plotly_helper.helper', 'plotly_helper.object_creator'):
+        assert _imported(module, HEAVY_MODULES) == [], module
+
+
+def test_cli_does_not_import_neurom():
+    assert _imported('plotly_helper.cli', HEAVY_MODULES + ('neurom', 'scipy')) == []
+
+
+def test_tree_color():
+    for neurite_type, color in TREE_COLOR.items():
+        assert tree_color(neurite_type) == color
+        assert tree_color(neurite_type.name) == color
+    assert tree_color(NeuriteType.all) == 'black'
+    assert tree_color('unknown', default='grey') == 'grey'
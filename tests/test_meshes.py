@@ -0,0 +1,74 @@
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from plotly_helper.meshes import (batch_meshes, icosphere, tube_mesh, tube_resolution,
+                                  unit_sphere_grid)
+
+
+def test_unit_sphere_grid():
+    x, y, z = unit_sphere_grid(10)
+    assert x.shape == y.shape == z.shape == (10, 10)
+    npt.assert_allclose(x ** 2 + y ** 2 + z ** 2, 1)
+    assert unit_sphere_grid(10)[0] is x
+    with pytest.raises(ValueError):
+        x[0, 0] = 2
+
+
+def test_icosphere():
+    for subdivisions in range(3):
+        vertices, triangles = icosphere(subdivisions)
+        assert len(triangles) == 20 * 4 ** subdivisions
+        assert len(vertices) == 10 * 4 ** subdivisions + 2
+        npt.assert_allclose(np.linalg.norm(vertices, axis=1), 1)
+        # each edge is shared by exactly 2 triangles
+        edges = np.sort(triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+        assert (np.unique(edges, axis=0, return_counts=True)[1] == 2).all()
+    assert icosphere(2)[0] is icosphere(2)[0]
+
+
+def test_icosphere_subdivisions_range():
+    for subdivisions in (-1, 7):
+        with pytest.raises(ValueError):
+            icosphere(subdivisions)
+
+
+def test_batch_meshes():
+    vertices, triangles = icosphere(0)
+    all_vertices, all_triangles = batch_meshes(vertices, triangles,
+                                               [[0, 0, 0], [10, 0, 0]], [1, 2])
+    assert all_vertices.shape == (24, 3)
+    npt.assert_allclose(all_vertices[12:], vertices * 2 + [10, 0, 0])
+    npt.assert_array_equal(all_triangles[20:], triangles + 12)
+
+
+def test_tube_mesh():
+    starts = np.array([[0., 0, 0], [1, 1, 1]])
+    ends = np.array([[0., 0, 2], [2, 1, 1]])
+    vertices, triangles = tube_mesh(starts, ends, np.array([1., 2]), np.array([.5, 1]), 6)
+    assert vertices.shape == (2 * 2 * 6, 3)
+    assert triangles.shape == (2 * 2 * 6, 3)
+    assert triangles.min() == 0 and triangles.max() == len(vertices) - 1
+
+    rings = vertices.reshape(2, 2, 6, 3)
+    npt.assert_allclose(rings[0, 0, :, 2], 0, atol=1e-12)
+    npt.assert_allclose(rings[0, 1, :, 2], 2)
+    npt.assert_allclose(np.linalg.norm(rings[0, 0, :, :2], axis=1), 1)
+    npt.assert_allclose(np.linalg.norm(rings[0, 1, :, :2], axis=1), .5)
+    npt.assert_allclose(rings[1, 0, :, 0], 1)
+    npt.assert_allclose(np.linalg.norm(rings[1, 1] - ends[1], axis=1), 1)
+
+
+def test_tube_resolution():
+    sizes = np.arange(100.)
+    assert tube_resolution(sizes, 10 ** 6) == (16, 0.)
+    assert tube_resolution(sizes, 1000) == (5, 0.)
+    assert tube_resolution(sizes, 10 ** 6, min_size=50) == (16, 50.)
+
+    nb_sides, min_size = tube_resolution(sizes, 100)
+    assert nb_sides == 3
+    assert 2 * nb_sides * np.count_nonzero(sizes >= min_size) <= 100
+
+    # equal sizes are dropped together
+    nb_sides, min_size = tube_resolution(np.repeat([1., 2.], 10), 6 * 15)
+    assert (nb_sides, min_size) == (3, 2.)
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+from neurom import COLS, iter_sections, load_morphology
+from neurom.features.section import branch_order, section_path_length
+
+from plotly_helper.morphology import SectionIndex, point_values
+
+PATH = os.path.dirname(__file__)
+NEURON = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+
+
+def test_point_values_radius():
+    sections, values = point_values(NEURON, 'radius')
+    assert sections == list(iter_sections(NEURON))
+    for section, section_values in zip(sections, values):
+        npt.assert_array_equal(section_values, section.points[:, COLS.R])
+
+
+def test_point_values_branch_order():
+    sections, values = point_values(NEURON, 'branch_order')
+    for section, section_values in zip(sections, values):
+        npt.assert_array_equal(section_values, branch_order(section))
+
+
+def test_point_values_path_distance():
+    sections, values = point_values(NEURON, 'path_distance')
+    for section, section_values in zip(sections, values):
+        assert section_values[0] == pytest.approx(section_path_length(section) -
+                                                  section.length, abs=1e-3)
+        assert section_values[-1] == pytest.approx(section_path_length(section), abs=1e-3)
+        assert np.all(np.diff(section_values) >= 0)
+
+
+def test_point_values_array():
+    nb_points = sum(len(section.points) for section in iter_sections(NEURON))
+    sections, values = point_values(NEURON, np.arange(nb_points))
+    assert [len(section_values) for section_values in values] == [
+        len(section.points) for section in sections]
+    assert values[1][0] == len(sections[0].points)
+
+    with pytest.raises(ValueError):
+        point_values(NEURON, np.arange(nb_points - 1))
+    with pytest.raises(ValueError):
+        point_values(NEURON, 'unknown')
+
+
+def test_section_index():
+    index = SectionIndex(NEURON)
+    assert index.sections == list(iter_sections(NEURON))
+    npt.assert_array_equal(index.neurite_indices[[0, 1, 77, 78, 104, 105, 177]],
+                           [0, 1, 1, 2, 2, 3, 3])
+    for position, section in enumerate(index.sections):
+        subtree = [s.id for s in section.ipreorder()]
+        assert [s.id for s in index.sections[position:index.stops[position]]] == subtree
+
+    positions = index.positions([NEURON.sections[159], 78])
+    npt.assert_array_equal(positions, [78, 159])
+    npt.assert_array_equal(index.positions(np.arange(178) == 3), [3])
+    mask = index.subtree_mask(positions)
+    assert mask.sum() == 27 + index.stops[159] - 159
+    npt.assert_array_equal(index.subtree_mask(index.positions([])), False)
@@ -1,11 +1,34 @@
+import json
 import os
+from collections import defaultdict
 from unittest.mock import patch
 
-from neurom import load_morphology
-from plotly_helper.neuron_viewer import NeuronBuilder
+import morphio
+import numpy as np
+import numpy.testing as npt
+import pytest
+from neurom import COLS, load_morphology, iter_sections, iter_segments
+from neurom.view.matplotlib_impl import TREE_COLOR
+from plotly.utils import PlotlyJSONEncoder
+from plotly_helper.cache import TraceCache
+from plotly_helper.decimation import simplify
+from plotly_helper.helper import encode_typed_arrays
+from plotly_helper.neuron_viewer import (NeuronBuilder, _make_soma, _make_trace, _make_trace2d,
+                                         _neurite_coloring, _neurite_segments2d,
+                                         _neurites_segments2d)
+from plotly_helper.profiling import Profile
+from plotly_helper.region import Box, Sphere
 
 PATH = os.path.dirname(__file__)
 
+
+def _vertex_colors(line):
+    '''The color of each vertex of a Scatter3d drawn with a palette'''
+    if isinstance(line.line.color, str):
+        return [line.line.color] * len(line.x)
+    palette = [color for _, color in line.line.colorscale[::2]]
+    return [palette[i] for i in line.line.color]
+
 # patching plotly.offline.plot to avoid the call
 @patch('plotly_helper.neuron_viewer.plot_')
 def test_color_section(_):
@@ -41,3 +64,486 @@ def test_color_section(_):
     assert (next(iter(builder.properties.values())) ==
                       {'color': 'green', 'range': slice(0, 23, None)})
     builder.plot()
+
+
+def test_color_sections():
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    builder = NeuronBuilder(neuron, '3d')
+    builder.get_figure()
+    assert builder.color_sections([neuron.neurites[2].root_node.id, 3], color='gray') == 27 + 13
+    recursive = NeuronBuilder(neuron, '3d')
+    recursive.color_section(neuron.neurites[2].root_node, color='gray', recursive=True)
+    recursive.color_section(neuron.sections[3], color='gray', recursive=True)
+    assert dict(builder.properties) == dict(recursive.properties)
+    assert builder._dirty == {1, 2}
+
+    builder = NeuronBuilder(neuron, '3d')
+    assert builder.color_sections(lambda section: not section.children, subtree=False) == sum(
+        1 for section in neuron.sections if not section.children)
+    assert all(properties['color'] == 'green' for properties in builder.properties.values())
+
+    with pytest.raises(KeyError):
+        builder.color_sections([len(neuron.sections)])
+
+
+def test_color_section_deep():
+    morph = morphio.mut.Morphology()
+    morph.soma.points = [[0, 0, 0]]
+    morph.soma.diameters = [1]
+    section = morph.append_root_section(
+        morphio.PointLevel([[0, 0, 0], [0, 0, 1]], [1, 1]), morphio.SectionType.axon)
+    for i in range(1, 3000):
+        section = section.append_section(
+            morphio.PointLevel([[0, 0, i], [0, 0, i + 1]], [1, 1]))
+    neuron = load_morphology(morph)
+    builder = NeuronBuilder(neuron, '3d')
+    builder.color_section(neuron.sections[0], color='black', recursive=True)
+    assert len(builder.properties) == 3000
+    assert _vertex_colors(builder.get_figure()['data'][0]) == ['black'] * 9000
+
+
+def test_make_trace():
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    style = defaultdict(dict)
+    style[neuron.sections[159]] = {'color': 'black', 'range': slice(20, 120)}
+    style[neuron.sections[3]] = {'color': 'gray', 'range': slice(0, 2)}
+    lines = _make_trace(neuron, 'xyz', style=style)
+    assert len(lines) == len(neuron.neurites)
+
+    for neurite, line in zip(neuron.neurites, lines):
+        # the reference is the segment by segment construction
+        default_color = TREE_COLOR[neurite.type]
+        expected_coords, expected_colors = [], []
+        for section in iter_sections(neurite):
+            segs = list(iter_segments(section))
+            range_ = style[section]['range'] if section in style else slice(0, len(segs))
+            color = style[section]['color'] if section in style else default_color
+            for i, seg in enumerate(segs):
+                expected_coords += [seg[0][COLS.XYZ], seg[1][COLS.XYZ], [np.nan] * 3]
+                in_range = range_.start <= i < range_.stop
+                expected_colors += [color if in_range else default_color] * 3
+        expected_coords = np.array(expected_coords)
+
+        npt.assert_array_equal(line.x, expected_coords[:, 0])
+        npt.assert_array_equal(line.y, expected_coords[:, 1])
+        npt.assert_array_equal(line.z, expected_coords[:, 2])
+        assert _vertex_colors(line) == expected_colors
+
+
+def test_make_trace2d_merge():
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    style = defaultdict(dict)
+    style[neuron.sections[159]] = {'color': 'black', 'range': slice(20, 120)}
+    lines = _make_trace2d(neuron, 'zy', style=style)
+    assert len(lines) == len(neuron.sections)
+
+    merged = _make_trace2d(neuron, 'zy', style=style, merge=True)
+    # one trace per neurite plus one for the black part of section 159
+    assert len(merged) == len(neuron.neurites) + 1
+    assert [line.line.color for line in merged] == ['blue', 'red', 'red', 'red', 'black']
+
+    nb_segments = sum(len(section.points) - 1 for section in neuron.sections)
+    assert sum(len(line.x) for line in merged) == 3 * nb_segments
+    assert len(merged[-1].x) == 3 * (100 - 20)
+    npt.assert_array_equal(merged[-1].x[:2], neuron.sections[159].points[20:22, COLS.Z])
+    npt.assert_array_equal(merged[-1].y[:2], neuron.sections[159].points[20:22, COLS.Y])
+    assert np.isnan(merged[-1].x[2])
+
+
+def test_make_trace_lod():
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    style = defaultdict(dict)
+    style[neuron.sections[159]] = {'color': 'black', 'range': slice(20, 60)}
+    full = _make_trace(neuron, 'xyz', style=style)
+    lines = _make_trace(neuron, 'xyz', style=style, tolerance=1.)
+    assert sum(len(line.x) for line in lines) < sum(len(line.x) for line in full) / 2
+
+    # the colored range still starts and ends on the same points
+    section = neuron.sections[159]
+    black = np.array(_vertex_colors(lines[-1])) == 'black'
+    coords = np.stack([lines[-1].x, lines[-1].y, lines[-1].z], axis=1)[black]
+    npt.assert_array_equal(coords[0], section.points[20, COLS.XYZ])
+    npt.assert_array_equal(coords[-2], section.points[60, COLS.XYZ])
+
+    merged = _make_trace2d(neuron, 'xy', style=style, merge=True, tolerance=1.)
+    assert [line.line.color for line in merged] == ['blue', 'red', 'red', 'red', 'black']
+    npt.assert_array_equal(merged[-1].x[[0, -2]], section.points[[20, 60], COLS.X])
+
+    lines = _make_trace2d(neuron, 'xy', style=style, tolerance=1.)
+    assert len(lines) == len(neuron.sections)
+
+
+def test_make_trace_region():
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    section = neuron.sections[159]
+    # only the segments [58, 86) of section 159 are inside the sphere
+    region = Sphere(section.points[70, COLS.XYZ], 10)
+    style = defaultdict(dict)
+    style[section] = {'color': 'black', 'range': slice(20, 70)}
+
+    lines = _make_trace(neuron, 'xyz', region=region)
+    coords = np.stack([np.concatenate([line[axis] for line in lines]) for axis in 'xyz'], axis=1)
+    coords = coords[~np.isnan(coords[:, 0])]
+    assert len(coords) == 2 * (86 - 58)
+    npt.assert_allclose(np.linalg.norm(coords - region.center, axis=1).max(), 10)
+
+    merged = _make_trace2d(neuron, 'xy', style=style, merge=True, region=region)
+    assert [line.line.color for line in merged] == ['red', 'black']
+    assert [len(line.x) for line in merged] == [3 * (86 - 70), 3 * (70 - 58)]
+    npt.assert_array_equal(merged[1].x[1:3], [section.points[59, COLS.X], np.nan])
+
+    lines = _make_trace2d(neuron, 'xy', style=style, region=region, tolerance=1.)
+    assert [line.line.color for line in lines] == ['black']
+
+
+def test_neuron_builder_region(tmp_path):
+    path = os.path.join(PATH, 'data', 'neuron.h5')
+    box = Box([-50, -50, -50], [50, 50, 50])
+    builder = NeuronBuilder(path, 'xy', merge_traces=True, region=box)
+    fig = builder.get_figure()
+    assert len(fig['data']) == 4
+    xs = np.concatenate([trace['x'] for trace in fig['data']])
+    assert np.nanmin(xs) >= -50 and np.nanmax(xs) <= 50
+    assert len(fig['layout']['shapes']) == 1
+
+    # the soma is dropped with the sections outside of the region
+    points = load_morphology(path).points
+    far = Sphere(points[np.argmin(points[:, COLS.Y]), COLS.XYZ], 20)
+    fig = NeuronBuilder(path, '3d', region=far).get_figure()
+    assert [trace['type'] for trace in fig['data']] == ['scatter3d'] * 4
+    fig = NeuronBuilder(path, '3d', tubes=True, region=far).get_figure()
+    assert [trace['type'] for trace in fig['data']] == ['mesh3d'] * 4
+    image = NeuronBuilder(path, 'xy', region=far).get_image(32)
+    assert (image < 255).any()
+
+    cache = TraceCache(tmp_path / 'cache')
+    NeuronBuilder(path, 'xy', merge_traces=True, cache=cache, region=box).get_figure()
+    fig = NeuronBuilder(path, 'xy', merge_traces=True, cache=cache, region=far).get_figure()
+    assert np.nanmax(np.concatenate([trace['y'] for trace in fig['data']])) <= far.center[1] + 20
+
+    with pytest.raises(ValueError, match='inside the region'):
+        NeuronBuilder(path, 'xy', region=Sphere([1000, 0, 0], 1)).get_figure()
+
+
+def test_neuron_builder_cache(tmp_path):
+    path = os.path.join(PATH, 'data', 'neuron.h5')
+    cache = TraceCache(str(tmp_path))
+    fig = NeuronBuilder(path, '3d', cache=cache).get_figure()
+    assert len(os.listdir(tmp_path)) == 1
+
+    with patch('plotly_helper.neuron_viewer.load_morphology') as load:
+        builder = NeuronBuilder(path, '3d', cache=cache)
+        cached_fig = builder.get_figure()
+        load.assert_not_called()
+    assert builder.helper.visibility_map == {'neuron': range(0, 4), 'soma': range(4, 5)}
+    for trace, cached_trace in zip(fig['data'], cached_fig['data']):
+        assert trace.type == cached_trace.type
+        npt.assert_array_equal(trace.x, cached_trace.x)
+    assert _vertex_colors(cached_fig['data'][3]) == _vertex_colors(fig['data'][3])
+
+    # styles, planes and level of detail are part of the key
+    builder = NeuronBuilder(path, '3d', cache=cache)
+    builder.color_section(builder.neuron.sections[159], color='black')
+    builder.get_figure()
+    NeuronBuilder(path, 'xy', cache=cache).get_figure()
+    fig = NeuronBuilder(path, 'xy', cache=cache, lod=1).get_figure()
+    assert len(os.listdir(tmp_path)) == 4
+    cached_fig = NeuronBuilder(path, 'xy', cache=cache, lod=1).get_figure()
+    assert cached_fig['layout']['shapes'] == fig['layout']['shapes']
+
+
+def test_neuron_builder_incremental():
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    builder = NeuronBuilder(neuron, '3d')
+    fig = builder.get_figure()
+    traces = list(fig['data'])
+    assert builder.get_figure()['data'] == traces
+    assert builder.helper.visibility_map == {'neuron': range(0, 4), 'soma': range(4, 5)}
+
+    builder.color_section(neuron.sections[159], color='black')
+    data = builder.get_figure()['data']
+    assert all(trace is new_trace for trace, new_trace in zip(traces[:3], data[:3]))
+    assert data[3] is not traces[3]
+    assert data[4] is traces[4]
+    assert (_vertex_colors(data[3]) ==
+            _vertex_colors(_make_trace(neuron, 'xyz', style=builder.properties)[3]))
+
+    # in 2D the number of traces of a neurite changes with its colors
+    builder = NeuronBuilder(neuron, 'xy', merge_traces=True)
+    assert len(builder.get_figure()['data']) == 4
+    builder.color_section(neuron.sections[159], color='black')
+    builder.color_section(neuron.sections[1], color='black')
+    assert len(builder.get_figure()['data']) == 6
+    assert builder.helper.visibility_map == {'neuron': range(0, 6)}
+    assert len(builder.get_figure()['layout']['shapes']) == 1
+
+
+def test_color_by():
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    builder = NeuronBuilder(neuron, '3d')
+    builder.color_by('radius', colorscale='Jet')
+    radii = np.concatenate([section.points[:, COLS.R] for section in iter_sections(neuron)])
+    assert builder.coloring['cmin'] == radii.min()
+    assert builder.coloring['cmax'] == radii.max()
+
+    data = builder.get_figure()['data']
+    assert [trace.line.showscale for trace in data[:4]] == [True, False, False, False]
+    line = data[3]
+    section = neuron.sections[159]
+    start = 3 * sum(len(s.points) - 1 for s in iter_sections(neuron.neurites[3])
+                    if s.id < section.id)
+    npt.assert_allclose(line.line.color[start:start + 3],
+                        section.points[[0, 1, 1], COLS.R])
+    assert line.line.cmax == radii.max()
+
+    builder.color_by(np.zeros(len(radii)), cmin=0, cmax=1)
+    assert builder.get_figure()['data'][3].line.color[0] == 0
+    builder.color_by(None)
+    assert isinstance(builder.get_figure()['data'][3].line.color, str)
+
+    builder = NeuronBuilder(neuron, 'xy', merge_traces=True)
+    builder.color_by('branch_order')
+    data = builder.get_figure()['data']
+    colorbars = [trace for trace in data if trace.mode == 'markers']
+    assert len(colorbars) == 1 and colorbars[0].marker.showscale
+    assert len(data) > 5
+
+    lines = _make_trace2d(neuron, 'xy', coloring=builder.coloring)
+    assert len(lines) == len(neuron.sections) + 1
+
+
+def test_neuron_builder_tubes():
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    builder = NeuronBuilder(neuron, '3d', tubes=True, max_triangles=20000)
+    builder.color_section(neuron.sections[159], color='black')
+    data = builder.get_figure()['data']
+    assert [trace.type for trace in data] == ['mesh3d'] * 4 + ['surface']
+    assert sum(len(trace.i) for trace in data[:4]) <= 20000
+    assert data[0].color == 'blue'
+    assert [color for _, color in data[3].colorscale[::2]] == ['red', 'black']
+    assert len(data[3].intensity) == len(data[3].x)
+
+    builder = NeuronBuilder(neuron, '3d', tubes=True)
+    builder.color_by('radius')
+    data = builder.get_figure()['data']
+    section = neuron.neurites[0].root_node
+    nb_sides = len(data[0].x) // (2 * (len(section.points) - 1))
+    npt.assert_allclose(data[0].intensity[:2 * nb_sides:nb_sides], section.points[:2, COLS.R])
+
+    with pytest.raises(ValueError):
+        NeuronBuilder(neuron, 'xy', tubes=True)
+
+
+def test_neuron_builder_tubes_budget_after_simplification():
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    builder = NeuronBuilder(neuron, '3d', tubes=True, lod=5, max_triangles=20000)
+    data = builder.get_figure()['data']
+    nb_triangles = sum(len(trace.i) for trace in data[:4])
+    # the budget fits the simplified segments, not the raw ones
+    assert 5000 < nb_triangles <= 20000
+
+    builder.color_section(neuron.sections[159], color='black')
+    data = builder.get_figure()['data']
+    assert sum(len(trace.i) for trace in data[:4]) == nb_triangles
+    assert [color for _, color in data[3].colorscale[::2]] == ['red', 'black']
+
+
+def test_make_soma():
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    soma = _make_soma(neuron)
+    assert soma.type == 'surface'
+    assert np.shape(soma.x) == (100, 100)
+    npt.assert_allclose(np.max(soma.z) - np.min(soma.z), 2 * neuron.soma.radius, rtol=1e-6)
+
+    soma = _make_soma(neuron, resolution=10)
+    assert np.shape(soma.x) == (10, 10)
+
+    soma = _make_soma(neuron, mesh='icosphere', subdivisions=1)
+    assert soma.type == 'mesh3d'
+    assert len(soma.x) == 42
+    assert len(soma.i) == 80
+
+    with pytest.raises(ValueError):
+        _make_soma(neuron, mesh='cube')
+
+    fig = NeuronBuilder(neuron, '3d', soma_mesh='icosphere').get_figure()
+    assert fig['data'][-1].type == 'mesh3d'
+    assert len(fig['data'][-1].i) == 320
+
+    fig = NeuronBuilder(neuron, '3d', soma_mesh='icosphere', soma_subdivisions=0).get_figure()
+    assert len(fig['data'][-1].i) == 20
+
+    for subdivisions in (-1, 7):
+        with pytest.raises(ValueError):
+            NeuronBuilder(neuron, '3d', soma_mesh='icosphere', soma_subdivisions=subdivisions)
+
+
+def test_neuron_builder_plot_streaming(tmp_path):
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    builder = NeuronBuilder(neuron, 'xy', merge_traces=True)
+    filename = str(tmp_path / 'neuron.html')
+    builder.plot(filename, streaming=True, auto_open=False)
+    with open(filename, encoding='utf-8') as fd:
+        assert '"template": {' in fd.read()
+
+    with pytest.raises(TypeError):
+        builder.plot(filename, streaming=True, auto_open=False, include_plotlyjs='cdn')
+    with pytest.raises(TypeError):
+        builder.plot(filename, False, streaming=True)
+
+
+def test_default_2d_figure_typed_arrays():
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    fig = NeuronBuilder(neuron, 'xy').get_figure()
+    assert len(fig['data']) == 178
+    section = fig['data'][0]
+    assert np.isnan(section.x[2::3]).all() and np.isnan(section.y[2::3]).all()
+
+    encoded = encode_typed_arrays(fig)
+    for trace in encoded['data']:
+        assert trace['x']['dtype'] == trace['y']['dtype'] == 'f4'
+
+
+def test_neuron_builder_image(tmp_path):
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    builder = NeuronBuilder(neuron, 'xy', line_width=3)
+    image = builder.get_image(128)
+    assert image.shape == (128, 128, 3) and image.dtype == np.uint8
+    npt.assert_array_equal(image[0, 0], [255, 255, 255])
+    colors = {tuple(color) for color in image.reshape(-1, 3)}
+    assert {(255, 0, 0), (0, 0, 255)} <= colors
+    assert (255, 165, 0) not in colors
+
+    builder.color_section(neuron.sections[3], color='orange', recursive=True)
+    image = builder.get_image(128, 64, background='black')
+    assert image.shape == (64, 128, 3)
+    npt.assert_array_equal(image[0, 0], [0, 0, 0])
+    assert (255, 165, 0) in {tuple(color) for color in image.reshape(-1, 3)}
+
+    builder.color_by('path_distance')
+    assert len(np.unique(builder.get_image(128).reshape(-1, 3), axis=0)) > 32
+
+    builder.write_png(tmp_path / 'neuron.png', 32)
+    assert (tmp_path / 'neuron.png').read_bytes()[:8] == b'\x89PNG\r\n\x1a\n'
+
+    with pytest.raises(ValueError):
+        NeuronBuilder(neuron, '3d').get_image()
+
+
+def test_neurites_segments2d():
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    builder = NeuronBuilder(neuron, 'xy')
+    builder.color_section(neuron.sections[3], color='orange', recursive=True)
+    for coloring in (None, 'radius'):
+        if coloring is not None:
+            builder.color_by(coloring)
+        with patch('plotly_helper.neuron_viewer.simplify', wraps=simplify) as wrapped:
+            segments = _neurites_segments2d(neuron, 'xy', builder.properties, 0.5,
+                                            builder.coloring)
+        # the sections of all the neurites are simplified at once
+        assert wrapped.call_count == 1
+        assert len(segments) == len(neuron.neurites)
+        for i, (neurite, (coords, color_ids, colors)) in enumerate(zip(neuron.neurites,
+                                                                       segments)):
+            expected = _neurite_segments2d(neurite, 'xy', builder.properties, 0.5,
+                                           _neurite_coloring(builder.coloring, i))
+            npt.assert_array_equal(coords, expected[0])
+            npt.assert_array_equal(color_ids, expected[1])
+            assert colors == expected[2]
+
+
+def test_neuron_builder_image_cache(tmp_path):
+    path = os.path.join(PATH, 'data', 'neuron.h5')
+    cache = TraceCache(str(tmp_path))
+    builder = NeuronBuilder(path, 'xy', cache=cache)
+    image = builder.get_image(64)
+    with patch('plotly_helper.neuron_viewer._image_segments') as image_segments:
+        # the segments are kept by the builder, only the background changes
+        assert (builder.get_image(64, background='black') != image).any()
+        image_segments.assert_not_called()
+
+    profile = Profile()
+    with patch('plotly_helper.neuron_viewer.load_morphology') as load:
+        cached_image = NeuronBuilder(path, 'xy', cache=cache, profile=profile).get_image(64)
+        load.assert_not_called()
+    npt.assert_array_equal(cached_image, image)
+    assert profile.stages['cache']['hits'] == 1
+
+    # a new style invalidates the segments
+    builder.color_section(builder.neuron.sections[3], color='orange', recursive=True)
+    assert (255, 165, 0) in {tuple(color) for color in builder.get_image(64).reshape(-1, 3)}
+
+
+def test_neuron_builder_profile(tmp_path):
+    profile = Profile()
+    builder = NeuronBuilder(os.path.join(PATH, 'data', 'neuron.h5'), 'xy', merge_traces=True,
+                            cache=TraceCache(tmp_path / 'cache'), profile=profile)
+    with patch('plotly_helper.neuron_viewer.plot_'):
+        builder.plot(str(tmp_path / 'neuron.html'))
+    # the cache is looked up before loading the morphology
+    assert list(profile.stages) == ['cache', 'load', 'neurites', 'soma', 'assembly',
+                                    'serialization']
+    assert profile.stages['load']['sections'] == 178
+    assert profile.stages['cache']['hits'] == 0
+    assert profile.stages['neurites']['traces'] == 4
+    assert profile.stages['neurites']['vertices'] > 0
+
+    builder.write_png(tmp_path / 'neuron.png', 64)
+    assert profile.stages['raster']['pixels'] == 64 * 64
+    assert profile.stages['serialization']['bytes'] == (tmp_path / 'neuron.png').stat().st_size
+
+    profile = Profile()
+    NeuronBuilder(os.path.join(PATH, 'data', 'neuron.h5'), 'xy', merge_traces=True,
+                  cache=TraceCache(tmp_path / 'cache'), profile=profile).get_figure()
+    assert profile.stages['cache']['hits'] == 1
+    assert 'neurites' not in profile.stages
+
+
+def test_neuron_builder_views(tmp_path):
+    path = os.path.join(PATH, 'data', 'neuron.h5')
+    neuron = load_morphology(path)
+    builder = NeuronBuilder(neuron, 'xz', views=['xy', 'xz', 'yz'])
+    fig = builder.get_figure()
+    # the neurites and the soma are drawn once in the scene, as in 3D
+    expected = NeuronBuilder(neuron, '3d').get_figure()
+    assert [trace.type for trace in fig['data']] == [trace.type for trace in expected['data']]
+    for trace, expected_trace in zip(fig['data'], expected['data']):
+        npt.assert_array_equal(trace.x, expected_trace.x)
+        npt.assert_array_equal(trace.z, expected_trace.z)
+    menu = fig['layout']['updatemenus'][0]
+    assert [button['label'] for button in menu['buttons']] == ['XY view', 'XZ view', 'YZ view']
+    assert menu['active'] == 1
+    assert fig['layout']['scene']['camera']['eye'] == {'x': 0, 'y': -2, 'z': 0}
+    for plane, button in zip(['xy', 'xz', 'yz'], menu['buttons']):
+        assert button['method'] == 'relayout'
+        relayout, = button['args']
+        assert relayout['title.text'] == f'neuron-{plane}'
+        assert relayout['scene.camera']['projection'] == {'type': 'orthographic'}
+
+    # the buttons do not send any coordinates: the views cost a few hundred bytes
+    one_view = NeuronBuilder(neuron, 'xz', views=['xz']).get_figure()
+    size, one_view_size = (len(json.dumps(encode_typed_arrays(f), cls=PlotlyJSONEncoder))
+                           for f in (fig, one_view))
+    assert size - one_view_size < 1000
+
+    # the plane is added to the views and the recolored neurites are swapped in place
+    builder = NeuronBuilder(neuron, 'xy', views=['yz'])
+    builder.get_figure()
+    builder.color_section(neuron.sections[0], color='black')
+    fig = builder.get_figure()
+    menu = fig['layout']['updatemenus']
+    assert len(menu) == 1 and len(menu[0]['buttons']) == 2
+    assert set(_vertex_colors(fig['data'][0])) >= {'black'}
+
+    cache = TraceCache(str(tmp_path))
+    fig = NeuronBuilder(path, 'xy', views=['xz'], cache=cache).get_figure()
+    with patch('plotly_helper.neuron_viewer.load_morphology') as load:
+        cached_fig = NeuronBuilder(path, 'xy', views=['xz'], cache=cache).get_figure()
+        load.assert_not_called()
+    npt.assert_array_equal(fig['data'][2].y, cached_fig['data'][2].y)
+    assert fig['layout']['updatemenus'] == cached_fig['layout']['updatemenus']
+
+    with pytest.raises(ValueError):
+        NeuronBuilder(neuron, '3d', views=['xy'])
+    with pytest.raises(ValueError):
+        NeuronBuilder(neuron, 'xy', views=['3d'])
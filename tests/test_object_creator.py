@@ -1,5 +1,6 @@
 import numpy as np
 import numpy.testing as npt
+import pytest
 
 import plotly_helper.object_creator as object_creator
 
@@ -106,3 +107,46 @@ def test_vector():
     npt.assert_array_equal(good_obj.pop('y'), obj.pop('y'))
     npt.assert_array_equal(good_obj.pop('z'), obj.pop('z'))
     assert obj == good_obj
+
+
+def test_stratified_subsample():
+    rng = np.random.default_rng(0)
+    # a dense cluster and a few outliers
+    points = np.vstack([rng.normal(0, 1, (10000, 3)), [[100, 100, 100], [-100, 0, 0]]])
+    indices = object_creator.stratified_subsample(points, 1000)
+    assert 900 <= len(indices) <= 1100
+    assert (np.diff(indices) > 0).all()
+    assert {10000, 10001} <= set(indices.tolist())
+    npt.assert_array_equal(indices, object_creator.stratified_subsample(points, 1000))
+    npt.assert_array_equal(object_creator.stratified_subsample(points[:10], 1000), np.arange(10))
+
+
+def test_scatter_aggregation():
+    rng = np.random.default_rng(0)
+    points = rng.normal(0, 1, (5000, 3))
+
+    obj = object_creator.scatter(points, name='cloud', color='red', max_points=500)
+    assert obj.type == 'scatter3d' and obj.mode == 'markers'
+    assert 450 <= len(obj.x) <= 560
+    assert obj.marker.color == 'red' and obj.name == 'cloud'
+    assert len(object_creator.scatter(points, max_points=None).x) == 5000
+
+    obj = object_creator.scatter(points, color='red', opacity=0.5, max_points=1000,
+                                 aggregation='density')
+    assert obj.type == 'scatter3d' and obj.opacity == 0.5
+    assert len(obj.x) <= 1000 and obj.marker.color.sum() == 5000
+    assert obj.marker.colorscale[-1][1] == 'red'
+
+    obj = object_creator.scatter(points[:, :2], max_points=100, aggregation='density')
+    assert obj.type == 'heatmap' and obj.z.shape == (10, 10)
+    # the empty cells are transparent
+    assert np.nansum(obj.z) == 5000 and np.isnan(obj.z).any()
+
+    obj = object_creator.scatter_line(points, max_points=500)
+    assert obj.type == 'scatter3d' and obj.mode is None
+    assert 450 <= len(obj.x) <= 560
+    assert object_creator.scatter_line(points, max_points=500,
+                                       aggregation='density').type == 'scatter3d'
+
+    with pytest.raises(ValueError):
+        object_creator.scatter(points, aggregation='unknown')
@@ -0,0 +1,32 @@
+import os
+from unittest.mock import patch
+
+from neurom import load_morphology
+
+from plotly_helper.population_viewer import PopulationBuilder
+
+PATH = os.path.dirname(__file__)
+NEURON_PATH = os.path.join(PATH, 'data', 'neuron.h5')
+
+
+# patching plotly.offline.plot to avoid the call
+@patch('plotly_helper.neuron_viewer.plot_')
+def test_population_builder(_):
+    neuron = load_morphology(NEURON_PATH)
+    nb_segments = sum(len(section.points) - 1 for section in neuron.sections)
+
+    builder = PopulationBuilder(iter([neuron, NEURON_PATH, neuron]), '3d')
+    fig = builder.plot()
+    assert builder.nb_morphologies == 3
+    assert [trace.name for trace in fig['data']] == ['axon', 'basal dendrite', 'soma']
+    assert sum(len(trace.x) for trace in fig['data'][:2]) == 3 * 3 * nb_segments
+    soma = fig['data'][-1]
+    assert soma.type == 'mesh3d'
+    assert len(soma.x) == 3 * 42
+    assert len(soma.i) == 3 * 80
+    assert builder.helper.visibility_map == {'neuron': range(0, 2), 'soma': range(2, 3)}
+
+    fig = PopulationBuilder([neuron, neuron], 'xy').get_figure()
+    assert [trace.type for trace in fig['data']] == ['scattergl'] * 3
+    assert sum(len(trace.x) for trace in fig['data'][:2]) == 2 * 3 * nb_segments
+    assert len(fig['data'][-1].x) == 2 * 10
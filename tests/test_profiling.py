@@ -0,0 +1,57 @@
+import tracemalloc
+
+import numpy as np
+
+from plotly_helper.profiling import Profile, profile_stage
+
+
+def test_profile():
+    records = []
+    profile = Profile(callback=lambda name, record: records.append((name, record)))
+    for i in range(2):
+        with profile.stage('load') as counters:
+            counters['sections'] = i + 1
+    with profile.stage('other'):
+        pass
+    assert list(profile.stages) == ['load', 'other']
+    assert profile.stages['load']['calls'] == 2
+    assert profile.stages['load']['sections'] == 3
+    assert 'memory_peak' not in profile.stages['load']
+    assert [name for name, _ in records] == ['load', 'load', 'other']
+    assert records[0][1]['sections'] == 1
+
+    total = Profile()
+    total.merge(profile.stages)
+    total.merge(profile.stages)
+    assert total.stages['load']['calls'] == 4
+    assert total.stages['load']['sections'] == 6
+    assert total.stages['load']['time'] == 2 * profile.stages['load']['time']
+
+    lines = total.format().splitlines()
+    assert len(lines) == 4
+    assert lines[2].split()[:2] == ['load', '4']
+    assert lines[2].endswith('sections=6')
+
+
+def test_profile_memory():
+    profile = Profile(trace_memory=True)
+    with profile.stage('outer'):
+        big = np.ones(10 ** 6)
+        del big
+        with profile.stage('inner'):
+            small = np.ones(10 ** 5)
+            del small
+    assert not tracemalloc.is_tracing()
+    assert 8e5 <= profile.stages['inner']['memory_peak'] < 8e6
+    # the peak of the outer stage happened before the inner one started
+    assert profile.stages['outer']['memory_peak'] >= 8e6
+    assert 'peak' in profile.format()
+
+
+def test_profile_stage():
+    with profile_stage(None, 'load') as counters:
+        counters['sections'] = 1
+    profile = Profile()
+    with profile_stage(profile, 'load') as counters:
+        counters['sections'] = 1
+    assert profile.stages['load']['sections'] == 1
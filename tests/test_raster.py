@@ -0,0 +1,99 @@
+import struct
+import zlib
+from unittest.mock import patch
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from plotly_helper.colors import to_rgba
+from plotly_helper.raster import Raster, encode_png, write_png
+
+
+def _decode_png(data):
+    '''Decode the unfiltered 8 bits RGB(A) PNG files written by encode_png'''
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    chunks, position = {}, 8
+    while position < len(data):
+        size, tag = struct.unpack('>I4s', data[position:position + 8])
+        chunks[tag] = data[position + 8:position + 8 + size]
+        position += 12 + size
+    width, height, _, color_type = struct.unpack('>IIBB', chunks[b'IHDR'][:10])
+    channels = {2: 3, 6: 4}[color_type]
+    rows = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype=np.uint8)
+    rows = rows.reshape(height, width * channels + 1)
+    assert (rows[:, 0] == 0).all()
+    assert b'IEND' in chunks
+    return rows[:, 1:].reshape(height, width, channels)
+
+
+def test_encode_png(tmp_path):
+    image = np.random.default_rng(0).integers(0, 256, (5, 7, 3), dtype=np.uint8)
+    npt.assert_array_equal(_decode_png(encode_png(image)), image)
+
+    image = np.zeros((2, 3, 4), dtype=np.uint8)
+    write_png(image, tmp_path / 'image.png')
+    npt.assert_array_equal(_decode_png((tmp_path / 'image.png').read_bytes()), image)
+
+
+def test_to_rgba():
+    assert to_rgba('red') == (1, 0, 0, 1)
+    assert to_rgba(' Black ') == (0, 0, 0, 1)
+    assert to_rgba('#fff') == (1, 1, 1, 1)
+    npt.assert_allclose(to_rgba('#336699'), (0.2, 0.4, 0.6, 1))
+    npt.assert_allclose(to_rgba('rgb(51, 102, 153)'), (0.2, 0.4, 0.6, 1))
+    npt.assert_allclose(to_rgba('rgba(50, 171, 96, 0.7)'), (50 / 255, 171 / 255, 96 / 255, 0.7))
+    for color in ('unknown', 'rgb(1, 2)', '#12', 'rgb(a, b, c)'):
+        with pytest.raises(ValueError):
+            to_rgba(color)
+
+
+def test_draw_lines():
+    raster = Raster(21, 11, ((0, 0), (20, 10)), margin=0)
+    assert raster.scale == 1
+    npt.assert_allclose(raster.to_pixels([[0, 0], [20, 10]]), [[0, 10], [20, 0]])
+
+    # a 1 pixel wide horizontal line between two rows, drawn twice as overlapping segments
+    raster.draw_lines([[2, 4.5], [5, 4.5]], [[10, 4.5], [15, 4.5]], 'black', width=1)
+    image = raster.to_uint8()
+    npt.assert_array_equal(image[5:7, 8], [[128, 128, 128]] * 2)
+    npt.assert_array_equal(image[4, 8], [255, 255, 255])
+    npt.assert_array_equal(image[:, 0], 255)
+    # the round caps do not reach the centers of the next pixels
+    assert (image[5, 2:16] < 255).all()
+    assert (image[5, :2] == 255).all() and (image[5, 16:] == 255).all()
+
+    raster = Raster(21, 11, ((0, 0), (20, 10)), margin=0)
+    raster.draw_lines([[0, 0]], [[20, 10]], 'red', width=3)
+    image = raster.to_uint8()
+    npt.assert_array_equal(image[5, 10], [255, 0, 0])
+    npt.assert_array_equal(image[0, 0], [255, 255, 255])
+
+
+def test_draw_lines_chunks():
+    starts = np.array([[0., 5], [3, 5], [6, 5], [2, 2]])
+    ends = np.array([[10., 5], [13, 5], [16, 5], [18, 9]])
+    raster = Raster(21, 11, ((0, 0), (20, 10)), margin=0)
+    raster.draw_lines(starts, ends, 'rgba(0, 0, 255, 0.5)', width=2)
+    # one segment per chunk: the pixels shared by several chunks are still blended once
+    with patch('plotly_helper.raster.CHUNK_PIXELS', 1):
+        chunked = Raster(21, 11, ((0, 0), (20, 10)), margin=0)
+        chunked.draw_lines(starts, ends, 'rgba(0, 0, 255, 0.5)', width=2)
+    npt.assert_array_equal(chunked.to_uint8(), raster.to_uint8())
+
+
+def test_draw_shapes():
+    raster = Raster(11, 11, ((-5, -5), (5, 5)), background='black', margin=0)
+    raster.draw_shape({'type': 'circle', 'x0': -3, 'y0': -3, 'x1': 3, 'y1': 3,
+                       'fillcolor': 'rgba(255, 255, 255, 0.5)', 'line': {'color': 'red'}})
+    image = raster.to_uint8()
+    npt.assert_array_equal(image[5, 5], [128, 128, 128])
+    npt.assert_array_equal(image[5, 8], [255, 0, 0])
+    npt.assert_array_equal(image[0, 0], [0, 0, 0])
+
+    raster.draw_shape({'type': 'line', 'x0': -5, 'y0': 0, 'x1': 5, 'y1': 0,
+                       'line': {'color': 'blue', 'width': 1}})
+    npt.assert_array_equal(raster.to_uint8()[5, 0], [0, 0, 255])
+
+    with pytest.raises(ValueError):
+        raster.draw_shape({'type': 'rect', 'x0': 0, 'y0': 0, 'x1': 1, 'y1': 1})
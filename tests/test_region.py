@@ -0,0 +1,50 @@
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from plotly_helper.region import Box, Sphere, crop
+
+
+def test_box():
+    box = Box([0, 0, 0], [10, 10, 10])
+    t0, t1 = box.clip([[-5, 5, 5], [1, 1, 1], [1, 1, 1], [-5, -5, 5], [20, 5, 5], [5, 5, 5]],
+                      [[15, 5, 5], [2, 2, 2], [1, 1, 1], [-5, 15, 5], [20, 6, 5], [5, 5, 20]])
+    # the segments parallel to the faces outside of the box are empty
+    npt.assert_array_equal(t0 < t1, [1, 1, 1, 0, 0, 1])
+    npt.assert_allclose(t0[[0, 1, 2, 5]], [0.25, 0, 0, 0])
+    npt.assert_allclose(t1[[0, 1, 2, 5]], [0.75, 1, 1, 1 / 3])
+    npt.assert_array_equal(box.contains([[0, 0, 0], [10, 5, 5], [10.1, 5, 5]]), [1, 1, 0])
+    assert box.key() == ['box', [0, 0, 0], [10, 10, 10]]
+
+    with pytest.raises(ValueError):
+        Box([0, 0, 0], [-1, 1, 1])
+
+
+def test_sphere():
+    sphere = Sphere([0, 0, 0], 1)
+    t0, t1 = sphere.clip([[-2, 0, 0], [0.5, 0, 0], [2, 2, 0], [0, 0, 0], [2, 0, 0]],
+                         [[2, 0, 0], [0, 0.5, 0], [3, 2, 0], [0, 0, 0], [2, 0, 0]])
+    npt.assert_allclose(t0, [0.25, 0, 1, 0, 1])
+    npt.assert_allclose(t1, [0.75, 1, 0, 1, 0])
+    npt.assert_array_equal(sphere.contains([[0, 0, 1], [0, 1, 1]]), [1, 0])
+    npt.assert_array_equal(sphere.bounds(), [[-1, -1, -1], [1, 1, 1]])
+
+    with pytest.raises(ValueError):
+        Sphere([0, 0, 0], -1)
+
+
+def test_crop():
+    box = Box([0, 0, 0], [10, 10, 10])
+    # leaves the box, comes back and leaves it again, with a radius column
+    polyline = np.array([[-5, 5, 5, 0], [5, 5, 5, 1], [15, 5, 5, 2], [15, 6, 5, 3],
+                         [5, 6, 5, 4], [-5, 6, 5, 5]], dtype=float)
+    outside = polyline + [100, 0, 0, 0]
+    polyline_ids, first_segments, pieces = crop([outside, polyline, polyline[1:3]], box)
+    npt.assert_array_equal(polyline_ids, [1, 1, 2])
+    npt.assert_array_equal(first_segments, [0, 3, 0])
+    npt.assert_allclose(pieces[0], [[0, 5, 5, 0.5], [5, 5, 5, 1], [10, 5, 5, 1.5]])
+    npt.assert_allclose(pieces[1], [[10, 6, 5, 3.5], [5, 6, 5, 4], [0, 6, 5, 4.5]])
+    npt.assert_allclose(pieces[2], [[5, 5, 5, 1], [10, 5, 5, 1.5]])
+
+    polyline_ids, first_segments, pieces = crop([outside], box)
+    assert len(polyline_ids) == len(first_segments) == len(pieces) == 0
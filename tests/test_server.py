@@ -0,0 +1,188 @@
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+from click.testing import CliRunner
+from neurom import load_morphology
+
+from unittest.mock import patch
+from plotly_helper.archive import write_archive
+from plotly_helper.cli import cli
+from plotly_helper.server import FigureCache, MorphologyServer
+
+PATH = os.path.dirname(__file__)
+
+
+@contextmanager
+def _serving(inputs, **kwargs):
+    server = MorphologyServer(('127.0.0.1', 0), inputs, **kwargs)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+def _get(url):
+    with urlopen(url) as response:
+        return response.status, response.headers, response.read()
+
+
+def _get_error(url):
+    with pytest.raises(HTTPError) as error:
+        urlopen(url)
+    return error.value.code
+
+
+def test_server(tmp_path):
+    shutil.copy(os.path.join(PATH, 'data', 'neuron.h5'), tmp_path / 'neuron.h5')
+    (tmp_path / 'broken.swc').write_text('not a morphology')
+
+    with _serving(str(tmp_path), typed_arrays='float32') as url:
+        status, _, body = _get(url + '/')
+        assert status == 200
+        assert b'<option>broken.swc</option><option>neuron.h5</option>' in body
+        assert b'<script src="plotly.min.js"></script>' in body
+
+        status, headers, body = _get(url + '/plotly.min.js')
+        assert status == 200
+        assert 'max-age' in headers['Cache-Control']
+        assert len(body) > 1e6
+
+        status, headers, body = _get(url + '/figure/neuron.h5')
+        assert headers['Content-Type'] == 'application/json'
+        fig = json.loads(body)
+        assert len(fig['data']) == 5
+        assert fig['data'][0]['x']['dtype'] == 'f4'
+        assert fig['layout']['title'].startswith('neuron')
+
+        fig = json.loads(_get(url + '/figure/neuron.h5?plane=xy')[2])
+        assert 'z' not in fig['data'][0]
+
+        assert _get_error(url + '/figure/unknown.h5') == 404
+        assert _get_error(url + '/figure/neuron.h5?plane=xyz') == 400
+        assert _get_error(url + '/figure/broken.swc') == 500
+        assert _get_error(url + '/unknown') == 404
+
+
+def test_server_archive(tmp_path):
+    neuron = load_morphology(os.path.join(PATH, 'data', 'neuron.h5'))
+    write_archive([('a.h5', neuron), ('b.h5', neuron)], str(tmp_path))
+    with _serving(str(tmp_path)) as url:
+        assert b'<option>a.h5</option><option>b.h5</option>' in _get(url + '/')[2]
+        fig = json.loads(_get(url + '/figure/b.h5?plane=xy')[2])
+        assert fig['layout']['title'].startswith('b')
+        assert _get_error(url + '/figure/c.h5') == 404
+
+
+def test_server_figure_cache():
+    server = MorphologyServer(('127.0.0.1', 0), os.path.join(PATH, 'data', 'neuron.h5'))
+    try:
+        assert list(server.morphologies) == ['neuron.h5']
+        body = server.figure_json('neuron.h5', 'xy')
+        assert server.figure_json('neuron.h5', 'xy') is body
+        assert len(server.figures) == 1
+        with pytest.raises(KeyError):
+            server.figure_json('unknown.h5', 'xy')
+        with pytest.raises(ValueError):
+            server.figure_json('neuron.h5', 'xyz')
+    finally:
+        server.server_close()
+
+    with pytest.raises(ValueError):
+        MorphologyServer(('127.0.0.1', 0), PATH, plane='xyz')
+
+
+def test_figure_cache():
+    cache = FigureCache(max_size=10)
+    built = []
+
+    def build(value):
+        def _build():
+            built.append(value)
+            return value
+        return _build
+
+    assert cache.get('a', build(b'aaaa')) == b'aaaa'
+    assert cache.get('a', build(b'other')) == b'aaaa'
+    cache.get('b', build(b'bbbb'))
+    cache.get('a', build(b'other'))
+    # 'b' is the least recently used one
+    cache.get('c', build(b'cccc'))
+    assert built == [b'aaaa', b'bbbb', b'cccc']
+    assert cache.size == 8
+    assert cache.get('b', build(b'BBBB')) == b'BBBB'
+    assert built[-1] == b'BBBB'
+
+    # the most recent value is kept even if it is too large
+    cache.get('d', build(b'd' * 20))
+    assert len(cache) == 1 and cache.size == 20
+
+    with pytest.raises(RuntimeError):
+        cache.get('e', lambda: (_ for _ in ()).throw(RuntimeError('failed')))
+    assert cache.get('e', build(b'e')) == b'e'
+
+
+def test_figure_cache_concurrent():
+    cache = FigureCache()
+    started = threading.Event()
+    calls = []
+
+    def build():
+        calls.append(1)
+        started.wait(5)
+        return b'value'
+
+    threads = [threading.Thread(target=cache.get, args=('key', build)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+
+
+@patch('plotly_helper.server.MorphologyServer.serve_forever', side_effect=KeyboardInterrupt)
+def test_cli_serve(_):
+    runner = CliRunner()
+    result = runner.invoke(cli, ['serve', os.path.join(PATH, 'data', '*.h5'), '--port', '0'])
+    assert result.exit_code == 0
+    assert result.output.startswith('Serving 1 morphologies on http://127.0.0.1:')
+
+
+def test_figure_cache_no_rebuild_after_build():
+    cache = FigureCache()
+    lock = cache._lock
+    builder = threading.current_thread()
+    calls, requests = [], []
+
+    class _Lock:
+        '''Send a concurrent request each time the builder takes the cache lock after build()'''
+        def __enter__(self):
+            if calls and threading.current_thread() is builder:
+                request = threading.Thread(target=cache.get, args=('key', build))
+                requests.append(request)
+                request.start()
+                request.join(0.2)
+            return lock.__enter__()
+
+        def __exit__(self, *args):
+            return lock.__exit__(*args)
+
+    def build():
+        calls.append(1)
+        return b'value'
+
+    cache._lock = _Lock()
+    assert cache.get('key', build) == b'value'
+    for request in requests:
+        request.join()
+    assert calls == [1]